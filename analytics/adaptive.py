@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+adaptive sweeps of investment_scenario over pass / fail hurdles:
+    a coarse grid over the ranges of some scenario keys
+    cells whose corners do not all pass, or all fail, split in 2 along every key, level by level
+    stops at the maximum depth or the evaluation budget
+    boundary cells, and boundary points interpolated along the cell edges
+
+points are kept on an integer lattice at the finest resolution, so a corner shared by
+cells, or by levels, is projected once; each level is one parallel.sweep
+
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.parallel as parallel
+
+
+def _margins(outputs, hurdles):
+    """
+    lowest relative margin over the hurdles, 0 or more when a point passes them all, NaN never passes
+    """
+    margins = []
+    for j, minimum in enumerate(hurdles.values()):
+        margins.append((outputs[:, j] - minimum) / (abs(minimum) or 1.0))
+    margins = np.min(margins, 0)
+    return np.where(np.isnan(margins), -np.inf, margins)
+
+
+class _Lattice(object):
+    """
+    projected points, by integer coordinates
+    """
+
+    def __init__(self, deal, scenario, keys, low, high, units, metrics, processes):
+        self.deal, self.scenario, self.keys = deal, scenario, keys
+        self.low, self.high, self.units = low, high, units
+        self.metrics = metrics
+        self.processes = processes
+        self.index = {}
+        self.coordinates = []
+        self.outputs = []
+
+    def values(self, coordinates):
+        return self.low + (self.high - self.low) * np.asarray(coordinates, dtype=float) / self.units
+
+    def missing(self, coordinates):
+        return {c for c in coordinates if c not in self.index}
+
+    def evaluate(self, coordinates):
+        new = sorted(self.missing(coordinates))
+        if not new:
+            return
+        parameters = pd.DataFrame(self.values(new), columns=self.keys)
+        result = parallel.sweep(self.deal, self.scenario, parameters, self.metrics, self.processes)
+        failed = result['Error'].notna().values
+        if failed.any():
+            raise ValueError('{0:d} of {1:d} points failed to project, first at {2}: {3}'.format(
+                int(failed.sum()), len(new), dict(zip(self.keys, parameters.values[failed][0].tolist())),
+                result['Error'].values[failed][0]))
+        outputs = result[[parallel.metric_name(m) for m in self.metrics]].values
+        for c, row in zip(new, outputs):
+            self.index[c] = len(self.coordinates)
+            self.coordinates.append(c)
+            self.outputs.append(row)
+
+    def __len__(self):
+        return len(self.coordinates)
+
+
+def _corners(cell, size, dimensions):
+    return [tuple(c + size * o for c, o in zip(cell, offset)) for offset in itertools.product((0, 1), repeat=dimensions)]
+
+
+def _children(cell, size, dimensions):
+    half = size // 2
+    return [tuple(c + half * o for c, o in zip(cell, offset)) for offset in itertools.product((0, 1), repeat=dimensions)]
+
+
+def adaptive_sweep(deal, scenario, ranges, hurdles, coarse=5, max_depth=4, budget=None, metrics=(), processes=None):
+    """
+    map where a scenario passes its hurdles, refining only the cells where pass / fail changes;
+    raises ValueError when the projection of a point raises, a crash is not a failed hurdle
+
+    :param deal: dict
+    :param scenario: base scenario, dict
+    :param ranges: dict, scenario key -> (low, high)
+    :param hurdles: dict, metric -> minimum, a point passes when every metric reaches its minimum,
+                    e.g. {'IRR Before Tax': 0.1, 'Minimum Debt Coverage Ratio': 1.25}, see parallel.metric_value
+    :param coarse: points per key of the coarse grid, int or dict key -> int
+    :param max_depth: times a cell can be split, the finest spacing is the coarse one / 2 ** max_depth
+    :param budget: [optional] maximum number of projections, the coarse grid included
+    :param metrics: [optional] other metrics of the points
+    :param processes: [optional] worker processes of parallel.sweep
+    :return: dict: 'points', pandas.DataFrame of the projected points, their metrics and 'Pass';
+             'cells', pandas.DataFrame of the boundary cells, key + ' Low', key + ' High' and 'Depth';
+             'boundary', pandas.DataFrame of boundary points, interpolated on the edges of the boundary cells;
+             'evaluations', number of projections; 'dense evaluations', those of the full grid at the finest spacing
+    """
+    keys = list(ranges)
+    if not keys or not hurdles:
+        raise ValueError('Adaptive sweep needs ranges and hurdles')
+    dimensions = len(keys)
+    counts = [int(coarse[k] if isinstance(coarse, dict) else coarse) for k in keys]
+    if min(counts) < 2:
+        raise ValueError('Coarse grid needs at least 2 points per key')
+    step = 2 ** int(max_depth)
+    metrics = list(hurdles) + [m for m in metrics if m not in hurdles]
+    lattice = _Lattice(deal, scenario, keys, np.array([ranges[k][0] for k in keys], dtype=float),
+                       np.array([ranges[k][1] for k in keys], dtype=float),
+                       np.array([(n - 1) * step for n in counts], dtype=float), metrics, processes)
+
+    def margin(coordinates):
+        outputs = np.array([lattice.outputs[lattice.index[c]] for c in coordinates])
+        return _margins(outputs, hurdles)
+
+    def mixed(cell, size):
+        passes = margin(_corners(cell, size, dimensions)) >= 0
+        return passes.any() and not passes.all()
+
+    coarse_points = list(itertools.product(*(range(0, (n - 1) * step + 1, step) for n in counts)))
+    if budget is not None and len(coarse_points) > budget:
+        raise ValueError('Budget of {0:d} below the {1:d} points of the coarse grid'.format(budget, len(coarse_points)))
+    lattice.evaluate(coarse_points)
+    cells = [c for c in itertools.product(*(range(0, (n - 1) * step, step) for n in counts)) if mixed(c, step)]
+    size = step
+    final = []
+    while cells and size > 1:
+        # refine the boundary cells in order, as long as their new corners fit in the budget
+        refined, needed = [], set()
+        for cell in cells:
+            new = lattice.missing(c for child in _children(cell, size, dimensions)
+                                  for c in _corners(child, size // 2, dimensions))
+            if budget is not None and len(lattice) + len(needed | new) > budget:
+                break
+            refined.append(cell)
+            needed |= new
+        final += [(cell, size) for cell in cells[len(refined):]]
+        if not refined:
+            cells = []
+            break
+        lattice.evaluate(needed)
+        size //= 2
+        cells = [child for cell in refined for child in _children(cell, size * 2, dimensions) if mixed(child, size)]
+    final += [(cell, size) for cell in cells]
+
+    # projected points
+    outputs = np.array(lattice.outputs)
+    points = pd.DataFrame(lattice.values(lattice.coordinates), columns=keys)
+    for j, metric in enumerate(metrics):
+        points[parallel.metric_name(metric)] = outputs[:, j]
+    points['Pass'] = _margins(outputs, hurdles) >= 0
+
+    # boundary cells, and the crossing of every edge whose ends differ, linear in the margin
+    rows, crossings = [], {}
+    for cell, size in final:
+        corners = _corners(cell, size, dimensions)
+        low, high = lattice.values(corners[0]), lattice.values(corners[-1])
+        row = {}
+        for k, key in enumerate(keys):
+            row[key + ' Low'] = low[k]
+            row[key + ' High'] = high[k]
+        row['Depth'] = int(np.log2(step // size))
+        rows.append(row)
+        m = dict(zip(corners, margin(corners)))
+        for a, b in itertools.combinations(corners, 2):
+            if sum(x != y for x, y in zip(a, b)) != 1 or (m[a] >= 0) == (m[b] >= 0) or (a, b) in crossings:
+                continue
+            if np.isfinite(m[a]) and np.isfinite(m[b]):
+                t = m[a] / (m[a] - m[b])
+            else:
+                t = 0.5
+            crossings[(a, b)] = lattice.values(a) + t * (lattice.values(b) - lattice.values(a))
+    cell_columns = [key + side for key in keys for side in (' Low', ' High')] + ['Depth']
+    boundary = pd.DataFrame(list(crossings.values()), columns=keys) if crossings else pd.DataFrame(columns=keys)
+    return {'points': points,
+            'cells': pd.DataFrame(rows, columns=cell_columns),
+            'boundary': boundary.drop_duplicates().sort_values(keys).reset_index(drop=True),
+            'evaluations': len(lattice),
+            'dense evaluations': int(np.prod([(n - 1) * step + 1 for n in counts]))}
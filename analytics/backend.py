@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+compute backends of the numeric kernels:
+    'amortize'  amortization periods in integer cents, per period rates, payments and prepayments
+    'irr'       Newton iterations of the internal rate of return, one cash flow vector per row
+
+backends:
+    'numpy'     reference, vectorized across loans and rows, periods and iterations in sequence
+    'numba'     compiled loops, when numba is installed; the schedules are the same to the cent,
+                the rates within the Newton tolerance
+
+the backend is chosen with set_backend, or the REALMLY_BACKEND environment variable at import,
+default 'numpy'; verify_backend checks a backend against the reference
+
+"""
+
+import os
+import time
+import warnings
+
+import numpy as np
+
+import Realmly.analytics.money as money
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _numpy_amortize(balance, rates, payments, prepayments, mode):
+    """
+    reference amortization kernel
+    :param balance: int64 array (loans,)
+    :param rates: float64 array (loans, payments)
+    :param payments: int64 array (loans, payments)
+    :param prepayments: int64 array (loans, payments)
+    :param mode: rounding mode, see money.ROUNDING_MODES
+    :return: int64 arrays (loans, payments): interests, principal payments, balances
+    """
+    balance = balance.copy()
+    interests = np.zeros(rates.shape, dtype=np.int64)
+    principal_payments = np.zeros(rates.shape, dtype=np.int64)
+    balances = np.zeros(rates.shape, dtype=np.int64)
+    for k in range(rates.shape[1]):
+        interest = money.round_to_int(balance * rates[:, k], mode)
+        principal = np.minimum(balance, payments[:, k] - interest + prepayments[:, k])
+        balance = balance - principal
+        interests[:, k] = interest
+        principal_payments[:, k] = principal
+        balances[:, k] = balance
+    return interests, principal_payments, balances
+
+
+def _numpy_irr(flows, rates, tolerance, max_iterations):
+    """
+    reference Newton kernel
+    :param flows: float64 array (rows, periods)
+    :param rates: float64 array (rows,), the guesses, updated in place
+    :return: boolean array (rows,), True where the iterations did not converge
+    """
+    t = np.arange(flows.shape[1])
+    active = np.arange(flows.shape[0])
+    with np.errstate(all='ignore'):
+        for _ in range(max_iterations):
+            if active.size == 0:
+                break
+            r = rates[active]
+            discount = np.exp(-np.outer(np.log1p(r), t))
+            npv = np.sum(flows[active] * discount, 1)
+            slope = -np.sum(flows[active] * t * discount, 1) / (1 + r)
+            step = npv / slope
+            rates[active] = r - step
+            active = active[~(np.abs(step) <= tolerance * (1 + np.abs(r)))]
+    unconverged = np.zeros(flows.shape[0], dtype=bool)
+    unconverged[active] = True
+    return unconverged
+
+
+_KERNELS = {'numpy': {'amortize': _numpy_amortize, 'irr': _numpy_irr}}
+
+
+# loops of the 'numba' backend, plain python here and compiled below when numba is installed,
+# the plain functions stay reachable as .py_func of the compiled ones
+
+def _round(x, code):
+    # rounding modes in the order of money.ROUNDING_MODES
+    if code == 0:
+        r = np.floor(x)
+        d = x - r
+        if d > 0.5 or (d == 0.5 and r % 2 != 0):
+            r += 1
+        return r
+    if code == 1 or code == 2:
+        m = abs(x)
+        w = np.floor(m)
+        f = m - w
+        if f > 0.5 or (f == 0.5 and code == 1):
+            w += 1
+        return w if x >= 0 else -w
+    if code == 3:
+        return np.floor(x)
+    if code == 4:
+        return np.ceil(x)
+    return np.trunc(x)
+
+
+def _amortize_loop(balance, rates, payments, prepayments, code):
+    loans, n = rates.shape
+    interests = np.zeros((loans, n), dtype=np.int64)
+    principal_payments = np.zeros((loans, n), dtype=np.int64)
+    balances = np.zeros((loans, n), dtype=np.int64)
+    for i in range(loans):
+        b = balance[i]
+        for k in range(n):
+            interest = np.int64(_round(b * rates[i, k], code))
+            principal = min(b, payments[i, k] - interest + prepayments[i, k])
+            b -= principal
+            interests[i, k] = interest
+            principal_payments[i, k] = principal
+            balances[i, k] = b
+    return interests, principal_payments, balances
+
+
+def _irr_loop(flows, rates, tolerance, max_iterations):
+    rows, periods = flows.shape
+    unconverged = np.ones(rows, dtype=np.bool_)
+    for i in range(rows):
+        r = rates[i]
+        for _ in range(max_iterations):
+            log_growth = np.log1p(r)
+            npv = 0.0
+            slope = 0.0
+            for j in range(periods):
+                discount = np.exp(-log_growth * j)
+                npv += flows[i, j] * discount
+                slope -= flows[i, j] * j * discount
+            step = npv / (slope / (1 + r))
+            previous = r
+            r = r - step
+            if abs(step) <= tolerance * (1 + abs(previous)):
+                unconverged[i] = False
+                break
+            if not np.isfinite(r):
+                break
+        rates[i] = r
+    return unconverged
+
+
+def _numba_amortize(balance, rates, payments, prepayments, mode):
+    if mode not in money.ROUNDING_MODES:
+        raise ValueError('Unknown rounding mode {0}, expected one of {1}'.format(mode, money.ROUNDING_MODES))
+    return _amortize_loop(np.ascontiguousarray(balance, dtype=np.int64),
+                          np.ascontiguousarray(rates, dtype=np.float64),
+                          np.ascontiguousarray(payments, dtype=np.int64),
+                          np.ascontiguousarray(prepayments, dtype=np.int64),
+                          money.ROUNDING_MODES.index(mode))
+
+
+def _numba_irr(flows, rates, tolerance, max_iterations):
+    with np.errstate(all='ignore'):
+        return _irr_loop(np.ascontiguousarray(flows, dtype=np.float64), rates, float(tolerance),
+                         int(max_iterations))
+
+
+if numba is not None:
+    _jit = numba.njit(cache=True, error_model='numpy')
+    _round = _jit(_round)
+    _amortize_loop = _jit(_amortize_loop)
+    _irr_loop = _jit(_irr_loop)
+    _KERNELS['numba'] = {'amortize': _numba_amortize, 'irr': _numba_irr}
+
+
+BACKENDS = tuple(_KERNELS)
+_current = {'name': 'numpy'}
+
+
+def set_backend(name):
+    """
+    use a backend for the kernels, 'numpy' or 'numba'
+    """
+    if name not in _KERNELS:
+        raise ValueError('Backend {0} not available, expected one of {1}'.format(name, BACKENDS))
+    _current['name'] = name
+
+
+def get_backend():
+    """
+    name of the backend in use
+    """
+    return _current['name']
+
+
+def kernel(name):
+    """
+    a kernel of the backend in use, 'amortize' or 'irr'
+    """
+    return _KERNELS[_current['name']][name]
+
+
+def _random_schedules(loans, n, seed):
+    rng = np.random.default_rng(seed)
+    balance = rng.integers(5000000, 200000000, loans).astype(np.int64)
+    # adjustable rates, reset every 12 periods
+    rates = np.repeat(rng.uniform(0, 0.09, (loans, -(-n // 12))), 12, axis=1)[:, :n] / 12
+    payments = money.level_payment(balance, rates[:, 0], n)[:, np.newaxis] * np.ones(n, dtype=np.int64)
+    prepayments = np.where(rng.random((loans, n)) < 0.05, rng.integers(0, 2000000, (loans, n)), 0)
+    return balance, rates, payments, prepayments.astype(np.int64)
+
+
+def verify_backend(name=None, loans=2000, payments=360, rows=20000, seed=0):
+    """
+    check a backend against the numpy reference on random adjustable rate schedules with
+    prepayments, in every rounding mode, and on random cash flow vectors
+
+    :param name: [optional] backend, default the one in use
+    :return: dict: 'Backend'; 'Schedule Mismatches', number of cents that differ, 0 for a backend
+             in parity; 'IRR Max Difference' of the rates converged by both; 'Amortize Speedup'
+             and 'IRR Speedup' over the reference, after a warm up call
+    """
+    name = name or get_backend()
+    if name not in _KERNELS:
+        raise ValueError('Backend {0} not available, expected one of {1}'.format(name, BACKENDS))
+    reference, candidate = _KERNELS['numpy'], _KERNELS[name]
+    result = {'Backend': name, 'Schedule Mismatches': 0}
+    balance, rates, pay, prepay = _random_schedules(loans, payments, seed)
+    for mode in money.ROUNDING_MODES:
+        expected = reference['amortize'](balance, rates, pay, prepay, mode)
+        actual = candidate['amortize'](balance, rates, pay, prepay, mode)
+        result['Schedule Mismatches'] += int(sum(np.sum(e != a) for e, a in zip(expected, actual)))
+
+    rng = np.random.default_rng(seed)
+    flows = np.hstack((-rng.uniform(5e4, 2e5, (rows, 1)), rng.normal(5e3, 4e3, (rows, 9)),
+                       rng.uniform(5e4, 4e5, (rows, 1))))
+    expected_rates = np.full(rows, 0.1)
+    expected_failed = reference['irr'](flows, expected_rates, 1e-12, 100)
+    actual_rates = np.full(rows, 0.1)
+    actual_failed = candidate['irr'](flows, actual_rates, 1e-12, 100)
+    both = ~expected_failed & ~actual_failed
+    difference = np.abs(expected_rates[both] - actual_rates[both])
+    result['IRR Max Difference'] = float(np.max(difference)) if both.any() else 0.0
+    result['IRR Unconverged Mismatches'] = int(np.sum(expected_failed != actual_failed))
+
+    for key, args in (('amortize', (balance, rates, pay, prepay, money.DEFAULT_ROUNDING)),
+                      ('irr', (flows, np.full(rows, 0.1), 1e-12, 100))):
+        timings = []
+        for kernels in (reference, candidate):
+            kernels[key](*args[:1] + (args[1].copy(),) + args[2:])
+            start = time.perf_counter()
+            kernels[key](*args[:1] + (args[1].copy(),) + args[2:])
+            timings.append(time.perf_counter() - start)
+        result[('Amortize' if key == 'amortize' else 'IRR') + ' Speedup'] = timings[0] / max(timings[1], 1e-9)
+    return result
+
+
+if os.environ.get('REALMLY_BACKEND'):
+    if os.environ['REALMLY_BACKEND'] in _KERNELS:
+        set_backend(os.environ['REALMLY_BACKEND'])
+    else:
+        warnings.warn('REALMLY_BACKEND {0} not available, using numpy'.format(os.environ['REALMLY_BACKEND']))
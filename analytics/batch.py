@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+batch projections over many deal workbooks:
+    worker pool, progress display
+    checkpoint journal for resuming interrupted runs
+
+usage:
+    python -m Realmly.analytics.batch [workbooks or directories] -o output -j 8
+
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import Realmly.analytics.financials as fin
+import Realmly.util.utilities as util
+
+JOURNAL_NAME = 'realmly_batch_journal.jsonl'
+SUMMARY_KEYS = ('IRR Before Tax', 'IRR After Tax',
+                'Total Return Before Tax', 'Total Return After Tax',
+                'Net Sales After Tax', 'Number Of Years')
+
+
+def find_workbooks(paths, pattern='*.xlsx'):
+    """
+    expand files and directories into a sorted list of workbooks
+    :param paths: list of workbook files and/or directories
+    :param pattern: file pattern used inside directories
+    :return: list of absolute file paths, without duplicates
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '**', pattern), recursive=True)
+            # skip excel lock files and our own projection outputs
+            files += [f for f in matches if not os.path.basename(f).startswith(('~$', 'PROJECTION_'))]
+        else:
+            files.append(path)
+    return sorted(set(os.path.abspath(f) for f in files))
+
+
+def read_journal(journal):
+    """
+    read the checkpoint journal
+    :param journal: path of the journal file
+    :return: dict, file -> last journal record of that file
+    """
+    records = {}
+    if not os.path.exists(journal):
+        return records
+    with open(journal) as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a record cut short by a crash, the file gets projected again
+                continue
+            records[record['file']] = record
+    return records
+
+
+def append_journal(fh, record):
+    fh.write(json.dumps(record) + '\n')
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+def summarize_journal(journal):
+    """
+    one row per projected scenario, from the checkpoint journal
+    :param journal: path of the journal file, or dict of records from read_journal
+    :return: pandas.DataFrame
+    """
+    if not isinstance(journal, dict):
+        journal = read_journal(journal)
+    rows = []
+    for record in journal.values():
+        if record['status'] != 'ok':
+            rows.append({'File': record['file'], 'Status': record['status'], 'Error': record.get('error')})
+            continue
+        for scenario in record['scenarios']:
+            row = {'File': record['file'], 'Status': record['status'], 'Error': None}
+            row.update(scenario)
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def project_file(file, output_location=None, print_flag=True, verbose=False):
+    """
+    project all scenarios of one workbook, never raises
+    :param file: deal workbook
+    :param output_location: folder for the projection workbooks, None for the folder of the deal workbook
+    :param print_flag: write the projection workbooks
+    :param verbose: let the projection print to stdout
+    :return: journal record, dict
+    """
+    start = time.time()
+    record = {'file': file}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(sys.stdout if verbose else log):
+            deal, scenarios, projections = fin.project(file, print_flag, output_location)
+        summary = []
+        for scenario, projection in zip(scenarios, projections):
+            row = {'Scenario Name': scenario['Scenario Name']}
+            row.update({k: json_value(projection['disposal'][k]) for k in SUMMARY_KEYS})
+            summary.append(row)
+        record.update({'status': 'ok', 'scenarios': summary})
+    except Exception as err:
+        record.update({'status': 'failed',
+                       'error': '{0:s}: {1}'.format(type(err).__name__, err),
+                       'traceback': traceback.format_exc()})
+    record['elapsed'] = round(time.time() - start, 3)
+    return record
+
+
+def json_value(val):
+    """
+    python value of a numpy scalar, for JSON records
+    """
+    try:
+        return val.item()
+    except AttributeError:
+        return val
+
+
+def _progress(done, total, ok, failed, start):
+    elapsed = time.time() - start
+    eta = elapsed / done * (total - done) if done else 0
+    sys.stderr.write('\r[{0:{w}d}/{1:d}] {2:5.1f}%  ok {3:d}  failed {4:d}  elapsed {5:s}  eta {6:s} '.format(
+        done, total, 100.0 * done / max(total, 1), ok, failed,
+        time.strftime('%H:%M:%S', time.gmtime(elapsed)), time.strftime('%H:%M:%S', time.gmtime(eta)),
+        w=len(str(total))))
+    sys.stderr.flush()
+
+
+def run(files, output_location=None, journal=None, processes=None, print_flag=True,
+        resume=True, retry_failed=False, progress=True, verbose=False):
+    """
+    project a list of workbooks on a process pool, checkpointing each finished file
+
+    :param files: list of deal workbooks
+    :param output_location: folder for the projection workbooks, None for the folder of each deal workbook
+    :param journal: checkpoint journal, default realmly_batch_journal.jsonl in output_location
+    :param processes: number of worker processes, default os.cpu_count(); 1 runs in this process
+    :param print_flag: write the projection workbooks
+    :param resume: skip files already recorded in the journal
+    :param retry_failed: when resuming, project the files which failed last time again
+    :param progress: show a progress line on stderr
+    :param verbose: let the projections print to stdout
+    :return: dict, file -> journal record, covering all files of this and previous runs
+    """
+    if journal is None:
+        journal = os.path.join(output_location or util.get_output_directory(), JOURNAL_NAME)
+    journal_dir = os.path.dirname(os.path.abspath(journal))
+    os.makedirs(journal_dir, exist_ok=True)
+    if output_location:
+        os.makedirs(output_location, exist_ok=True)
+
+    records = read_journal(journal) if resume else {}
+    done_status = ('ok',) if retry_failed else ('ok', 'failed')
+    todo = [f for f in files if records.get(f, {}).get('status') not in done_status]
+    skipped = len(files) - len(todo)
+    if skipped and progress:
+        sys.stderr.write('Resuming: {0:d} of {1:d} files already in {2:s}\n'.format(skipped, len(files), journal))
+
+    total = len(todo)
+    ok = failed = 0
+    start = time.time()
+    with open(journal, 'a' if resume else 'w') as fh:
+        if processes == 1:
+            pending = (project_file(f, output_location, print_flag, verbose) for f in todo)
+        else:
+            pool = ProcessPoolExecutor(max_workers=processes)
+            futures = [pool.submit(project_file, f, output_location, print_flag, verbose) for f in todo]
+            pending = (future.result() for future in as_completed(futures))
+        try:
+            for i, record in enumerate(pending):
+                append_journal(fh, record)
+                records[record['file']] = record
+                if record['status'] == 'ok':
+                    ok += 1
+                else:
+                    failed += 1
+                if progress:
+                    _progress(i + 1, total, ok, failed, start)
+        finally:
+            if processes != 1:
+                pool.shutdown(wait=False, cancel_futures=True)
+    if progress:
+        sys.stderr.write('\nProjected {0:d} files, {1:d} failed, journal {2:s}\n'.format(ok + failed, failed, journal))
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Realmly.analytics.batch',
+                                     description='Project deal workbooks in batch.')
+    parser.add_argument('paths', nargs='+', help='deal workbooks, or directories searched for workbooks')
+    parser.add_argument('-o', '--output', default=None,
+                        help='folder for projection workbooks, default next to each deal workbook')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker processes, default all cores')
+    parser.add_argument('--journal', default=None,
+                        help='checkpoint journal, default {0:s} in the output folder'.format(JOURNAL_NAME))
+    parser.add_argument('--pattern', default='*.xlsx', help='workbook pattern inside directories')
+    parser.add_argument('--restart', action='store_true', help='ignore the journal and project all files again')
+    parser.add_argument('--retry-failed', action='store_true', help='project files which failed before again')
+    parser.add_argument('--no-excel', action='store_true', help='do not write projection workbooks')
+    parser.add_argument('--summary', default=None, help='write one row per scenario to this csv file')
+    parser.add_argument('-q', '--quiet', action='store_true', help='no progress display')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show projection output')
+    args = parser.parse_args(argv)
+
+    files = find_workbooks(args.paths, args.pattern)
+    if not files:
+        parser.error('no workbooks found')
+    records = run(files, args.output, args.journal, args.processes, not args.no_excel,
+                  resume=not args.restart, retry_failed=args.retry_failed,
+                  progress=not args.quiet, verbose=args.verbose)
+    if args.summary:
+        summarize_journal({f: records[f] for f in files if f in records}).to_csv(args.summary, index=False)
+    return 1 if any(records[f]['status'] != 'ok' for f in files if f in records) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
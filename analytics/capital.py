@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+capital structure optimizer:
+    candidate loans over a grid of LTV ('Loan'), interest only period and amortization period
+    loan schedules of all the LTVs of a term and IO period at once, in cents, as annual_loan
+    cash flows, IRRs, equity multiples, DSCR and LTV of every candidate as arrays
+    best candidate for an objective under a minimum DSCR and a maximum LTV
+
+the operating lines, asset values and depreciation do not depend on the loan: they come
+from one projection graph of the scenario, the taxes follow the loan of each candidate
+with the tax engine, so the metrics of a candidate are those investment_scenario returns
+for the scenario with its loan keys
+
+"""
+
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.money as money
+import Realmly.analytics.tax as tax
+
+OBJECTIVES = ('IRR After Tax', 'IRR Before Tax', 'Equity Multiple After Tax', 'Equity Multiple Before Tax')
+STRUCTURE_KEYS = ('Loan', 'IO Period', 'Amortization Period')
+
+
+def candidates(ltvs, io_periods=(0,), amortization_periods=(30,)):
+    """
+    grid of loan structures, interest only periods shorter than the amortization period
+    :param ltvs: list of 'Loan' values, loan to purchase price
+    :param io_periods: list of interest only periods in years, 0 for none
+    :param amortization_periods: list of loan terms in years
+    :return: pandas.DataFrame, columns STRUCTURE_KEYS
+    """
+    rows = [(ltv, io, term) for term in amortization_periods for io in io_periods for ltv in ltvs if io < term]
+    return pd.DataFrame(rows, columns=list(STRUCTURE_KEYS))
+
+
+def annual_loans(loan_amounts, rate, amortizing_years, payments_per_year=12, io_years=0):
+    """
+    annual_loan of many loan amounts with the same rate, term and interest only period
+    :param loan_amounts: array of loan amounts
+    :return: arrays (loans, amortizing_years): payments, interests, principal payments and year end balances
+    """
+    number_of_payments = amortizing_years * payments_per_year
+    io = int(io_years * payments_per_year)
+    loan_cents = money.to_cents(np.asarray(loan_amounts, dtype=float))
+    schedule = money.amortize_cents(loan_cents, rate / payments_per_year, number_of_payments - io)
+    if io:
+        io_interests = money.round_to_int(loan_cents * rate / payments_per_year)[:, np.newaxis] * \
+            np.ones(io, dtype=np.int64)
+        io_schedule = (io_interests, io_interests, np.zeros(io_interests.shape, dtype=np.int64),
+                       loan_cents[:, np.newaxis] * np.ones(io, dtype=np.int64))
+        schedule = [np.hstack((a, b)) for a, b in zip(io_schedule, schedule)]
+    shape = (len(loan_cents), amortizing_years, payments_per_year)
+    payments, interests, principal_payments, balances = (x.reshape(shape) for x in schedule)
+    return (money.div_round(payments.sum(2), 100).astype(float),
+            money.div_round(interests.sum(2), 100).astype(float),
+            money.div_round(principal_payments.sum(2), 100).astype(float),
+            money.div_round(balances[:, :, -1], 100).astype(float))
+
+
+def _loan_lines(scenario, table, years, refinances, asset_values):
+    """
+    annual loan lines of the candidates, (candidates, years), as the loan node of projection_graph
+    """
+    rows = len(table)
+    lines = {key: np.zeros((rows, years)) for key in ('Debt Service', 'Interests', 'Principal Repayments',
+                                                      'Total Debt', 'Refinance Proceeds')}
+    rate = scenario['Rate']
+    payments_per_year = int(scenario['Payments Per Year'])
+    loan_amounts = table['Loan'].values * scenario['Purchase Price']
+    for (io_years, term), group in table.groupby(['IO Period', 'Amortization Period']):
+        index = group.index.values
+        term = int(term)
+        if refinances:
+            # the refinance loans depend on the balances, one schedule per candidate
+            for i in index:
+                schedule = fin.loan_schedule(loan_amounts[i], rate, term, payments_per_year, io_years, years,
+                                             refinances, asset_values)
+                for key in lines:
+                    lines[key][i] = schedule[key][:years]
+            continue
+        schedule = annual_loans(loan_amounts[index], rate, term, payments_per_year, io_years)
+        n = min(years, term)
+        for key, values in zip(('Debt Service', 'Interests', 'Principal Repayments', 'Total Debt'), schedule):
+            lines[key][index, :n] = values[:, :n]
+    return lines
+
+
+def evaluate(deal, scenario, table):
+    """
+    metrics of candidate loan structures, all at once
+
+    :param deal: dict
+    :param scenario: dict, its loan keys are replaced by those of the candidates
+    :param table: pandas.DataFrame of candidates, see candidates
+    :return: pandas.DataFrame, the candidates and their 'IRR After Tax', 'IRR Before Tax',
+             'Equity Multiple After Tax', 'Equity Multiple Before Tax', 'Minimum Debt Coverage Ratio'
+             and 'Maximum Loan To Value Ratio'; and the unrounded 'Exact IRR After Tax' and 'Exact IRR Before Tax'
+    """
+    table = pd.DataFrame(table).reset_index(drop=True)
+    g = fin.projection_graph(deal, scenario)
+    years = g.get('years')
+    lines = g.get('operating lines')
+    depreciation = g.get('depreciation')
+    asset_values = g.get('asset values')
+    statement = g.get('income statement')
+    total_assets = g.get('balance sheet')['Total Assets'].values
+    loan = _loan_lines(scenario, table, years, g.get('refinances'), asset_values)
+
+    # cash flows, as the cash flows node
+    operating_incomes = lines['Operating Incomes']
+    taxes, suspended_losses = tax.income_taxes(operating_incomes - loan['Interests'] - depreciation['Depreciations'],
+                                               scenario['Income Tax'],
+                                               fin.scenario_value(scenario.get('Loss Carryforward')))
+    before_tax = np.round(operating_incomes - loan['Debt Service'] + loan['Refinance Proceeds'], 2)
+    after_tax = np.round(operating_incomes - loan['Debt Service'] + loan['Refinance Proceeds'] - taxes, 2)
+
+    # sale at the end of the projection, as disposal_table
+    initial_loan = table['Loan'].values * scenario['Purchase Price']
+    initial_equity = scenario['Purchase Price'] + scenario['Purchase Costs'] - initial_loan
+    net_sales = asset_values[years] * (1 - scenario['Selling Commissions'])
+    sale = net_sales - loan['Total Debt'][:, years - 1]
+    tax_upon_sales = tax.sale_taxes(net_sales, depreciation['Tax Basis'][years - 1], total_assets[0],
+                                    depreciation['Cumulative Depreciations'][years - 1], scenario['Capital Gain Tax'],
+                                    scenario['Income Tax'], scenario['Depreciation Recapture Tax'],
+                                    depreciation['Cumulative Personal Property Depreciations'][years - 1],
+                                    suspended_losses[:, years - 1])['Total Taxes']
+
+    def vectors(flows, terminal):
+        v = np.hstack((-initial_equity[:, np.newaxis], flows))
+        v[:, -1] += terminal
+        return v
+
+    rates = fin.irr(np.vstack((vectors(after_tax, sale - tax_upon_sales), vectors(before_tax, sale))))
+    result = table.copy()
+    result['IRR After Tax'] = np.round(rates[:len(table)], 3)
+    result['IRR Before Tax'] = np.round(rates[len(table):], 3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['Equity Multiple After Tax'] = (after_tax.sum(1) + sale - tax_upon_sales) / initial_equity
+        result['Equity Multiple Before Tax'] = (before_tax.sum(1) + sale) / initial_equity
+
+        # ratios, as the ratios node; no debt service is no constraint
+        dscr = statement['Net Operating Incomes'].values[1:] / loan['Debt Service']
+        dscr = np.where(np.isfinite(dscr), dscr, np.inf)
+        total_debt = np.hstack((initial_loan[:, np.newaxis], loan['Total Debt']))
+        result['Minimum Debt Coverage Ratio'] = dscr.min(1)
+        result['Maximum Loan To Value Ratio'] = (total_debt / total_assets).max(1)
+    result['Exact IRR After Tax'] = rates[:len(table)]
+    result['Exact IRR Before Tax'] = rates[len(table):]
+    return result
+
+
+def optimize(deal, scenario, objective='IRR After Tax', min_dscr=1.25, max_ltv=0.8, ltvs=None,
+             io_periods=(0, 1, 2, 3, 5), amortization_periods=(25, 30)):
+    """
+    loan structure with the best objective under the DSCR and LTV constraints
+
+    :param deal: dict
+    :param scenario: dict
+    :param objective: one of OBJECTIVES, maximized
+    :param min_dscr: [optional] minimum debt coverage ratio of every projection year, None for no minimum
+    :param max_ltv: [optional] maximum loan to value ratio of every projection year, the balance sheet
+                    ratio of the debt to the assets, None for no maximum
+    :param ltvs: [optional] 'Loan' values, default 0 to max_ltv by 0.05
+    :param io_periods: interest only periods in years, 0 for an amortizing loan
+    :param amortization_periods: loan terms in years
+    :return: dict: 'best', dict of the best structure and its metrics, None when no candidate is feasible;
+             'scenario', the scenario with the best loan keys; 'candidates', pandas.DataFrame of every
+             candidate with 'Feasible', best first
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError('Unknown objective {0}, expected one of {1}'.format(objective, OBJECTIVES))
+    if ltvs is None:
+        ltvs = np.round(np.arange(0, (max_ltv if max_ltv is not None else 0.8) + 1e-9, 0.05), 4)
+    table = evaluate(deal, scenario, candidates(ltvs, io_periods, amortization_periods))
+
+    feasible = np.isfinite(table[objective].values)
+    if min_dscr is not None:
+        feasible &= table['Minimum Debt Coverage Ratio'].values >= min_dscr
+    if max_ltv is not None:
+        feasible &= table['Maximum Loan To Value Ratio'].values <= max_ltv
+    table['Feasible'] = feasible
+
+    # unrounded IRRs rank the candidates
+    ranking = 'Exact ' + objective if objective.startswith('IRR') else objective
+    table = table.sort_values(['Feasible', ranking], ascending=False, kind='mergesort')
+    table = table.reset_index(drop=True)
+    if not table['Feasible'].iloc[0]:
+        return {'best': None, 'scenario': None, 'candidates': table}
+    best = table.iloc[0].to_dict()
+    best_scenario = dict(scenario)
+    best_scenario.update({'Loan': float(best['Loan']), 'IO Period': best['IO Period'],
+                          'Interests Only': bool(best['IO Period']),
+                          'Amortization Period': int(best['Amortization Period'])})
+    return {'best': best, 'scenario': best_scenario, 'candidates': table}
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+local market comps:
+    rent, vacancy and price histories loaded from CSV or Parquet files
+    indexed by zip code and property type, with date range queries
+    default 'Rent', 'Vacancy' and 'Price Appreciation' of scenarios, filled in bulk
+
+comps files have the columns 'Zip Code', 'Type', 'Date' and any of 'Rent' (per unit
+and payment period), 'Vacancy' (rate in decimal) and 'Price' (price or price index).
+Rows of each (zip code, type) are sorted by date once; lookups are vectorized binary
+searches on the sorted rows, one call for a whole feed of deals. Zip codes without
+comps of a deal type fall back to the average of all types of the zip code.
+
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+METRICS = ('Rent', 'Vacancy', 'Price')
+KEY_COLUMNS = ('Zip Code', 'Type')
+DATE_COLUMN = 'Date'
+
+# composite sort key of the index: key code in the high bits, days since 1970 in the low bits
+_DAY_BITS = 32
+_DAY_OFFSET = 1 << 30
+_LATEST = (1 << _DAY_BITS) - 1
+
+
+def normalize_zip_codes(zip_codes):
+    """
+    zip codes as 5 character strings: 78701, 78701.0, '78701-1234' and ' 78701' are '78701'
+    """
+    z = pd.Series(zip_codes, dtype=object).astype(str).str.strip()
+    z = z.str.replace(r'\.0$', '', regex=True).str.split('-').str[0]
+    return z.str.zfill(5).values
+
+
+def normalize_types(property_types):
+    """
+    property types, upper case without surrounding spaces
+    """
+    return pd.Series(property_types, dtype=object).fillna('').astype(str).str.strip().str.upper().values
+
+
+def to_days(dates):
+    """
+    dates to int64 days since 1970-01-01
+    """
+    return pd.to_datetime(np.atleast_1d(dates)).values.astype('datetime64[D]').astype(np.int64)
+
+
+class _SortedIndex(object):
+    """
+    values of one metric, sorted by (key code, date), NaN values left out
+    """
+
+    def __init__(self, codes, days, values):
+        keep = ~np.isnan(values)
+        codes, days, values = codes[keep], days[keep], values[keep]
+        order = np.lexsort((days, codes))
+        self.codes = codes[order]
+        self.days = days[order]
+        self.values = values[order]
+        self.composite = _composite(self.codes, self.days)
+
+    def last_at(self, codes, days):
+        """
+        row of the last value of each key at or before each day, -1 where there is none
+        """
+        rows = np.searchsorted(self.composite, _composite(codes, days), side='right') - 1
+        return self._check(rows, codes)
+
+    def first(self, codes):
+        """
+        row of the first value of each key, -1 where there is none
+        """
+        rows = np.searchsorted(self.composite, _composite(codes, np.full(len(codes), -_DAY_OFFSET)), side='left')
+        return self._check(rows, codes)
+
+    def _check(self, rows, codes):
+        if not len(self.codes):
+            return np.full(len(rows), -1)
+        rows = np.where((rows >= 0) & (rows < len(self.codes)), rows, -1)
+        found = (rows >= 0) & (self.codes[np.maximum(rows, 0)] == codes) & (codes >= 0)
+        return np.where(found, rows, -1)
+
+    def take(self, rows):
+        """
+        values and days of rows, NaN and 0 where the row is -1
+        """
+        found = rows >= 0
+        if not len(self.values):
+            return np.full(len(rows), np.nan), np.zeros(len(rows), dtype=np.int64)
+        return (np.where(found, self.values[np.maximum(rows, 0)], np.nan),
+                np.where(found, self.days[np.maximum(rows, 0)], 0))
+
+
+def _composite(codes, days):
+    codes = np.asarray(codes, dtype=np.int64)
+    days = np.clip(np.asarray(days, dtype=np.int64) + _DAY_OFFSET, 0, _LATEST)
+    return np.where(codes >= 0, codes, -1) * (1 << _DAY_BITS) + days
+
+
+class CompsStore(object):
+    """
+    store = load_comps(['rents.csv', 'prices.parquet'])
+    store.query('78701', 'SFR', start='2018-01-01', end='2020-12-31')
+    store.assumptions(zip_codes, types, units)      # one row per deal
+
+    the comps frame is sorted once by zip code, type and date; each (zip code, type)
+    and each zip code is a contiguous block of rows, found through a hash index
+    """
+
+    def __init__(self, comps):
+        """
+        :param comps: pandas.DataFrame with 'Zip Code', 'Type', 'Date' and metric columns
+        """
+        missing = [c for c in KEY_COLUMNS + (DATE_COLUMN,) if c not in comps.columns]
+        if missing:
+            raise ValueError('Comps columns missing: {0}'.format(missing))
+        metrics = [m for m in METRICS if m in comps.columns]
+        if not metrics:
+            raise ValueError('Comps have none of the metric columns {0}'.format(METRICS))
+
+        frame = pd.DataFrame({'Zip Code': normalize_zip_codes(comps['Zip Code']),
+                              'Type': normalize_types(comps['Type']),
+                              DATE_COLUMN: pd.to_datetime(comps[DATE_COLUMN])})
+        for m in metrics:
+            frame[m] = pd.to_numeric(comps[m], errors='coerce').values
+        frame = frame.sort_values(['Zip Code', 'Type', DATE_COLUMN], kind='mergesort').reset_index(drop=True)
+        self.frame = frame
+        self.metrics = metrics
+
+        # hash indexes of keys and zip codes, codes numbered in sorted order
+        self.keys = pd.MultiIndex.from_frame(frame[['Zip Code', 'Type']].drop_duplicates())
+        self.zip_codes = pd.Index(frame['Zip Code'].drop_duplicates())
+        key_codes = self.keys.get_indexer(pd.MultiIndex.from_frame(frame[['Zip Code', 'Type']]))
+        zip_codes = self.zip_codes.get_indexer(frame['Zip Code'])
+        days = to_days(frame[DATE_COLUMN])
+        self._key_rows = np.searchsorted(key_codes, np.arange(len(self.keys) + 1))
+
+        # zip level: average of the types of a zip code at each date
+        zip_frame = frame.assign(code=zip_codes, day=days).groupby(['code', 'day'], sort=True)[metrics].mean()
+        zip_level = zip_frame.reset_index()
+        self._indexes = {}
+        for m in metrics:
+            self._indexes[('key', m)] = _SortedIndex(key_codes, days, frame[m].values)
+            self._indexes[('zip', m)] = _SortedIndex(zip_level['code'].values, zip_level['day'].values,
+                                                     zip_level[m].values)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def query(self, zip_code, property_type=None, start=None, end=None):
+        """
+        comps of a zip code, and of a type, between two dates included
+        :param zip_code:
+        :param property_type: [optional] default all types
+        :param start: [optional] first date
+        :param end: [optional] last date
+        :return: pandas.DataFrame, sorted by type and date
+        """
+        zip_code = normalize_zip_codes([zip_code])[0]
+        if property_type is None:
+            code = self.zip_codes.get_indexer([zip_code])[0]
+            if code < 0:
+                return self.frame.iloc[0:0]
+            first = self.keys.get_level_values(0).searchsorted(zip_code, side='left')
+            last = self.keys.get_level_values(0).searchsorted(zip_code, side='right')
+            rows = self.frame.iloc[self._key_rows[first]:self._key_rows[last]]
+        else:
+            code = self.keys.get_indexer(pd.MultiIndex.from_arrays([[zip_code], normalize_types([property_type])]))[0]
+            if code < 0:
+                return self.frame.iloc[0:0]
+            rows = self.frame.iloc[self._key_rows[code]:self._key_rows[code + 1]]
+        if start is None and end is None:
+            return rows
+        dates = rows[DATE_COLUMN].values
+        if property_type is not None:
+            # dates of one key are sorted
+            i = 0 if start is None else dates.searchsorted(np.datetime64(pd.Timestamp(start)), side='left')
+            j = len(dates) if end is None else dates.searchsorted(np.datetime64(pd.Timestamp(end)), side='right')
+            return rows.iloc[i:j]
+        keep = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            keep &= dates >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            keep &= dates <= np.datetime64(pd.Timestamp(end))
+        return rows[keep]
+
+    def _codes(self, zip_codes, property_types):
+        zip_codes = normalize_zip_codes(zip_codes)
+        key_codes = self.keys.get_indexer(pd.MultiIndex.from_arrays([zip_codes, normalize_types(property_types)]))
+        return key_codes, self.zip_codes.get_indexer(zip_codes)
+
+    @staticmethod
+    def _days(as_of, n):
+        if as_of is None:
+            return np.full(n, _LATEST - _DAY_OFFSET, dtype=np.int64)
+        days = to_days(as_of)
+        return np.broadcast_to(days, (n,)) if days.size == 1 else days
+
+    def _lookup(self, metric, key_codes, zip_codes, days):
+        """
+        last value at or before each day, by (zip code, type), else by zip code
+        :return: values, days of the values, rows found at the key level or -1, rows at the zip level or -1
+        """
+        key_rows = self._indexes[('key', metric)].last_at(key_codes, days)
+        zip_rows = np.where(key_rows < 0, self._indexes[('zip', metric)].last_at(zip_codes, days), -1)
+        key_values, key_days = self._indexes[('key', metric)].take(key_rows)
+        zip_values, zip_days = self._indexes[('zip', metric)].take(zip_rows)
+        return (np.where(key_rows >= 0, key_values, zip_values), np.where(key_rows >= 0, key_days, zip_days),
+                key_rows, zip_rows)
+
+    def latest(self, metric, zip_codes, property_types, as_of=None):
+        """
+        last value of a metric at or before a date, one per deal
+        :param metric: 'Rent', 'Vacancy' or 'Price'
+        :param zip_codes: array of zip codes
+        :param property_types: array of types
+        :param as_of: [optional] date, or one date per deal, default the latest comps
+        :return: array, NaN where neither the zip code and type nor the zip code have comps
+        """
+        if metric not in self.metrics:
+            return np.full(len(zip_codes), np.nan)
+        key_codes, zip_codes = self._codes(zip_codes, property_types)
+        return self._lookup(metric, key_codes, zip_codes, self._days(as_of, len(key_codes)))[0]
+
+    def appreciation(self, zip_codes, property_types, as_of=None, years=5):
+        """
+        annual price appreciation over the years before a date, or over the history available
+        :return: array of annual rates in decimal, NaN without at least two prices
+        """
+        n = len(zip_codes)
+        if 'Price' not in self.metrics:
+            return np.full(n, np.nan)
+        key_codes, zip_codes = self._codes(zip_codes, property_types)
+        days = self._days(as_of, n)
+        price, day, key_rows, zip_rows = self._lookup('Price', key_codes, zip_codes, days)
+
+        # price years before, from the same level as the last price
+        start_days = day - int(round(years * 365.25))
+        by_key = key_rows >= 0
+        start_price, start_day = np.full(n, np.nan), np.zeros(n, dtype=np.int64)
+        for level, codes, found in (('key', key_codes, by_key), ('zip', zip_codes, ~by_key & (zip_rows >= 0))):
+            index = self._indexes[(level, 'Price')]
+            rows = index.last_at(codes, start_days)
+            rows = np.where(rows >= 0, rows, index.first(codes))
+            values, value_days = index.take(rows)
+            start_price = np.where(found, values, start_price)
+            start_day = np.where(found, value_days, start_day)
+        with np.errstate(all='ignore'):
+            rates = (price / start_price) ** (365.25 / (day - start_day)) - 1
+        return np.where((day > start_day) & (start_price > 0), rates, np.nan)
+
+    def assumptions(self, zip_codes, property_types, units=1, as_of=None, years=5):
+        """
+        default scenario assumptions of many deals from their comps
+        :param zip_codes: array of zip codes
+        :param property_types: array of types
+        :param units: [optional] number of units of each deal, rent is per unit in the comps
+        :param as_of: [optional] date, or one date per deal, default the latest comps
+        :param years: [optional] period of the price appreciation
+        :return: pandas.DataFrame, one row per deal: 'Rent', 'Vacancy', 'Price Appreciation'
+        """
+        units = np.asarray(pd.to_numeric(pd.Series(np.broadcast_to(units, (len(zip_codes),))), errors='coerce')
+                           .fillna(1).values, dtype=float)
+        a = pd.DataFrame(index=np.arange(len(zip_codes)))
+        a['Rent'] = np.round(self.latest('Rent', zip_codes, property_types, as_of) * units, 0)
+        a['Vacancy'] = self.latest('Vacancy', zip_codes, property_types, as_of)
+        a['Price Appreciation'] = np.round(self.appreciation(zip_codes, property_types, as_of, years), 4)
+        return a
+
+
+def load_comps(paths):
+    """
+    comps store from CSV and Parquet files, e.g. a rent history and a price history
+    :param paths: file, or list of files, .csv or .parquet
+    :return: CompsStore
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    frames = []
+    for path in paths:
+        if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+            frames.append(pd.read_parquet(path))
+        else:
+            frames.append(pd.read_csv(path, dtype={'Zip Code': str}))
+    return CompsStore(pd.concat(frames, ignore_index=True, sort=False))
+
+
+def _missing(val):
+    return val is None or (isinstance(val, str) and not val.strip()) or \
+        (isinstance(val, (float, np.floating)) and np.isnan(val))
+
+
+def enrich(deals, store, as_of=None, years=5):
+    """
+    comps assumptions of a feed of deals
+    :param deals: pandas.DataFrame with 'Zip Code', 'Type' and optionally 'Number of Units'
+    :param store: CompsStore
+    :return: pandas.DataFrame with the index of deals: 'Rent', 'Vacancy', 'Price Appreciation'
+    """
+    units = deals['Number of Units'].values if 'Number of Units' in deals.columns else 1
+    a = store.assumptions(deals['Zip Code'].values, deals['Type'].values, units, as_of, years)
+    a.index = deals.index
+    return a
+
+
+def fill_scenarios(store, deals, scenarios, as_of=None, years=5, overwrite=False):
+    """
+    fill 'Rent', 'Vacancy' and 'Price Appreciation' of scenarios from comps, in one lookup
+
+    :param store: CompsStore
+    :param deals: list of deal dicts, from the Deal sheets
+    :param scenarios: list of scenario dicts, scenarios[i] is a scenario of deals[i]
+    :param as_of: [optional] date of the comps, default the latest
+    :param years: [optional] period of the price appreciation
+    :param overwrite: [optional] replace the values typed in the scenarios too
+    :return: list of scenario dicts, copies; values without comps are left as they are
+    """
+    if len(deals) != len(scenarios):
+        raise ValueError('One deal per scenario expected')
+    frame = pd.DataFrame({'Zip Code': [d.get('Zip Code') for d in deals],
+                          'Type': [d.get('Type') for d in deals],
+                          'Number of Units': [d.get('Number of Units') for d in deals]})
+    a = enrich(frame, store, as_of, years)
+    filled = []
+    for scenario, row in zip(scenarios, a.itertuples(index=False)):
+        scenario = dict(scenario)
+        for key, val in zip(a.columns, row):
+            if not np.isnan(val) and (overwrite or _missing(scenario.get(key))):
+                scenario[key] = float(val)
+        filled.append(scenario)
+    return filled
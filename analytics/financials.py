@@ -12,85 +12,95 @@ import numbers
 import pandas as pd
 import sys
 import os
+from functools import lru_cache
 import Realmly.util.utilities as util
+from Realmly.analytics.graph import Graph
+import Realmly.analytics.money as money
+import Realmly.analytics.backend as backend
+import Realmly.analytics.rentroll as rentroll
+import Realmly.analytics.tax as tax_engine
+import Realmly.analytics.validation as validation
 
 
-def amortize(loan_amount, rate, number_of_payments=360, payment_per_year=12, prepayment=None, begin_or_end='end'):
+@lru_cache(maxsize=4096)
+def _level_payment_schedule(loan_amount, rate, number_of_payments, payment_per_year, begin_or_end, rounding):
     '''
-    amortize(loan_amount, rate, number_of_payments = 360, payment_per_year=12, prepayment=[], begin_or_end = 'end')
-    
-    loan_amount: dollar amount of the loan balance at on
-    rate       : annual interest rates in decimal
-    number_of_payments: default 360, for monthly 30 year
-    payment_per_year : 12, rate compounding periods per year
-    prepaymen  : empty, even or arbitrary 
-    begin_or_end:default "end", payment in arrears    
-    
+    fixed rate schedule without prepayments in integer cents, cached,
+    the arrays returned are shared between callers and read only
+    '''
+    schedule = money.amortize_cents(money.to_cents(loan_amount, rounding), rate / payment_per_year,
+                                    number_of_payments, begin_or_end=begin_or_end, mode=rounding)
+    schedule = tuple(x[0] for x in schedule)
+    for x in schedule:
+        x.flags.writeable = False
+    return schedule
+
+
+def amortize_in_cents(loan_amount, rate, number_of_payments=360, payment_per_year=12, prepayment=None,
+                      begin_or_end='end', rounding=money.DEFAULT_ROUNDING):
+    '''
+    amortization schedule in integer cents, see amortize
+    :return: int64 arrays (number_of_payments,): total payments, interests, principal payments, balances;
+             with prepayments (number_of_payments, 2), without and with the prepayments
     '''
-    
     if number_of_payments <= 0:
-        raise Exception('Number of Payments should be a positive number')
+        raise ValueError('Number of Payments should be a positive number')
     if rate < 0:
-        raise Exception('Interest rate should be a positive number')
+        raise ValueError('Interest rate should be a positive number')
 
-#   interest rate per payment period
-    rate_per_period = rate / payment_per_year
-    
 #    pre-payments
-    if prepayment is None or not(prepayment):
+    if prepayment is None or (np.ndim(prepayment) == 0 and not(prepayment)):
         additional_payments = np.zeros(number_of_payments)
-    elif type(prepayment) is not np.ndarray:
-        additional_payments = np.ones((number_of_payments,1))*prepayment
     else:
-        additional_payments = np.copy(prepayment)
-        
+        additional_payments = np.asarray(prepayment, dtype=float).ravel()
+
     if len(additional_payments) != number_of_payments:
         if len( additional_payments) == 0 :
             additional_payments = np.zeros(number_of_payments)
         elif len(additional_payments) == 1:
             additional_payments = np.ones(number_of_payments) * additional_payments
         else:
-            raise Exception( 'Prepayment vector shorter than number of payments')
-    additional_payments = additional_payments.round(2)
-            
-#   fixed rate mortgage payment per perriod
-    payment = round(-np.pmt(rate_per_period, number_of_payments, loan_amount, 0, begin_or_end),2)
-
-#   build amortization table    
-    balance = np.ones(2)*round(loan_amount, 2)
-    balances = np.zeros((number_of_payments,2))
-    interests = np.zeros((number_of_payments,2))
-    principal_payments = np.zeros((number_of_payments,2))
-    total_payments = np.zeros((number_of_payments,2))
-
-    prepaying = sum( abs( additional_payments)) > 0
+            raise ValueError('Prepayment vector shorter than number of payments')
+    additional_payments = money.to_cents(additional_payments, rounding)
+
+    if not np.any(additional_payments):
+        return _level_payment_schedule(float(loan_amount), float(rate), int(number_of_payments),
+                                       int(payment_per_year), begin_or_end, rounding)
+
+#   both schedules at once, without and with the prepayments
+    principal = money.to_cents(loan_amount, rounding) * np.ones(2, dtype=np.int64)
+    prepayments = np.vstack((np.zeros(number_of_payments, dtype=np.int64), additional_payments))
+    schedule = money.amortize_cents(principal, rate / payment_per_year, number_of_payments,
+                                    prepayment_cents=prepayments, begin_or_end=begin_or_end, mode=rounding)
+    return tuple(x.T for x in schedule)
+
+
+def amortize(loan_amount, rate, number_of_payments=360, payment_per_year=12, prepayment=None, begin_or_end='end',
+             rounding=money.DEFAULT_ROUNDING):
+    '''
+    amortize(loan_amount, rate, number_of_payments = 360, payment_per_year=12, prepayment=[], begin_or_end = 'end')
     
-# iterate through payment periods    
-    for i in range(number_of_payments):
-        interests[i,0] = round( balance[0] * rate_per_period, 2)
-        interests[i,1] = round( balance[1] * rate_per_period, 2)
-        principal_payments[i,0] = min( balance[0], payment - interests[i,0])
-        principal_payments[i,1] = min( balance[1], payment - interests[i,1]+additional_payments[i])
-        balance[0] -= principal_payments[i,0]
-        balance[1] -= principal_payments[i,1]
-        balances[i,0] = balance[0]
-        balances[i,1]=balance[1]
-        total_payments[i,0]=interests[i,0]+principal_payments[i,0]
-        total_payments[i,1]=interests[i,1]+principal_payments[i,1]
-        
-    if prepaying:
+    loan_amount: dollar amount of the loan balance at on
+    rate       : annual interest rates in decimal
+    number_of_payments: default 360, for monthly 30 year
+    payment_per_year : 12, rate compounding periods per year
+    prepaymen  : empty, even or arbitrary 
+    begin_or_end:default "end", payment in arrears    
+    rounding   : default 'half_even', rounding mode of cents, see money.ROUNDING_MODES
+
+    the schedule is computed in integer cents, bit exact on every platform
+    '''
+    total_payments, interests, principal_payments, balances = amortize_in_cents(
+        loan_amount, rate, number_of_payments, payment_per_year, prepayment, begin_or_end, rounding)
+
+    if total_payments.ndim == 2:
         print("Prepayments reduced pay periods from %d to %d" % (number_of_payments,np.count_nonzero(total_payments[:,1])))
-        print("Total interests payment changed from %.0f to %.0f" % (sum(interests[:,0]),sum(interests[:,1])))
-    else:    
-        total_payments = total_payments[:,0]
-        interests = interests[:,0]
-        principal_payments = principal_payments[:,0]
-        balances = balances[:,0]
-
-    total_payments = total_payments.reshape((total_payments.size, 1))
-    interests = interests.reshape((interests.size, 1))
-    principal_payments = principal_payments.reshape((principal_payments.size, 1))
-    balances = balances.reshape((balances.size, 1))
+        print("Total interests payment changed from %.0f to %.0f" % (interests[:,0].sum()/100,interests[:,1].sum()/100))
+
+    total_payments = money.to_dollars(total_payments).reshape((total_payments.size, 1))
+    interests = money.to_dollars(interests).reshape((interests.size, 1))
+    principal_payments = money.to_dollars(principal_payments).reshape((principal_payments.size, 1))
+    balances = money.to_dollars(balances).reshape((balances.size, 1))
     return total_payments, interests, principal_payments, balances
 
 
@@ -107,26 +117,235 @@ def interest_only_loan(int_only_period, loan_amount, rate, number_of_payments=36
     :param begin_or_end:
     :return:
     """
-    io_interests = rate/payment_per_year * loan_amount * np.ones((int_only_period, 1))
-    io_principals = np.zeros((int_only_period, 1))
-    io_balances = loan_amount * np.ones((int_only_period, 1))
-    io_total = io_interests + io_principals
-    remaining_payments = number_of_payments - int_only_period
-    total_payments, interests, principal_payments, balances = amortize(loan_amount, rate, remaining_payments,
-                                                                       payment_per_year, prepayment, begin_or_end)
-    total_payments = np.vstack((io_total, total_payments))
-    interests = np.vstack((io_interests, interests))
-    principal_payments = np.vstack((io_principals, principal_payments))
-    balances = np.vstack((io_balances, balances))
+    total_payments, interests, principal_payments, balances = interest_only_in_cents(
+        int_only_period, loan_amount, rate, number_of_payments, payment_per_year, prepayment, begin_or_end)
+    if total_payments.ndim == 2:
+        print("Total interests payment changed from %.0f to %.0f" % (interests[:,0].sum()/100,interests[:,1].sum()/100))
+    total_payments = money.to_dollars(total_payments).reshape((total_payments.size, 1))
+    interests = money.to_dollars(interests).reshape((interests.size, 1))
+    principal_payments = money.to_dollars(principal_payments).reshape((principal_payments.size, 1))
+    balances = money.to_dollars(balances).reshape((balances.size, 1))
+
+    return total_payments, interests, principal_payments, balances
 
+
+def interest_only_in_cents(int_only_period, loan_amount, rate, number_of_payments=360,
+                           payment_per_year=12, prepayment=None, begin_or_end='end', rounding=money.DEFAULT_ROUNDING):
+    """
+    interest only loan schedule in integer cents, see interest_only_loan and amortize_in_cents
+    """
+    remaining_payments = number_of_payments - int_only_period
+    total_payments, interests, principal_payments, balances = amortize_in_cents(
+        loan_amount, rate, remaining_payments, payment_per_year, prepayment, begin_or_end, rounding)
+    loan_cents = money.to_cents(loan_amount, rounding)
+    shape = (int_only_period,) + total_payments.shape[1:]
+    io_interests = np.full(shape, money.round_to_int(loan_cents * rate / payment_per_year, rounding), dtype=np.int64)
+    io_principals = np.zeros(shape, dtype=np.int64)
+    io_balances = np.full(shape, loan_cents, dtype=np.int64)
+
+    total_payments = np.concatenate((io_interests, total_payments))
+    interests = np.concatenate((io_interests, interests))
+    principal_payments = np.concatenate((io_principals, principal_payments))
+    balances = np.concatenate((io_balances, balances))
     return total_payments, interests, principal_payments, balances
+
+_growth_curves = {}
+
+
+def growth_factors(rates, horizon):
+    """
+    growth curves (1 + rate)^t, t = 0 .. horizon-1, one row per rate
+
+    curves are cached by (rate, horizon); the curves not seen before are built
+    together in one batched operation
+    :param rates: sequence of annual rates in decimal
+    :param horizon: number of years
+    :return: array (len(rates), horizon)
+    """
+    rates = [float(r) for r in rates]
+    missing = sorted(set(r for r in rates if (r, horizon) not in _growth_curves))
+    if missing:
+        if len(_growth_curves) + len(missing) > 65536:
+            _growth_curves.clear()
+            missing = sorted(set(rates))
+        curves = np.exp(np.outer(np.log(1 + np.array(missing)), np.arange(horizon)))
+        for r, curve in zip(missing, curves):
+            curve.flags.writeable = False
+            _growth_curves[(r, horizon)] = curve
+    if not rates:
+        return np.zeros((0, horizon))
+    return np.vstack([_growth_curves[(r, horizon)] for r in rates])
+
+
+def inflate(amounts, rates, horizon):
+    """
+    inflated line items: amount * (1 + rate)^t, t = 0 .. horizon-1
+
+    amounts and rates have the same shape, one entry per line item; a batch of scenarios
+    is a 2-d array (scenarios, line items). Repeated rates share one growth curve.
+    :param amounts: base amounts in year 1
+    :param rates: annual inflation rates in decimal
+    :param horizon: number of years
+    :return: array, shape of amounts + (horizon,)
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    rates = np.asarray(rates, dtype=float)
+    unique_rates, index = np.unique(rates, return_inverse=True)
+    growth = growth_factors(unique_rates, horizon)
+    return amounts[..., np.newaxis] * growth[index.reshape(rates.shape)]
+
+
+def _column(annual):
+    """
+    statement column: year 0 is zero, then the annual values
+    """
+    column = np.zeros(len(annual) + 1)
+    column[1:] = annual
+    return column
+
+
+def _statement(columns, names):
+    statement = pd.DataFrame(columns, columns=names)
+    statement.index.name = 'Year'
+    return statement
+
+
+def annual_loan(loan_amount, rate, amortizing_years, payments_per_year=12, io_years=0):
+    """
+    annual totals of a loan schedule, summed in cents and rounded to dollars
+    :param loan_amount:
+    :param rate: annual interest rate in decimal
+    :param amortizing_years: loan term in years, including the interest only period
+    :param payments_per_year:
+    :param io_years: [optional] interest only period in years
+    :return: annual payments, interests, principal payments and year end balances
+    """
+    number_of_payments = amortizing_years * payments_per_year
+    if io_years:
+        mortgage_payments, interest_expenses, principal_payments, loan_balances = interest_only_in_cents(
+            int(io_years * payments_per_year), loan_amount, rate, number_of_payments, payments_per_year)
+    else:
+        mortgage_payments, interest_expenses, principal_payments, loan_balances = amortize_in_cents(
+            loan_amount, rate, number_of_payments, payments_per_year)
+
+    # sums in exact cents, one rounding to whole dollars per year
+    shape = (amortizing_years, payments_per_year)
+    annual_loan_payments = money.div_round(mortgage_payments.reshape(shape).sum(1), 100).astype(float)
+    annual_interest_expenses = money.div_round(interest_expenses.reshape(shape).sum(1), 100).astype(float)
+    annual_principal_payments = money.div_round(principal_payments.reshape(shape).sum(1), 100).astype(float)
+    annual_loan_balances = money.div_round(loan_balances.reshape(shape)[:, -1], 100).astype(float)
+    return annual_loan_payments, annual_interest_expenses, annual_principal_payments, annual_loan_balances
+
+
+def scenario_value(val):
+    """
+    scalar value of a scenario entry, None for blank cells and missing keys
+    """
+    if isinstance(val, np.ndarray):
+        if val.size != 1:
+            return None
+        val = val.item()
+    if val is None or (isinstance(val, str) and not val.strip()):
+        return None
+    if isinstance(val, numbers.Number) and np.isnan(val):
+        return None
+    return val
+
+
+def refinance_events(scenario):
+    """
+    refinance events of a scenario, sorted by year
+
+    either scenario['Refinances'], a list of dicts with keys 'Year', and optionally 'Rate',
+    'Amortization Period', 'LTV', 'Closing Costs', 'IO Period', or a single event given by the
+    'Refinance Year', 'Refinance Rate', 'Refinance Amortization Period', 'Refinance LTV',
+    'Refinance Closing Costs' and 'Refinance IO Period' keys of a scenario sheet.
+    Missing rate and amortization period are those of the original loan. Without 'LTV' the
+    balance is refinanced as is, otherwise the new loan is 'LTV' times the asset value that year.
+    :param scenario: dict
+    :return: list of dicts
+    """
+    events = scenario.get('Refinances')
+    if not events:
+        year = scenario_value(scenario.get('Refinance Year'))
+        if not year:
+            return []
+        events = [{'Year': year,
+                   'Rate': scenario.get('Refinance Rate'),
+                   'Amortization Period': scenario.get('Refinance Amortization Period'),
+                   'LTV': scenario.get('Refinance LTV'),
+                   'Closing Costs': scenario.get('Refinance Closing Costs'),
+                   'IO Period': scenario.get('Refinance IO Period')}]
+    refinances = []
+    for event in events:
+        refinance = {k: scenario_value(v) for k, v in event.items()}
+        refinance['Year'] = int(refinance['Year'])
+        refinances.append(refinance)
+    return sorted(refinances, key=lambda e: e['Year'])
+
+
+def loan_schedule(loan_amount, rate, amortizing_years, payments_per_year=12, io_years=0,
+                  years=None, refinances=None, asset_values=None):
+    """
+    annual loan schedule stitched from the original loan and its refinance segments
+
+    :param loan_amount: original loan
+    :param rate: annual interest rate of the original loan
+    :param amortizing_years: term of the original loan in years
+    :param payments_per_year:
+    :param io_years: [optional] interest only period of the original loan in years
+    :param years: [optional] projection years, the schedule covers at least these
+    :param refinances: [optional] list of refinance events, see refinance_events
+    :param asset_values: asset values by year, index 0 at acquisition, required for 'LTV' refinances
+    :return: dict of annual arrays, index 0 is year 1: 'Debt Service', 'Interests', 'Principal Repayments',
+             'Total Debt' (year end), 'Refinance Proceeds' (net cash to equity) and 'Refinance Costs'
+    """
+    refinances = refinances or []
+    horizon = max([years or 0, amortizing_years] +
+                  [e['Year'] + int(e.get('Amortization Period') or amortizing_years) for e in refinances])
+    schedule = {key: np.zeros(horizon) for key in ('Debt Service', 'Interests', 'Principal Repayments',
+                                                   'Total Debt', 'Refinance Proceeds', 'Refinance Costs')}
+    start = 0
+    for i in range(len(refinances) + 1):
+        end = refinances[i]['Year'] if i < len(refinances) else horizon
+        if end <= start:
+            raise ValueError('Refinance years should be increasing and after the acquisition')
+        if years and i < len(refinances) and end >= years:
+            raise ValueError('Refinance year {0:d} should be before the sale year {1:d}'.format(end, years))
+        segment = annual_loan(loan_amount, rate, amortizing_years, payments_per_year, io_years)
+        n = min(end - start, amortizing_years)
+        for key, values in zip(('Debt Service', 'Interests', 'Principal Repayments', 'Total Debt'), segment):
+            schedule[key][start:start + n] = values[:n]
+        if i == len(refinances):
+            break
+
+        # pay off the balance with a new loan at the end of the refinance year
+        refinance = refinances[i]
+        balance = schedule['Total Debt'][end - 1]
+        if refinance.get('LTV') is not None:
+            if asset_values is None or end >= len(asset_values):
+                raise ValueError('Asset value of refinance year {0:d} unknown'.format(end))
+            loan_amount = round(refinance['LTV'] * asset_values[end], 0)
+        else:
+            loan_amount = balance
+        closing_costs = refinance.get('Closing Costs') or 0
+        schedule['Total Debt'][end - 1] = loan_amount
+        schedule['Refinance Proceeds'][end - 1] = loan_amount - balance - closing_costs
+        schedule['Refinance Costs'][end - 1] = closing_costs
+
+        rate = refinance['Rate'] if refinance.get('Rate') is not None else rate
+        amortizing_years = int(refinance.get('Amortization Period') or amortizing_years)
+        io_years = refinance.get('IO Period') or 0
+        start = end
+    return schedule
+
+
 # financial projection for real estate investments
 # predicated
 
 def investment_projection( years, purchase, loan, income, operation, sale, tax, info=None, print_flag=False, output_location=None):
     if years is None or not (isinstance( years, numbers.Number)) or years <= 0:
-        years = 5
-        print( "Invalid number of years of projection ", years, " years assumed")
+        raise ValueError('Years should be a positive number of years, got {0}'.format(years))
     
     is_columns = [
                   'Net Incomes',
@@ -162,21 +381,16 @@ def investment_projection( years, purchase, loan, income, operation, sale, tax,
                      'Total Expense Ratios'
                       ]
                      
-    is_projection = pd.DataFrame( np.zeros((years+1,len(is_columns))), columns = is_columns)
-    bs_projection = pd.DataFrame( np.zeros((years+1,len(bs_columns))), columns = bs_columns)
-    cf_projection = pd.DataFrame( np.zeros((years+1,len(cf_columns))), columns = cf_columns)
-    ratios        = pd.DataFrame( np.zeros((years+1,len(ratio_columns))), columns = ratio_columns)
-    
-    ratios.index.name = 'Year'
-    cf_projection.index.name = 'Year'
-    is_projection.index.name = 'Year'
-    bs_projection.index.name = 'Year'
-
-    
-    initial_equity = purchase['price']+purchase['buying costs']-loan['loan']    
+    initial_equity = purchase['price']+purchase['buying costs']-loan['loan']
     initial_loan   = loan['loan']
     interest_rate  = loan['rate']
-    
+
+    def annual(values):
+        # first years of an annual line, zeros once it ends
+        line = np.zeros(years)
+        line[:min(years, len(values))] = values[:years]
+        return line
+
     # get loan amortization schedules
     amortizing_years = loan['amortization period']
     payments_per_year = loan['payments per year']
@@ -190,115 +404,125 @@ def investment_projection( years, purchase, loan, income, operation, sale, tax,
     annual_principal_payments = np.round(np.sum(annual_principal_payments,1),0)
     annual_loan_balances = loan_balances.reshape((amortizing_years,payments_per_year))
     annual_loan_balances = np.round(annual_loan_balances[:,-1],0)
+    interests = annual(annual_interest_expenses)
+    debt_service = annual(annual_loan_payments)
+
+    # statement columns, year 0 first
+    c = {}
+    c['Total Debt'] = np.concatenate(([initial_loan], annual(annual_loan_balances)))
+    c['Interests'] = _column(interests)
+    c['Principal Repayments'] = _column(annual(annual_principal_payments))
+    c['Debt Service'] = _column(debt_service)
+
+    # growth curves: rent, utilities, insurance, maintenance, property tax, asset price
+    growth = growth_factors([income['rent inflation'], income['Utility Inflation'],
+                             operation['insurance inflation'], operation['maintenance inflation'],
+                             tax['property tax inflation'], sale['appreciation']], years + 1)
 
-    bs_projection['Total Debt'][0]=initial_loan
-    bs_projection['Total Debt'][1:]=annual_loan_balances[:years]
-    is_projection['Interests'][0]=0
-    is_projection['Interests'][1:]=annual_interest_expenses[:years]
-    is_projection['Principal Repayments'][0]=0
-    is_projection['Principal Repayments'][1:]=annual_principal_payments[:years]
-    is_projection['Debt Service'][1:] = annual_loan_payments[:years]
-    cf_projection['Cash Flow From Financing'][1:]+=annual_principal_payments[:years]
-    
     # get income projection
-    rent_inflation = income['rent inflation']
     rent_per_period = income['rent']
     rent_per_year = rent_per_period * income['payments per year']
     rent_per_year = rent_per_year * (1-income['vacancy'])
-    annual_rents = np.round( rent_per_year * np.exp(np.array(range(years))*np.log(1+rent_inflation)))
-    is_projection['Rents'][1:]=annual_rents
-    is_projection['Total Revenues']=is_projection['Rents']+is_projection['Other Incomes']
+    annual_rents = np.round( rent_per_year * growth[0, :years])
+    c['Rents'] = _column(annual_rents)
+    c['Other Incomes'] = np.zeros(years + 1)
+    c['Total Revenues'] = c['Rents'] + c['Other Incomes']
 
     # get utility projection
-    util_inflation = income['Utility Inflation']
     utility = income['Utilities']
-    annual_utilities = utility * np.round( np.exp(np.array(range(years))*np.log(1+util_inflation)))
-    is_projection['Utilities'][1:]=annual_utilities
+    annual_utilities = utility * np.round( growth[1, :years])
+    c['Utilities'] = _column(annual_utilities)
 
     # asset price
-    asset_values = np.round( purchase['price']*np.exp((np.array(range(years+1)))*np.log(sale['appreciation']+1)), 0)
-    
-    bs_projection['Total Assets']=asset_values.round(0)
-    bs_projection['Total Assets'][0] += purchase['buying costs']
-    bs_projection['Equity'] = bs_projection['Total Assets'] - bs_projection['Total Debt']
+    asset_values = np.round( purchase['price']*growth[5], 0)
+
+    c['Total Assets'] = asset_values.copy()
+    c['Total Assets'][0] += purchase['buying costs']
+    c['Equity'] = c['Total Assets'] - c['Total Debt']
     # operating cost
     annual_property_management_fees = operation['property management fee'] * annual_rents
     annual_realm_fees = operation['realm fee']*annual_rents
     annual_turnover_costs = operation['tenant turnover cost']*np.ones(years)
-    annual_insurance_costs = operation['insurance']*asset_values[0]*(np.exp(np.arange(years)*np.log(1+operation['insurance inflation'])))
-    annual_maintenance_costs = asset_values[0]*operation['maintenance']*np.exp(np.arange(years)*np.log(1+operation['maintenance inflation']))
+    annual_insurance_costs = operation['insurance']*asset_values[0]*growth[2, :years]
+    annual_maintenance_costs = asset_values[0]*operation['maintenance']*growth[3, :years]
     annual_operating_costs = annual_property_management_fees + annual_turnover_costs + annual_insurance_costs + annual_utilities
-    annual_operating_costs += annual_maintenance_costs    
-    
-    is_projection['Insurances'][1:]= np.round(annual_insurance_costs, 0)
-    is_projection['Maintenance'][1:]=annual_maintenance_costs.round(0)
-    is_projection['Turnover Costs'][1:]=annual_turnover_costs.round(0)
-    is_projection['Property Management Fees'][1:]=annual_property_management_fees.round(0)
-    is_projection['Realm Fees'][1:]=annual_realm_fees.round(0)
-    is_projection['Operating Expenses']=is_projection['Insurances']+is_projection['Maintenance']+\
-        is_projection['Realm Fees'] + is_projection['Property Management Fees']+\
-        is_projection['Turnover Costs']
+    annual_operating_costs += annual_maintenance_costs
+
+    c['Insurances'] = _column(np.round(annual_insurance_costs, 0))
+    c['Maintenance'] = _column(annual_maintenance_costs.round(0))
+    c['Turnover Costs'] = _column(annual_turnover_costs.round(0))
+    c['Property Management Fees'] = _column(annual_property_management_fees.round(0))
+    c['Realm Fees'] = _column(annual_realm_fees.round(0))
+    c['Operating Expenses'] = c['Insurances'] + c['Maintenance'] + c['Realm Fees'] + \
+        c['Property Management Fees'] + c['Turnover Costs']
 
     # taxes
-    annual_property_taxes = tax['property tax']*(np.exp(np.array(range(years))*np.log(1+tax['property tax inflation'])))
-    is_projection['Property Taxes'][1:]= np.round( annual_property_taxes, 0)    
-    
+    annual_property_taxes = tax['property tax']*growth[4, :years]
+    c['Property Taxes'] = _column(np.round( annual_property_taxes, 0))
+
     # operating income
     annual_operating_incomes = annual_rents - annual_operating_costs - annual_property_taxes - annual_utilities
-    is_projection['Net Operating Incomes']=is_projection['Total Revenues']-is_projection['Operating Expenses']-is_projection['Property Taxes'] -is_projection['Utilities']
-    
+    c['Net Operating Incomes'] = c['Total Revenues'] - c['Operating Expenses'] - c['Property Taxes'] - c['Utilities']
+
     # total costs
-    annual_total_expenses  = annual_operating_costs + annual_property_taxes + annual_interest_expenses[:years]
-    is_projection['Total Expenses'][1:] = np.round( annual_total_expenses,0)
-    
-    #depreciation charge and tax basis
-    annual_depreciations = np.round((purchase['price']-tax['land value'])/27.5*np.ones(years), 0)
-    cumulative_depreciations = np.cumsum( annual_depreciations)
+    annual_total_expenses  = annual_operating_costs + annual_property_taxes + interests
+    c['Total Expenses'] = _column(np.round( annual_total_expenses,0))
+
+    #depreciation charge and tax basis, with the tax engine keys of the tax settings in lower case,
+    #'depreciation method', 'depreciation period', 'cost segregation 5 year' ... 'bonus depreciation'
+    options = tax_engine.scenario_options({key: tax.get(key.lower()) for key in tax_engine.TAX_KEYS},
+                                          (info or {}).get('Class', 'Residential'))
+    options.pop('carryforward')
+    depreciation = tax_engine.depreciation_schedule(purchase['price']-tax['land value'], years, **options)
+    annual_depreciations = depreciation['Depreciations']
+    cumulative_depreciations = depreciation['Cumulative Depreciations']
     tax_basis = np.ones(years)*purchase['price']-cumulative_depreciations
-    
-    bs_projection['Cumulative Depreciations'][0]=0
-    bs_projection['Cumulative Depreciations'][1:]=cumulative_depreciations.round(0)
-    bs_projection['Tax Basis'][0]=bs_projection['Total Assets'][0]
-    bs_projection['Tax Basis'][1:]=tax_basis.round(0)
-    is_projection['Depreciations'][1:]=annual_depreciations
-    
+
+    c['Cumulative Depreciations'] = _column(cumulative_depreciations.round(0))
+    c['Tax Basis'] = np.concatenate(([c['Total Assets'][0]], tax_basis.round(0)))
+    c['Depreciations'] = _column(annual_depreciations)
+
     #net income
-    annual_net_incomes = annual_operating_incomes - annual_interest_expenses[:years] - annual_depreciations
+    annual_net_incomes = annual_operating_incomes - interests - annual_depreciations
     taxes = annual_net_incomes * tax['income tax']
-    is_projection['Net Incomes']=is_projection['Net Operating Incomes']-is_projection['Interests']-is_projection['Depreciations']
-    
+    c['Net Incomes'] = c['Net Operating Incomes'] - c['Interests'] - c['Depreciations']
+
     #cash flow
-    annual_before_tax_cash_flows = np.round( annual_operating_incomes - annual_loan_payments[:years], 2)
-    annual_after_tax_cash_flows = np.round( annual_operating_incomes - annual_loan_payments[:years] - taxes, 2)
-    
-    cf_projection['Cash Flow From Financing']=-is_projection['Debt Service']
-    cf_projection['Cash Flow From Operation']= is_projection['Net Operating Incomes']
-    cf_projection['Net Cash Flows'][1:]=np.round( annual_operating_incomes - annual_loan_payments[:years], 2)
-    
+    annual_before_tax_cash_flows = np.round( annual_operating_incomes - debt_service, 2)
+    annual_after_tax_cash_flows = np.round( annual_operating_incomes - debt_service - taxes, 2)
+
+    c['Cash Flow From Financing'] = -c['Debt Service']
+    c['Cash Flow From Operation'] = c['Net Operating Incomes']
+    c['Net Cash Flows'] = _column(annual_before_tax_cash_flows)
+
+    def statement(columns):
+        return _statement(np.column_stack([c.get(k, np.zeros(years + 1)) for k in columns]), columns)
+
+    is_projection = statement(is_columns)
+    bs_projection = statement(bs_columns)
+    cf_projection = statement(cf_columns)
+
     # net sale
     net_sales = asset_values[-1]*(1-sale['broker commissions'])
 
-    disposal = {}    
+    disposal = {}
     disposal.update({'Gross Sales': asset_values[-1]})
     disposal.update({'Sales Comissions': round( asset_values[-1]*sale['broker commissions'],0)})
     disposal.update({'Net Sales Before Tax': net_sales.round(0) })
     disposal.update({'Tax Basis': tax_basis[-1].round(0)})
 
     #taxes related to sales
-    pnl = net_sales - tax_basis[-1]    
-    if pnl > 0:
-        long_term_gain = round( max( 0, net_sales - bs_projection['Total Assets'][0]),0)
-        depreciation_recapture = round( min( pnl, cumulative_depreciations[-1]),0)
-        short_term_gain = 0
-    else: 
-        depreciation_recapture = 0
-        long_term_gain = 0
-        short_term_gain = pnl
-
-    long_term_gain_tax = round(long_term_gain * tax[ 'capital gain tax' ],0)
-    short_term_gain_tax = round(short_term_gain * tax[ 'income tax' ],0)
-    recapture_tax = round( depreciation_recapture * tax[ 'depreciation recapture tax' ],0)
-    tax_upon_sales = round( recapture_tax + long_term_gain_tax + short_term_gain_tax,0)
+    pnl = net_sales - tax_basis[-1]
+    sale_taxes = tax_engine.sale_taxes(net_sales, tax_basis[-1], c['Total Assets'][0],
+                                       cumulative_depreciations[-1], tax['capital gain tax'], tax['income tax'],
+                                       tax['depreciation recapture tax'])
+    long_term_gain = float(sale_taxes['Long Term Gain'])
+    depreciation_recapture = float(sale_taxes['Depreciation Recapture'])
+    short_term_gain = float(sale_taxes['Short Term Gain'])
+    long_term_gain_tax = float(sale_taxes['Long Term Gain Tax'])
+    short_term_gain_tax = float(sale_taxes['Short Term Gain Tax'])
+    recapture_tax = float(sale_taxes['Depreciation Recapture Tax'])
+    tax_upon_sales = float(sale_taxes['Total Taxes'])
 
     disposal.update({'Capital Gain': round(pnl,0)})
     disposal.update({'Long Term Gain': long_term_gain })
@@ -309,47 +533,43 @@ def investment_projection( years, purchase, loan, income, operation, sale, tax,
     disposal.update({'Depreciation Recapture Tax': recapture_tax })
     disposal.update({'Total Taxes':tax_upon_sales})
     disposal.update({'Net Sales After Tax': round( net_sales - tax_upon_sales)})
-    disposal.update({'Total Gain Before Tax': round(is_projection['Net Incomes'].sum() + pnl)})
-    disposal.update({'Total Gain After Tax': round( is_projection['Net Incomes'].sum()-taxes.sum()+pnl-tax_upon_sales)})
-    disposal.update({'Total Return Before Tax': round( disposal['Total Gain Before Tax']/bs_projection['Equity'][0], 3)})
-    disposal.update({'Total Return After Tax': round( disposal['Total Gain After Tax']/bs_projection['Equity'][0],3)})
+    disposal.update({'Total Gain Before Tax': round(c['Net Incomes'].sum() + pnl)})
+    disposal.update({'Total Gain After Tax': round( c['Net Incomes'].sum()-taxes.sum()+pnl-tax_upon_sales)})
+    disposal.update({'Total Return Before Tax': round( disposal['Total Gain Before Tax']/c['Equity'][0], 3)})
+    disposal.update({'Total Return After Tax': round( disposal['Total Gain After Tax']/c['Equity'][0],3)})
     disposal.update({'Number Of Years': years })
     disposal.update({'Capital Gain Tax Rate': tax['capital gain tax']})
     disposal.update({'Income Tax Rate': tax['income tax']})
     disposal.update({'Depreciation Recapture Tax Rate': tax['depreciation recapture tax']})
-    
-    #IRR - internal rate of returns: after tax
-    ivec = np.zeros( years + 1)
-    ivec[0] = -initial_equity
-    ivec[1:] = annual_after_tax_cash_flows
-    ivec[-1] += net_sales - annual_loan_balances[years-1] - tax_upon_sales    
-    irr = round(np.irr(ivec),3)
-    disposal.update({'IRR After Tax': irr})
-    
-    #IRR - internal rate of returns: before tax
-    itvec = np.zeros( years + 1)
-    itvec[0] = -initial_equity
-    itvec[1:] = annual_before_tax_cash_flows
-    itvec[-1] += net_sales - annual_loan_balances[years-1]    
-    irr_pre_tax = round(np.irr(itvec),3)
-    disposal.update({'IRR Before Tax': irr_pre_tax })
-
-    is_projection['Total Revenues']=is_projection['Rents']+is_projection['Other Incomes']
-    
+
+    #IRR - internal rate of returns: after tax and before tax
+    vectors = np.zeros((2, years + 1))
+    vectors[:, 0] = -initial_equity
+    vectors[0, 1:] = annual_after_tax_cash_flows
+    vectors[1, 1:] = annual_before_tax_cash_flows
+    vectors[0, -1] += net_sales - c['Total Debt'][years] - tax_upon_sales
+    vectors[1, -1] += net_sales - c['Total Debt'][years]
+    rates = irr(vectors)
+    disposal.update({'IRR After Tax': round(float(rates[0]), 3)})
+    disposal.update({'IRR Before Tax': round(float(rates[1]), 3)})
+
     # return metrics
-    ratios['Capitalization Rates']=is_projection['Net Operating Incomes']/bs_projection['Total Assets'].shift(1)
-    ratios['Debt Coverage Ratios']=is_projection['Net Operating Incomes']/is_projection['Debt Service']
-    ratios['Loan To Value Ratios']=bs_projection['Total Debt']/bs_projection['Total Assets']
-    ratios['Operating Ratios']=is_projection['Operating Expenses']/is_projection['Total Revenues']
-    ratios['Total Expense Ratios']=is_projection['Total Expenses']/is_projection['Total Revenues']
-    #ratios['Return On Investments']= is_projection['Net Incomes']/bs_projection['Equity']
-    roi = (is_projection['Net Incomes']+bs_projection['Equity'])/bs_projection['Equity'].shift(1) - 1
-    ratios['Return On Investments'] = roi
-    ratios['Leverage'] = bs_projection['Total Assets']/bs_projection['Equity']
-    ratios['Gross Rent Multiplier']=np.round(bs_projection['Total Assets']/is_projection['Rents'],1)
-    ratios['Gross Rent Multiplier'][0] = 0
-    ratios['Cash On Cash Returns']=cf_projection['Net Cash Flows']/(bs_projection['Equity'][0])
-    
+    ratios = pd.DataFrame(np.zeros((years + 1, len(ratio_columns))), columns=ratio_columns)
+    ratios.index.name = 'Year'
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios['Capitalization Rates'] = c['Net Operating Incomes'] / np.concatenate(([np.nan], c['Total Assets'][:-1]))
+        ratios['Debt Coverage Ratios'] = c['Net Operating Incomes'] / c['Debt Service']
+        ratios['Loan To Value Ratios'] = c['Total Debt'] / c['Total Assets']
+        ratios['Operating Ratios'] = c['Operating Expenses'] / c['Total Revenues']
+        ratios['Total Expense Ratios'] = c['Total Expenses'] / c['Total Revenues']
+        roi = (c['Net Incomes'] + c['Equity']) / np.concatenate(([np.nan], c['Equity'][:-1])) - 1
+        ratios['Return On Investments'] = roi
+        ratios['Leverage'] = c['Total Assets'] / c['Equity']
+        gross_rent_multiplier = np.round(c['Total Assets'] / c['Rents'], 1)
+        gross_rent_multiplier[0] = 0
+        ratios['Gross Rent Multiplier'] = gross_rent_multiplier
+        ratios['Cash On Cash Returns'] = c['Net Cash Flows'] / c['Equity'][0]
+
     s = { 'bs': bs_projection,
          'is': is_projection,
          'ratios': ratios,
@@ -365,10 +585,181 @@ def investment_projection( years, purchase, loan, income, operation, sale, tax,
     return s
 
 
+def irr(cash_flows, guess=0.1, tolerance=1e-12, max_iterations=100):
+    """
+    internal rate of return, vectorized over the rows of a cash flow matrix
+
+    Newton iterations run on all rows at once, on the kernel of the backend in use; rows
+    which do not converge, or whose cash flows change sign more than once, fall back to
+    the bracketed search of _bracketed_irr, all at once.
+    Trailing zeros do not change the rate, so vectors of different lengths can be
+    padded into one matrix.
+    :param cash_flows: cash flow vector, or 2-d array with one vector per row
+    :param guess: starting rate
+    :return: rate, or array of rates one per row, NaN where there is none
+    """
+    values = np.asarray(cash_flows, dtype=float)
+    flows = np.atleast_2d(values)
+    t = np.arange(flows.shape[1])
+    rates = np.full(flows.shape[0], float(guess))
+    unsolved = backend.kernel('irr')(flows, rates, tolerance, max_iterations)
+    with np.errstate(all='ignore'):
+        # sign changes, ignoring zeros
+        signs = np.sign(flows)
+        last_nonzero = np.maximum.accumulate(np.where(signs != 0, t, 0), axis=1)
+        signs = np.take_along_axis(signs, last_nonzero, axis=1)
+        changes = np.sum((signs[:, 1:] != signs[:, :-1]) & (signs[:, :-1] != 0), 1)
+    unsolved |= ~np.isfinite(rates) | (rates <= -1) | (changes > 1)
+    rows = np.flatnonzero(unsolved)
+    if rows.size:
+        rates[rows] = np.where(changes[rows] > 0, _bracketed_irr(flows[rows]), np.nan)
+    return rates[0] if values.ndim == 1 else rates
+
+
+def _bracketed_irr(flows, high=10.0, points=400, iterations=100):
+    """
+    root of the NPV closest to 0, as np.irr picked it, one per row: bracketed on a grid of
+    rates over (-1, high], then bisection on all rows at once
+    :param flows: float64 array (rows, periods)
+    :return: array of rates, NaN where the NPV does not change sign on the grid
+    """
+    t = np.arange(flows.shape[1])
+    grid = np.geomspace(0.01, 1 + high, points) - 1
+
+    def npv(r):
+        # r, array (rows,) or (rows, points)
+        discount = np.exp(-np.log1p(r)[..., np.newaxis] * t)
+        return np.sum((flows[:, np.newaxis] if np.ndim(r) == 2 else flows) * discount, -1)
+
+    with np.errstate(all='ignore'):
+        values = npv(np.broadcast_to(grid, (flows.shape[0], points)))
+        signs = np.sign(values)
+        brackets = (signs[:, :-1] * signs[:, 1:] <= 0) & np.isfinite(values[:, :-1]) & np.isfinite(values[:, 1:])
+        brackets &= (signs[:, :-1] != 0) | (signs[:, 1:] != 0)
+        found = brackets.any(1)
+        # the bracket closest to a rate of 0
+        distance = np.where(brackets, np.abs(grid[:-1] + grid[1:]), np.inf)
+        k = np.argmin(distance, 1)
+        low, high = grid[k], grid[k + 1]
+        low_sign = signs[np.arange(len(k)), k]
+        for _ in range(iterations):
+            middle = (low + high) / 2
+            same = np.sign(npv(middle)) == low_sign
+            low = np.where(same, middle, low)
+            high = np.where(same, high, middle)
+        return np.where(found, (low + high) / 2, np.nan)
+
+
+def disposal_table(exit_years, lines, scenario):
+    """
+    sale, taxes upon sale, total returns and IRRs for a sale at the end of each exit year,
+    as arrays over the exit years
+
+    :param exit_years: array of exit years, 1 .. number of projection years
+    :param lines: dict of projection lines, annual arrays start with year 1:
+                  'asset values' (from year 0), 'total assets' and 'equity' at acquisition,
+                  'initial equity', 'tax basis', 'cumulative depreciations', 'net incomes', 'taxes',
+                  'before tax cash flows', 'after tax cash flows', 'loan balances', 'principal repayments',
+                  [optional] 'personal property depreciations' cumulative and 'suspended losses', see tax.sale_taxes
+    :param scenario: dict, selling commissions and tax rates
+    :return: dict of disposal arrays, and dict of the 'after tax' and 'before tax'
+             IRR cash flow vectors, one row per exit year
+    """
+    k = np.asarray(exit_years, dtype=int)
+    i = k - 1
+    gross_sales = lines['asset values'][k]
+    net_sales = gross_sales * (1 - scenario['Selling Commissions'])
+    tax_basis = lines['tax basis'][i]
+
+    # taxes related to sales
+    personal = lines.get('personal property depreciations')
+    suspended = lines.get('suspended losses')
+    taxes_upon_sale = tax_engine.sale_taxes(net_sales, tax_basis, lines['total assets'],
+                                            lines['cumulative depreciations'][i], scenario['Capital Gain Tax'],
+                                            scenario['Income Tax'], scenario['Depreciation Recapture Tax'],
+                                            0 if personal is None else personal[i],
+                                            0 if suspended is None else suspended[i])
+    pnl = taxes_upon_sale['Capital Gain']
+    long_term_gain = taxes_upon_sale['Long Term Gain']
+    depreciation_recapture = taxes_upon_sale['Depreciation Recapture']
+    short_term_gain = taxes_upon_sale['Short Term Gain']
+    long_term_gain_tax = taxes_upon_sale['Long Term Gain Tax']
+    short_term_gain_tax = taxes_upon_sale['Short Term Gain Tax']
+    recapture_tax = taxes_upon_sale['Depreciation Recapture Tax']
+    tax_upon_sales = taxes_upon_sale['Total Taxes']
+    net_incomes = np.cumsum(lines['net incomes'])[i]
+    taxes = np.cumsum(lines['taxes'])[i]
+    ones = np.ones(len(k))
+
+    table = {}
+    table.update({'Gross Sales': gross_sales})
+    table.update({'Sales Comissions': np.round(gross_sales * scenario['Selling Commissions'], 0)})
+    table.update({'Net Sales Before Tax': np.round(net_sales, 0)})
+    table.update({'Tax Basis': np.round(tax_basis, 0)})
+    table.update({'Capital Gain': np.round(pnl, 0)})
+    table.update({'Long Term Gain': long_term_gain})
+    table.update({'Long Term Gain Tax': long_term_gain_tax})
+    table.update({'Short Term Gain': short_term_gain})
+    table.update({'Short Term Gain Tax': short_term_gain_tax})
+    table.update({'Depreciation Recapture': depreciation_recapture})
+    table.update({'Depreciation Recapture Tax': recapture_tax})
+    for key in ('Personal Property Recapture', 'Personal Property Recapture Tax', 'Released Losses Tax Benefit'):
+        if np.any(taxes_upon_sale[key]):
+            table.update({key: taxes_upon_sale[key]})
+    table.update({'Total Taxes': tax_upon_sales})
+    table.update({'Net Sales After Tax': np.round(net_sales - tax_upon_sales)})
+    table.update({'Total Gain Before Tax': np.round(net_incomes + pnl)})
+    table.update({'Total Gain After Tax': np.round(net_incomes - taxes + pnl - tax_upon_sales)})
+    table.update({'Total Return Before Tax': np.round(table['Total Gain Before Tax'] / lines['equity'], 3)})
+    table.update({'Total Return After Tax': np.round(table['Total Gain After Tax'] / lines['equity'], 3)})
+    table.update({'Number Of Years': k})
+    table.update({'Capital Gain Tax Rate': scenario['Capital Gain Tax'] * ones})
+    table.update({'Income Tax Rate': scenario['Income Tax'] * ones})
+    table.update({'Depreciation Recapture Tax Rate': scenario['Depreciation Recapture Tax'] * ones})
+
+    # IRR cash flow vectors, one row per exit year, zero after the sale
+    held = np.arange(1, len(lines['after tax cash flows']) + 1) <= k[:, np.newaxis]
+    rows = np.arange(len(k))
+    initial_equity = lines['initial equity']
+
+    def vectors(flows, terminal):
+        v = np.zeros((len(k), held.shape[1] + 1))
+        v[:, 0] = -initial_equity
+        v[:, 1:] = flows * held
+        v[rows, k] += terminal
+        return v
+
+    sale = net_sales - lines['loan balances'][i]
+    principal = lines['principal repayments']
+    cash_flows = {'after tax': vectors(lines['after tax cash flows'], sale - tax_upon_sales),
+                  'before tax': vectors(lines['before tax cash flows'], sale),
+                  'income before tax': vectors(lines['before tax cash flows'] + principal, initial_equity),
+                  'appreciation before tax': vectors(-principal, sale),
+                  'income after tax': vectors(lines['after tax cash flows'] + principal, initial_equity),
+                  'appreciation after tax': vectors(-principal, sale - tax_upon_sales)}
+    irrs = np.round(irr(np.vstack(list(cash_flows.values()))), 3).reshape((len(cash_flows), len(k)))
+    table.update({'IRR After Tax': irrs[0]})
+    table.update({'IRR Before Tax': irrs[1]})
+    table.update({'Income Before Tax': irrs[2]})
+    table.update({'Capital Appreciation Before Tax': irrs[3]})
+    table.update({'Income After Tax': irrs[4]})
+    table.update({'Capital Appreciation After Tax': irrs[5]})
+    return table, cash_flows
+
+
+def exit_year_analysis(deal, scenario):
+    """
+    disposal metrics for a sale at the end of every year 1 .. scenario['Years'], from one projection
+    :return: pandas.DataFrame, one row per exit year
+    """
+    return investment_scenario(deal, scenario, all_exit_years=True)['exit years']
+
+
 def output_projection(result, output_location=None):
     if not output_location or output_location is None:
         output_location = util.get_output_directory()
     output_location = output_location.strip()
+    os.makedirs(output_location, exist_ok=True)
     info = result['info']
     bs = result['bs']
     cf = result['cf']
@@ -649,282 +1040,287 @@ def output_projection(result, output_location=None):
         writer.close()
 
 
-def investment_scenario(deal, scenario, print_flag=False,
-                        output_location=None):
-    if deal is None:
-        raise Exception('No deal info')
-    if scenario is None:
-        raise Exception('No scenario info')
-    years = int(scenario['Years'])
-    print("{0:d} years projection".format(years))
-
-    if years is None or not (isinstance(years, numbers.Number)) or years <= 0:
-        years = 5
-        print("Invalid number of years of projection ", years, " years assumed")
-
-    is_columns = [
-        'Net Incomes',
-        'Net Operating Incomes',
-        'Total Revenues',
-        'Rents', 'Other Incomes',
-        'Maintenance', 'Utilities',
-        'Turnover Costs',
-        'Advertising',
-        'Administrative',
-        'Realm Fees',
-        'Property Management Fees',
-        'Property Taxes', 'Other taxes',
-        'Insurances',
-        'Interests',
-        'Principal Repayments',
-        'Debt Service',
-        'Depreciations',
-        'Operating Expenses',
-        'Other Expenses',
-        'Total Expenses',
-        'Income Before Depreciation'
-    ]
-    bs_columns = ['Total Assets', 'Equity', 'Total Debt',
-                  'Cumulative Depreciations', 'Tax Basis']
-
-    cf_columns = ['Cash Flow From Operation', 'Cash Flow From Financing',
-                  'Cash Flow From Investing', 'Net Cash Flows',
-                  'Capital Expeditures']
-
-    ratio_columns = ['Capitalization Rates', 'Return On Investments',
-                     'Cash On Cash Returns', 'Gross Rent Multiplier',
-                     'Loan To Value Ratios', 'Leverage',
-                     'Debt Coverage Ratios', 'Operating Ratios',
-                     'Total Expense Ratios'
-                     ]
-
-    is_projection = pd.DataFrame(np.zeros((years + 1, len(is_columns))), columns=is_columns)
-    bs_projection = pd.DataFrame(np.zeros((years + 1, len(bs_columns))), columns=bs_columns)
-    cf_projection = pd.DataFrame(np.zeros((years + 1, len(cf_columns))), columns=cf_columns)
-    ratios = pd.DataFrame(np.zeros((years + 1, len(ratio_columns))), columns=ratio_columns)
-
-    ratios.index.name = 'Year'
-    cf_projection.index.name = 'Year'
-    is_projection.index.name = 'Year'
-    bs_projection.index.name = 'Year'
-
-    initial_loan = scenario['Loan'] * scenario['Purchase Price']
-    initial_equity = scenario['Purchase Price'] + scenario['Purchase Costs'] - initial_loan
-    interest_rate = scenario['Rate']
-
-    # get loan amortization schedules
-    amortizing_years = int(scenario['Amortization Period'])
-    payments_per_year = int(scenario['Payments Per Year'])
-    number_of_payments = amortizing_years * payments_per_year
-    if scenario['Interests Only']:
-        io_payments = scenario['IO Period'] * payments_per_year
-        mortgage_payments, interest_expenses, principal_payments, loan_balances = interest_only_loan(io_payments,
-                                    initial_loan, interest_rate, number_of_payments, payments_per_year)
-    else:
-        mortgage_payments, interest_expenses, principal_payments, loan_balances = amortize(initial_loan, interest_rate,
-                                                                                       number_of_payments,
-                                                                                       payments_per_year)
-
-    annual_loan_payments = mortgage_payments.reshape((amortizing_years, payments_per_year))
-    annual_loan_payments = np.round(np.sum(annual_loan_payments, 1), 0)
-    annual_interest_expenses = interest_expenses.reshape((amortizing_years, payments_per_year))
-    annual_interest_expenses = np.round(np.sum(annual_interest_expenses, 1), 0)
-    annual_principal_payments = principal_payments.reshape((amortizing_years, payments_per_year))
-    annual_principal_payments = np.round(np.sum(annual_principal_payments, 1), 0)
-    annual_loan_balances = loan_balances.reshape((amortizing_years, payments_per_year))
-    annual_loan_balances = np.round(annual_loan_balances[:, -1], 0)
-
-    bs_projection['Total Debt'][0] = initial_loan
-    bs_projection['Total Debt'][1:] = annual_loan_balances[:years]
-    is_projection['Interests'][0] = 0
-    is_projection['Interests'][1:] = annual_interest_expenses[:years]
-    is_projection['Principal Repayments'][0] = 0
-    is_projection['Principal Repayments'][1:] = annual_principal_payments[:years]
-    is_projection['Debt Service'][1:] = annual_loan_payments[:years]
-    cf_projection['Cash Flow From Financing'][1:] += annual_principal_payments[:years]
-
-    # get income projection
-    rent_inflation = scenario['Rent Inflation']
-    rent_per_period = scenario['Rent']
-    rent_per_year = rent_per_period * scenario['Rent Payments Per Year']
-    rent_per_year = rent_per_year * (1 - scenario['Vacancy'])
-    annual_rents = np.round(rent_per_year * np.exp(np.array(range(years)) * np.log(1 + rent_inflation)))
-    is_projection['Rents'][1:] = annual_rents
-    is_projection['Total Revenues'] = is_projection['Rents'] + is_projection['Other Incomes']
-    # asset price
-    asset_values = np.round(scenario['Purchase Price'] * np.exp((np.array(range(years + 1))) * np.log(scenario['Price Appreciation'] + 1)), 0)
-
-    bs_projection['Total Assets'] = asset_values.round(0)
-    bs_projection['Total Assets'][0] += scenario['Purchase Costs']
-    bs_projection['Equity'] = bs_projection['Total Assets'] - bs_projection['Total Debt']
-    # operating cost
-    annual_property_management_fees = scenario['Property Management Fee'] * annual_rents
-    annual_realm_fees = scenario['Realmly Fee'] * annual_rents
-    annual_turnover_costs = scenario['Tenant Turnover Costs'] * np.ones(years)
-    annual_advertising = scenario['Advertising'] * np.ones(years)
-    annual_administrative = scenario['Administrative'] * np.ones(years)
-    annual_insurance_costs = scenario['Insurance']*(np.exp(np.arange(years) *
-        np.log(1 + scenario['Insurance Inflation'])))
-    annual_utility_costs = scenario['Utilities'] * (np.exp(np.arange(years) *
-        np.log(1 + scenario['Utility Inflation'])))
-    annual_maintenance_costs = scenario['Maintenance'] * np.exp(
-        np.arange(years) * np.log(1 + scenario['Maintenance Inflation']))
-    is_projection['Utilities'][1:] = annual_utility_costs
-    annual_operating_costs = annual_property_management_fees + annual_turnover_costs + annual_insurance_costs
-    annual_operating_costs += annual_maintenance_costs
-    annual_operating_costs += annual_utility_costs
-
-    is_projection['Insurances'][1:] = np.round(annual_insurance_costs, 0)
-    is_projection['Maintenance'][1:] = annual_maintenance_costs.round(0)
-    is_projection['Turnover Costs'][1:] = annual_turnover_costs.round(0)
-    is_projection['Advertising'][1:] = annual_advertising.round(0)
-    is_projection['Administrative'][1:] = annual_administrative.round(0)
-    is_projection['Property Management Fees'][1:] = annual_property_management_fees.round(0)
-    is_projection['Realm Fees'][1:] = annual_realm_fees.round(0)
-    is_projection['Operating Expenses'] = is_projection['Insurances'] + is_projection['Maintenance'] + \
-                                          is_projection['Realm Fees'] + is_projection['Property Management Fees'] + \
-                                          is_projection['Turnover Costs'] + is_projection['Utilities'] + \
-                                          is_projection['Advertising'] + is_projection['Administrative']
-
-    # taxes
-    annual_property_taxes = scenario['Property Tax'] * (
-    np.exp(np.array(range(years)) * np.log(1 + scenario['Property Tax Inflation'])))
-    is_projection['Property Taxes'][1:] = np.round(annual_property_taxes, 0)
+IS_COLUMNS = [
+    'Net Incomes',
+    'Net Operating Incomes',
+    'Total Revenues',
+    'Rents', 'Other Incomes',
+    'Maintenance', 'Utilities',
+    'Turnover Costs',
+    'Advertising',
+    'Administrative',
+    'Realm Fees',
+    'Property Management Fees',
+    'Property Taxes', 'Other taxes',
+    'Insurances',
+    'Interests',
+    'Principal Repayments',
+    'Debt Service',
+    'Depreciations',
+    'Operating Expenses',
+    'Other Expenses',
+    'Total Expenses',
+    'Income Before Depreciation'
+]
+BS_COLUMNS = ['Total Assets', 'Equity', 'Total Debt',
+              'Cumulative Depreciations', 'Tax Basis']
+
+CF_COLUMNS = ['Cash Flow From Operation', 'Cash Flow From Financing',
+              'Cash Flow From Investing', 'Net Cash Flows',
+              'Capital Expeditures']
+
+RATIO_COLUMNS = ['Capitalization Rates', 'Return On Investments',
+                 'Cash On Cash Returns', 'Gross Rent Multiplier',
+                 'Loan To Value Ratios', 'Leverage',
+                 'Debt Coverage Ratios', 'Operating Ratios',
+                 'Total Expense Ratios'
+                 ]
+
+REFINANCE_KEYS = ('Refinances', 'Refinance Year', 'Refinance Rate', 'Refinance Amortization Period',
+                  'Refinance LTV', 'Refinance Closing Costs', 'Refinance IO Period')
+
+# keys of the Deal and Scenario sheets read by parse
+DEAL_KEYS = ('Unit','Street Number','Street Prefix','Street Suffix',
+             'Street Name','City','State','Country','Zip Code',
+             'Type','Number of Units','List Price','Property Tax',
+             'Land Value','Class','Type')
+SCENARIO_KEYS = ('Purchase Price', 'Purchase Costs',
+                 'Loan','Rate','Amortization Period','Payments Per Year', 'Interests Only', 'IO Period',
+                 'Rent','Rent Inflation', 'Rent Payments Per Year', 'Vacancy','Other Income',
+                 'Property Tax', 'Property Tax Inflation',
+                 'Insurance', 'Insurance Inflation',
+                 'Utilities', 'Utility Inflation', 'Maintenance','Maintenance Inflation',
+                 'Tenant Turnover Costs','Advertising','Administrative',
+                 'Realmly Fee', 'Property Management Fee',
+                 'Years','Selling Commissions','Other Selling Costs',
+                 'Price Appreciation',
+                 'Capital Gain Tax','Income Tax','Depreciation Recapture Tax',
+                 'Refinance Year', 'Refinance Rate', 'Refinance Amortization Period',
+                 'Refinance LTV', 'Refinance Closing Costs', 'Refinance IO Period',
+                 'Lease Term', 'Renewal Probability', 'Downtime', 'Turnover Cost', 'Acquisition Date',
+                 'Depreciation Method', 'Depreciation Period', 'Cost Segregation 5 Year', 'Cost Segregation 7 Year',
+                 'Cost Segregation 15 Year', 'Bonus Depreciation', 'Loss Carryforward'
+                 )
+INT_KEYS = ('Number of Units','Years',
+            'Rent Payment Per Year','Payments Per Year', 'IO Period')
+LOGICAL_KEYS = ('Interests Only', 'Loss Carryforward')
+TEXT_KEYS = ('Acquisition Date', 'Depreciation Method')
+
+
+# projection line items, each a function of a dict of the line items and
+# scenario values it depends on, see projection_graph for the dependencies
+
+def _years(v):
+    try:
+        years = int(v['Years'])
+    except (TypeError, ValueError):
+        years = None
+    if years is None or years <= 0:
+        raise ValueError('Years should be a positive number of years, got {0}'.format(v['Years']))
+    return years
+
+
+def _asset_values(v):
+    return np.round(inflate(v['Purchase Price'], v['Price Appreciation'], v['years'] + 1), 0)
+
+
+def _refinances(v):
+    return refinance_events(v)
+
+
+def _loan(v):
+    initial_loan = v['Loan'] * v['Purchase Price']
+    io_years = v['IO Period'] if v['Interests Only'] else 0
+    loan = loan_schedule(initial_loan, v['Rate'], int(v['Amortization Period']), int(v['Payments Per Year']),
+                         io_years, v['years'], v['refinances'], v['asset values'])
+    loan['Initial Loan'] = initial_loan
+    return loan
+
+
+def deal_rent_roll(v):
+    # expected rents and turnover costs of the units of the Rent Roll of a deal, None without one
+    rent_roll = v['deal'].get('Rent Roll')
+    if rent_roll is None or len(rent_roll) == 0:
+        return None
+    return rentroll.project_rent_roll(rent_roll, v['years'], v['Rent Inflation'],
+                                      lease_term=scenario_value(v['Lease Term']),
+                                      renewal_probability=scenario_value(v['Renewal Probability']),
+                                      downtime=scenario_value(v['Downtime']),
+                                      turnover_cost=scenario_value(v['Turnover Cost']),
+                                      acquisition_date=scenario_value(v['Acquisition Date']))
+
+
+def _operating_lines(v):
+    years = v['years']
+
+    # inflated line items, one row each: rent, insurance, utilities, maintenance, property tax
+    rent_per_year = v['Rent'] * v['Rent Payments Per Year'] * (1 - v['Vacancy'])
+    inflated = inflate([rent_per_year, v['Insurance'], v['Utilities'], v['Maintenance'], v['Property Tax']],
+                       [v['Rent Inflation'], v['Insurance Inflation'], v['Utility Inflation'],
+                        v['Maintenance Inflation'], v['Property Tax Inflation']], years)
+
+    # income and operating cost
+    lines = {}
+    lines['Rents'] = np.round(inflated[0])
+    lines['Turnover Costs'] = v['Tenant Turnover Costs'] * np.ones(years)
+    if v['rent roll'] is not None:
+        lines['Rents'] = np.round(v['rent roll']['Rents'])
+        lines['Turnover Costs'] = v['rent roll']['Turnover Costs']
+    lines['Property Management Fees'] = v['Property Management Fee'] * lines['Rents']
+    lines['Realm Fees'] = v['Realmly Fee'] * lines['Rents']
+    lines['Advertising'] = v['Advertising'] * np.ones(years)
+    lines['Administrative'] = v['Administrative'] * np.ones(years)
+    lines['Insurances'] = inflated[1]
+    lines['Utilities'] = inflated[2]
+    lines['Maintenance'] = inflated[3]
+    lines['Property Taxes'] = inflated[4]
+    operating_costs = lines['Property Management Fees'] + lines['Turnover Costs'] + lines['Insurances']
+    operating_costs += lines['Maintenance']
+    operating_costs += lines['Utilities']
+    lines['Operating Costs'] = operating_costs
 
     # operating income
-    annual_operating_incomes = annual_rents - annual_operating_costs - annual_property_taxes
-    is_projection['Net Operating Incomes'] = is_projection['Total Revenues'] - is_projection['Operating Expenses'] - \
-                                             is_projection['Property Taxes']
+    lines['Operating Incomes'] = lines['Rents'] - operating_costs - lines['Property Taxes']
+    return lines
 
-    # total costs
-    annual_total_expenses = annual_operating_costs + annual_property_taxes + annual_interest_expenses[:years]
-    is_projection['Total Expenses'][1:] = np.round(annual_total_expenses, 0)
 
+def _depreciation(v):
     # depreciation charge and tax basis
-    dep_period = 27.5 if deal['Class'] == 'Residential' else 39
-    annual_depreciations = np.round((scenario['Purchase Price'] + scenario['Purchase Costs']- deal['Land Value']) / dep_period * np.ones(years), 0)
-    cumulative_depreciations = np.cumsum(annual_depreciations)
-    tax_basis = np.ones(years) * scenario['Purchase Price'] + scenario['Purchase Costs']- cumulative_depreciations
-
-    bs_projection['Cumulative Depreciations'][0] = 0
-    bs_projection['Cumulative Depreciations'][1:] = cumulative_depreciations.round(0)
-    bs_projection['Tax Basis'][0] = bs_projection['Total Assets'][0]
-    bs_projection['Tax Basis'][1:] = tax_basis.round(0)
-    is_projection['Depreciations'][1:] = annual_depreciations
+    years = v['years']
+    deal = v['deal']
+    options = tax_engine.scenario_options(v, deal['Class'])
+    options.pop('carryforward')
+    depreciation = tax_engine.depreciation_schedule(v['Purchase Price'] + v['Purchase Costs'] - deal['Land Value'],
+                                                    years, **options)
+    cumulative_depreciations = depreciation['Cumulative Depreciations']
+    tax_basis = np.ones(years) * v['Purchase Price'] + v['Purchase Costs'] - cumulative_depreciations
+    return {'Depreciations': depreciation['Depreciations'],
+            'Cumulative Depreciations': cumulative_depreciations,
+            'Cumulative Personal Property Depreciations': depreciation['Cumulative Personal Property Depreciations'],
+            'Tax Basis': tax_basis}
+
+
+def _cash_flows(v):
+    years = v['years']
+    operating_incomes = v['operating lines']['Operating Incomes']
+    loan = v['loan']
 
     # net income
-    annual_net_incomes = annual_operating_incomes - annual_interest_expenses[:years] - annual_depreciations
-    taxes = annual_net_incomes * scenario['Income Tax']
-    is_projection['Net Incomes'] = is_projection['Net Operating Incomes'] - is_projection['Interests'] - is_projection[
-        'Depreciations']
-    is_projection['Income Before Depreciation'] = is_projection['Net Incomes'] + is_projection['Depreciations']
-
-    # cash flow
-    annual_before_tax_cash_flows = np.round(annual_operating_incomes - annual_loan_payments[:years], 2)
-    annual_after_tax_cash_flows = np.round(annual_operating_incomes - annual_loan_payments[:years] - taxes, 2)
-
-    cf_projection['Cash Flow From Financing'] = -is_projection['Debt Service']
-    cf_projection['Cash Flow From Operation'] = is_projection['Net Operating Incomes']
-    cf_projection['Net Cash Flows'][1:] = np.round(annual_operating_incomes - annual_loan_payments[:years], 2)
-
-
-    # net sale
-    net_sales = asset_values[-1] * (1 - scenario['Selling Commissions'])
-
-    disposal = {}
-    disposal.update({'Gross Sales': asset_values[-1]})
-    disposal.update({'Sales Comissions': round(asset_values[-1] * scenario['Selling Commissions'], 0)})
-    disposal.update({'Net Sales Before Tax': net_sales.round(0)})
-    disposal.update({'Tax Basis': tax_basis[-1].round(0)})
+    net_incomes = operating_incomes - loan['Interests'][:years] - v['depreciation']['Depreciations']
+    taxes, suspended_losses = tax_engine.income_taxes(net_incomes, v['Income Tax'],
+                                                      scenario_value(v['Loss Carryforward']))
+
+    # cash flow, including the net proceeds of refinances
+    refinance_proceeds = loan['Refinance Proceeds'][:years]
+    before_tax = np.round(operating_incomes - loan['Debt Service'][:years] + refinance_proceeds, 2)
+    after_tax = np.round(operating_incomes - loan['Debt Service'][:years] + refinance_proceeds - taxes, 2)
+    return {'Net Incomes': net_incomes, 'Taxes': taxes, 'Suspended Losses': suspended_losses,
+            'Before Tax Cash Flows': before_tax, 'After Tax Cash Flows': after_tax}
+
+
+def _income_statement(v):
+    years = v['years']
+    lines = v['operating lines']
+    loan = v['loan']
+    zeros = np.zeros(years + 1)
+
+    c = {}
+    c['Rents'] = _column(lines['Rents'])
+    c['Other Incomes'] = zeros
+    c['Total Revenues'] = c['Rents'] + c['Other Incomes']
+    c['Maintenance'] = _column(lines['Maintenance'].round(0))
+    c['Utilities'] = _column(lines['Utilities'])
+    c['Turnover Costs'] = _column(lines['Turnover Costs'].round(0))
+    c['Advertising'] = _column(lines['Advertising'].round(0))
+    c['Administrative'] = _column(lines['Administrative'].round(0))
+    c['Realm Fees'] = _column(lines['Realm Fees'].round(0))
+    c['Property Management Fees'] = _column(lines['Property Management Fees'].round(0))
+    c['Property Taxes'] = _column(np.round(lines['Property Taxes'], 0))
+    c['Other taxes'] = zeros
+    c['Insurances'] = _column(np.round(lines['Insurances'], 0))
+    c['Interests'] = _column(loan['Interests'][:years])
+    c['Principal Repayments'] = _column(loan['Principal Repayments'][:years])
+    c['Debt Service'] = _column(loan['Debt Service'][:years])
+    c['Depreciations'] = _column(v['depreciation']['Depreciations'])
+    c['Operating Expenses'] = c['Insurances'] + c['Maintenance'] + c['Realm Fees'] + \
+                              c['Property Management Fees'] + c['Turnover Costs'] + c['Utilities'] + \
+                              c['Advertising'] + c['Administrative']
+    c['Other Expenses'] = zeros
 
-    # taxes related to sales
-    pnl = net_sales - tax_basis[-1]
-    if pnl > 0:
-        long_term_gain = round(max(0, net_sales - bs_projection['Total Assets'][0]), 0)
-        depreciation_recapture = round(min(pnl, cumulative_depreciations[-1]), 0)
-        short_term_gain = 0
-    else:
-        depreciation_recapture = 0
-        long_term_gain = 0
-        short_term_gain = pnl
-
-    long_term_gain_tax = round(long_term_gain * scenario['Capital Gain Tax'], 0)
-    short_term_gain_tax = round(short_term_gain * scenario['Income Tax'], 0)
-    recapture_tax = round(depreciation_recapture * scenario['Depreciation Recapture Tax'], 0)
-    tax_upon_sales = round(recapture_tax + long_term_gain_tax + short_term_gain_tax, 0)
-
-    disposal.update({'Capital Gain': round(pnl, 0)})
-    disposal.update({'Long Term Gain': long_term_gain})
-    disposal.update({'Long Term Gain Tax': long_term_gain_tax})
-    disposal.update({'Short Term Gain': short_term_gain})
-    disposal.update({'Short Term Gain Tax': short_term_gain_tax})
-    disposal.update({'Depreciation Recapture': depreciation_recapture})
-    disposal.update({'Depreciation Recapture Tax': recapture_tax})
-    disposal.update({'Total Taxes': tax_upon_sales})
-    disposal.update({'Net Sales After Tax': round(net_sales - tax_upon_sales)})
-    disposal.update({'Total Gain Before Tax': round(is_projection['Net Incomes'].sum() + pnl)})
-    disposal.update(
-        {'Total Gain After Tax': round(is_projection['Net Incomes'].sum() - taxes.sum() + pnl - tax_upon_sales)})
-    disposal.update(
-        {'Total Return Before Tax': round(disposal['Total Gain Before Tax'] / bs_projection['Equity'][0], 3)})
-    disposal.update({'Total Return After Tax': round(disposal['Total Gain After Tax'] / bs_projection['Equity'][0], 3)})
-    disposal.update({'Number Of Years': years})
-    disposal.update({'Capital Gain Tax Rate': scenario['Capital Gain Tax']})
-    disposal.update({'Income Tax Rate': scenario['Income Tax']})
-    disposal.update({'Depreciation Recapture Tax Rate': scenario['Depreciation Recapture Tax']})
-
-    # IRR - internal rate of returns: after tax
-    ivec = np.zeros(years + 1)
-    ivec[0] = -initial_equity
-    ivec[1:] = annual_after_tax_cash_flows
-    ivec[-1] += net_sales - annual_loan_balances[years - 1] - tax_upon_sales
-    irr_after_tax = round(np.irr(ivec), 3)
-    disposal.update({'IRR After Tax': irr_after_tax})
-
-    # IRR - internal rate of returns: before tax
-    itvec = np.zeros(years + 1)
-    itvec[0] = -initial_equity
-    itvec[1:] = annual_before_tax_cash_flows
-    itvec[-1] += net_sales - annual_loan_balances[years - 1]
-    irr_pre_tax = round(np.irr(itvec), 3)
-    disposal.update({'IRR Before Tax': irr_pre_tax})
-
-    # dividend
-    dvec = np.zeros(years + 1)
-    dvec[0] = -initial_equity
-    dvec[1:] = annual_before_tax_cash_flows + is_projection['Principal Repayments'][1:]
-    dvec[-1] += initial_equity
-    dirr = round( np.irr(dvec), 3)
-    disposal.update({'Income Before Tax': dirr})
-    #disposal.update({'Capital Appreciation Before Tax': irr_pre_tax - dirr})
-
-    # cap gain before tax
-    dvec = np.zeros(years + 1)
-    dvec[0] = -initial_equity
-    dvec[1:] = -is_projection['Principal Repayments'][1:]
-    dvec[-1] += net_sales - annual_loan_balances[years - 1]
-    dirr = round( np.irr(dvec), 3)
-    disposal.update({'Capital Appreciation Before Tax': dirr})
-
-
-    # dividend after tax
-    dtvec = np.zeros(years + 1)
-    dtvec[0] = -initial_equity
-    dtvec[1:] = annual_after_tax_cash_flows + is_projection['Principal Repayments'][1:]
-    dtvec[-1] += initial_equity
-    dtirr = round(np.irr(dtvec), 3)
-    disposal.update({'Income After Tax': dtirr})
-    #disposal.update({'Capital Appreciation After Tax': irr_after_tax - dtirr})
-
-    # cap gain after tax
-    dvec = np.zeros(years + 1)
-    dvec[0] = -initial_equity
-    dvec[1:] = -is_projection['Principal Repayments'][1:]
-    dvec[-1] += net_sales - annual_loan_balances[years - 1] - tax_upon_sales
-    dirr = round(np.irr(dvec), 3)
-    disposal.update({'Capital Appreciation After Tax': dirr})
-
-    is_projection['Total Revenues'] = is_projection['Rents'] + is_projection['Other Incomes']
+    # total costs
+    total_expenses = lines['Operating Costs'] + lines['Property Taxes'] + loan['Interests'][:years]
+    c['Total Expenses'] = _column(np.round(total_expenses, 0))
+    c['Net Operating Incomes'] = c['Total Revenues'] - c['Operating Expenses'] - c['Property Taxes']
+    c['Net Incomes'] = c['Net Operating Incomes'] - c['Interests'] - c['Depreciations']
+    c['Income Before Depreciation'] = c['Net Incomes'] + c['Depreciations']
+    return _statement(c, IS_COLUMNS)
+
+
+def _balance_sheet(v):
+    years = v['years']
+    depreciation = v['depreciation']
+    c = {}
+    c['Total Assets'] = v['asset values'].round(0)
+    c['Total Assets'][0] += v['Purchase Costs']
+    c['Total Debt'] = _column(v['loan']['Total Debt'][:years])
+    c['Total Debt'][0] = v['loan']['Initial Loan']
+    c['Equity'] = c['Total Assets'] - c['Total Debt']
+    c['Cumulative Depreciations'] = _column(depreciation['Cumulative Depreciations'].round(0))
+    c['Tax Basis'] = _column(depreciation['Tax Basis'].round(0))
+    c['Tax Basis'][0] = c['Total Assets'][0]
+    return _statement(c, BS_COLUMNS)
+
+
+def _cash_flow_statement(v):
+    years = v['years']
+    inc = v['income statement']
+    c = {}
+    c['Cash Flow From Operation'] = inc['Net Operating Incomes'].values.copy()
+    c['Cash Flow From Financing'] = -inc['Debt Service'].values
+    c['Cash Flow From Financing'][1:] += v['loan']['Refinance Proceeds'][:years]
+    c['Cash Flow From Investing'] = np.zeros(years + 1)
+    c['Net Cash Flows'] = _column(v['cash flows']['Before Tax Cash Flows'])
+    c['Capital Expeditures'] = np.zeros(years + 1)
+    return _statement(c, CF_COLUMNS)
+
+
+def _disposal_table(v):
+    # disposal: sale, taxes upon sale and IRRs, at the end of the projection or at the end of every year
+    years = v['years']
+    bs = v['balance sheet']
+    loan = v['loan']
+    exit_years = np.arange(1, years + 1) if v['all exit years'] else np.array([years])
+    lines = {'asset values': v['asset values'],
+             'total assets': bs['Total Assets'][0],
+             'equity': bs['Equity'][0],
+             'initial equity': v['Purchase Price'] + v['Purchase Costs'] - loan['Initial Loan'],
+             'tax basis': v['depreciation']['Tax Basis'],
+             'cumulative depreciations': v['depreciation']['Cumulative Depreciations'],
+             'net incomes': v['income statement']['Net Incomes'].values[1:],
+             'taxes': v['cash flows']['Taxes'],
+             'before tax cash flows': v['cash flows']['Before Tax Cash Flows'],
+             'after tax cash flows': v['cash flows']['After Tax Cash Flows'],
+             'loan balances': loan['Total Debt'][:years],
+             'principal repayments': loan['Principal Repayments'][:years],
+             'personal property depreciations': v['depreciation']['Cumulative Personal Property Depreciations'],
+             'suspended losses': v['cash flows']['Suspended Losses']}
+    table, cash_flows = disposal_table(exit_years, lines, v)
+    return exit_years, table, cash_flows
+
+
+def _disposal(v):
+    exit_years, table, cash_flows = v['disposal table']
+    disposal = {key: values[-1] for key, values in table.items()}
+    disposal.update({'Number Of Years': v['years']})
+    return disposal
+
+
+def _ratios(v):
+    is_projection = v['income statement']
+    bs_projection = v['balance sheet']
+    cf_projection = v['cash flow statement']
+    ratios = pd.DataFrame(np.zeros((v['years'] + 1, len(RATIO_COLUMNS))), columns=RATIO_COLUMNS)
+    ratios.index.name = 'Year'
 
     # return metrics
     ratios['Capitalization Rates'] = is_projection['Net Operating Incomes'] / bs_projection['Total Assets'].shift(1)
@@ -936,30 +1332,155 @@ def investment_scenario(deal, scenario, print_flag=False,
     roi = (is_projection['Net Incomes'] + bs_projection['Equity']) / bs_projection['Equity'].shift(1) - 1
     ratios['Return On Investments'] = roi
     ratios['Leverage'] = bs_projection['Total Assets'] / bs_projection['Equity']
-    ratios['Gross Rent Multiplier'] = np.round(bs_projection['Total Assets'] / is_projection['Rents'], 1)
-    ratios['Gross Rent Multiplier'][0] = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gross_rent_multiplier = np.round(bs_projection['Total Assets'].to_numpy(dtype=float, copy=True) /
+                                         is_projection['Rents'].to_numpy(dtype=float, copy=True), 1)
+    gross_rent_multiplier[0] = 0
+    ratios['Gross Rent Multiplier'] = gross_rent_multiplier
     ratios['Cash On Cash Returns'] = cf_projection['Net Cash Flows'] / (bs_projection['Equity'][0])
+    return ratios
 
+
+def _investor(v):
     # growth of $10,000
+    bs_projection = v['balance sheet']
+    cf_projection = v['cash flow statement']
     investor = pd.DataFrame(None, index=bs_projection.index, columns=['Principal', 'Income', 'Total'])
     investor.iloc[1:, 0] = 10000*bs_projection['Equity'][1:]/bs_projection['Equity'][0]
     investor.iloc[0, 0] = 10000
-    investor.iloc[1:, 1] = 10000*cf_projection['Net Cash Flows']/bs_projection['Equity'][0]
+    investor.iloc[1:, 1] = 10000*cf_projection['Net Cash Flows'][1:]/bs_projection['Equity'][0]
     investor.iloc[0, 1] = 0
     investor.loc[:, 'Total'] = investor.loc[:, 'Principal'] + investor.loc[:, 'Income']
-
-    s = {'bs': bs_projection,
-         'is': is_projection,
-         'ratios': ratios,
-         'disposal': disposal,
-         'cf': cf_projection,
-         'info': deal,
-         'scenario':scenario,
-         'investor': investor,
-         'annual loan': annual_loan_payments,
-         'annual interests': annual_interest_expenses,
-         'annual principal payments': annual_principal_payments,
+    return investor
+
+
+def _sensitivities(v):
+    # imported here, sensitivity builds on this module
+    import Realmly.analytics.sensitivity as sensitivity
+    return sensitivity.sensitivities(v['deal'], v['scenario'])
+
+
+def _scenario(v):
+    return {key: val for key, val in v.items()
+            if not ((key in REFINANCE_KEYS or key in rentroll.RENT_ROLL_KEYS or key in tax_engine.TAX_KEYS)
+                    and val is None)}
+
+
+def _result(v):
+    exit_years, table, cash_flows = v['disposal table']
+    loan = v['loan']
+    s = {'bs': v['balance sheet'],
+         'is': v['income statement'],
+         'ratios': v['ratios'],
+         'disposal': v['disposal'],
+         'cf': v['cash flow statement'],
+         'info': v['deal'],
+         'scenario': v['scenario'],
+         'investor': v['investor'],
+         'annual loan': loan['Debt Service'],
+         'annual interests': loan['Interests'],
+         'annual principal payments': loan['Principal Repayments'],
+         'cash flows before tax': cash_flows['before tax'][-1],
+         'cash flows after tax': cash_flows['after tax'][-1],
          }
+    if v['all exit years']:
+        s['exit years'] = pd.DataFrame(table, index=pd.Index(exit_years, name='Exit Year'))
+    return s
+
+
+def _result_with_sensitivities(v):
+    s = dict(v['result'])
+    s['sensitivities'] = v['sensitivities']
+    return s
+
+
+def projection_graph(deal, scenario, all_exit_years=False, sensitivities=False):
+    """
+    the projection of investment_scenario as a dependency graph of line items
+
+    every scenario key is an input node, with 'deal' and 'all exit years'; after
+    graph.set('Insurance Inflation', 0.04) or graph.update({...}) only the line items
+    downstream of the changed inputs are computed again by graph.get('result').
+    Nodes: 'years', 'asset values', 'refinances', 'loan', 'rent roll', 'operating lines', 'depreciation',
+    'cash flows', 'income statement', 'balance sheet', 'cash flow statement',
+    'disposal table', 'disposal', 'ratios', 'investor', 'scenario', 'result',
+    and with sensitivities 'sensitivities' and 'result with sensitivities'.
+    Cached values are shared with the caller, they should not be modified in place.
+
+    :param deal: dict
+    :param scenario: dict
+    :param all_exit_years: [optional] see investment_scenario
+    :param sensitivities: [optional] see investment_scenario
+    :return: graph.Graph
+    """
+    g = Graph()
+    g.input('deal', deal)
+    g.input('all exit years', all_exit_years)
+    scenario_keys = list(scenario) + [k for k in REFINANCE_KEYS + rentroll.RENT_ROLL_KEYS + tax_engine.TAX_KEYS
+                                      if k not in scenario]
+    for key in scenario_keys:
+        g.input(key, scenario.get(key))
+
+    operating_keys = ['Rent', 'Rent Payments Per Year', 'Vacancy', 'Rent Inflation',
+                      'Insurance', 'Insurance Inflation', 'Utilities', 'Utility Inflation',
+                      'Maintenance', 'Maintenance Inflation', 'Property Tax', 'Property Tax Inflation',
+                      'Property Management Fee', 'Realmly Fee', 'Tenant Turnover Costs',
+                      'Advertising', 'Administrative']
+    loan_keys = ['Loan', 'Purchase Price', 'Rate', 'Amortization Period', 'Payments Per Year',
+                 'Interests Only', 'IO Period']
+    tax_keys = ['Selling Commissions', 'Capital Gain Tax', 'Income Tax', 'Depreciation Recapture Tax']
+
+    g.node('years', _years, ['Years'])
+    g.node('asset values', _asset_values, ['Purchase Price', 'Price Appreciation', 'years'])
+    g.node('refinances', _refinances, list(REFINANCE_KEYS))
+    g.node('loan', _loan, loan_keys + ['years', 'refinances', 'asset values'])
+    g.node('rent roll', deal_rent_roll, ['deal', 'Rent Inflation', 'years'] + list(rentroll.RENT_ROLL_KEYS))
+    g.node('operating lines', _operating_lines, operating_keys + ['years', 'rent roll'])
+    g.node('depreciation', _depreciation, ['deal', 'Purchase Price', 'Purchase Costs', 'years'] +
+           [k for k in tax_engine.TAX_KEYS if k != 'Loss Carryforward'])
+    g.node('cash flows', _cash_flows, ['operating lines', 'loan', 'depreciation', 'Income Tax', 'Loss Carryforward',
+                                       'years'])
+    g.node('income statement', _income_statement, ['operating lines', 'loan', 'depreciation', 'years'])
+    g.node('balance sheet', _balance_sheet, ['asset values', 'loan', 'depreciation', 'Purchase Costs', 'years'])
+    g.node('cash flow statement', _cash_flow_statement, ['income statement', 'cash flows', 'loan', 'years'])
+    g.node('disposal table', _disposal_table,
+           ['asset values', 'balance sheet', 'income statement', 'cash flows', 'depreciation', 'loan',
+            'Purchase Price', 'Purchase Costs', 'years', 'all exit years'] + tax_keys)
+    g.node('disposal', _disposal, ['disposal table', 'years'])
+    g.node('ratios', _ratios, ['income statement', 'balance sheet', 'cash flow statement', 'years'])
+    g.node('investor', _investor, ['balance sheet', 'cash flow statement'])
+    g.node('scenario', _scenario, scenario_keys)
+    g.node('result', _result, ['disposal table', 'loan', 'balance sheet', 'income statement', 'ratios',
+                               'disposal', 'cash flow statement', 'deal', 'scenario', 'investor',
+                               'all exit years'])
+    if sensitivities:
+        g.node('sensitivities', _sensitivities, ['deal', 'scenario'])
+        g.node('result with sensitivities', _result_with_sensitivities, ['result', 'sensitivities'])
+    return g
+
+
+def investment_scenario(deal, scenario, print_flag=False,
+                        output_location=None, all_exit_years=False, sensitivities=False):
+    """
+    projection of a deal under a scenario
+
+    :param deal: dict, from the Deal sheet
+    :param scenario: dict, from a Scenario sheet
+    :param print_flag: write the projection workbook
+    :param output_location: folder of the projection workbook
+    :param all_exit_years: [optional] also return 'exit years', the disposal metrics of a sale
+                           at the end of every year 1 .. scenario['Years'], from this one projection
+    :param sensitivities: [optional] also return 'sensitivities', the first order sensitivities of the
+                          disposal metrics and ratios to every numeric scenario key, see sensitivity.sensitivities
+    :return: dict of statements, 'bs', 'is', 'cf', 'ratios', 'disposal' ...
+    """
+    if deal is None:
+        raise ValueError('No deal info')
+    if scenario is None:
+        raise ValueError('No scenario info')
+
+    g = projection_graph(deal, scenario, all_exit_years, sensitivities)
+    s = g.get('result with sensitivities' if sensitivities else 'result')
 
     if print_flag:
         output_projection(s, output_location)
@@ -973,6 +1494,14 @@ def parse(file):
     :param file:
     :return: deal, scenarios, dict objects
     """
+    deal, checked = _parse(file)
+    return deal, checked['scenarios']
+
+
+def _parse(file):
+    """
+    the deal and the validation of the scenarios of a file, see validation.validate
+    """
     if not(os.path.exists(file)):
         alt_file = '{0:s}/Projects/{1:s}'.format(util.get_output_directory(),file)
         if not(os.path.exists(alt_file)):
@@ -982,35 +1511,18 @@ def parse(file):
 
     xls = pd.ExcelFile(alt_file)
     dsheet = xls.parse('Deal',header=0)
-    dkeys = ('Unit','Street Number','Street Prefix','Street Suffix',
-             'Street Name','City','State','Country','Zip Code',
-             'Type','Number of Units','List Price','Property Tax',
-             'Land Value','Class','Type') # deal keys
-    skeys = ('Purchase Price', 'Purchase Costs',
-             'Loan','Rate','Amortization Period','Payments Per Year', 'Interests Only', 'IO Period',
-             'Rent','Rent Inflation', 'Rent Payments Per Year', 'Vacancy','Other Income',
-             'Property Tax', 'Property Tax Inflation',
-             'Insurance', 'Insurance Inflation',
-             'Utilities', 'Utility Inflation', 'Maintenance','Maintenance Inflation',
-             'Tenant Turnover Costs','Advertising','Administrative',
-             'Realmly Fee', 'Property Management Fee',
-             'Years','Selling Commissions','Other Selling Costs',
-             'Price Appreciation',
-             'Capital Gain Tax','Income Tax','Depreciation Recapture Tax'
-             ) # scenario keys
-    int_keys = ('Number of Units','Years',
-                'Rent Payment Per Year','Payments Per Year', 'IO Period')
-    logical_keys = ['Interests Only']
     deal = {}
-    for key in dkeys:
+    for key in DEAL_KEYS:
         val = util.get_value_by_key(dsheet,key,'Key','Value')
         if isinstance(val, np.ndarray) and val.size == 1:
             val = val[0]
-            if key in int_keys:
+            if key in INT_KEYS:
                 val = int(val)
             if val is np.nan:
                 val = ''
         deal.update({key:val})
+    if 'Rent Roll' in xls.sheet_names:
+        deal.update({'Rent Roll': xls.parse('Rent Roll', header=0).dropna(how='all')})
     scenario_sheets = [s for s in xls.sheet_names if "SCENARIO" in s.upper()]
     scenarios = []
     for sheet_name in scenario_sheets:
@@ -1018,25 +1530,18 @@ def parse(file):
         scenario = {}
         print("Sheet: {0:s}".format(sheet_name.title()))
         try:
-            for key in skeys:
+            for key in SCENARIO_KEYS:
                 val = util.get_value_by_key(sheet, key, 'Key', 'Value')
-                if isinstance(val,np.ndarray) and val.size == 1:
-                    val = val[0]
-                    if key in int_keys:
-                        val = int(val)
-                if key in logical_keys:
-                    if val > 0:
-                        val = True
-                    else:
-                        val = False
+                if isinstance(val,np.ndarray) and val.size <= 1:
+                    val = val[0] if val.size else None
                 scenario.update({key: val})
             if scenario:
                 scenario.update({'Scenario Name': sheet_name.title()})
                 scenarios.append(scenario)
         except Exception as e:
-            print(e)
-            raise e
-    return deal, scenarios
+            raise ValueError('{0:s}, sheet {1:s}: {2}'.format(alt_file, sheet_name, e)) from e
+    # integers, flags and numbers of all the sheets at once, see validation
+    return deal, validation.validate(scenarios)
 
 
 def project(file, print_flag=False, output_location=None):
@@ -1054,7 +1559,12 @@ def project(file, print_flag=False, output_location=None):
     if output_location is None:
         output_location = os.path.dirname(file)
         print(output_location)
-    deal, scenarios = parse(file)
+    deal, checked = _parse(file)
+    scenarios, messages = checked['scenarios'], checked['messages']
+    # every scenario checked before the first projection
+    rejected = ['{0}: {1}'.format(s.get('Scenario Name'), m) for s, m in zip(scenarios, messages) if m]
+    if rejected:
+        raise ValueError('{0:s}, invalid scenarios, {1:s}'.format(file, ' | '.join(rejected)))
     projections = [None]*len(scenarios)
     for i, s in enumerate(scenarios):
         projections[i] = investment_scenario(deal, s, print_flag, output_location)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+dependency graph of line items:
+    input nodes hold values, other nodes are functions of the nodes they depend on
+    values are cached until an upstream input changes, so after an edit only the
+    downstream nodes are computed again
+
+"""
+
+import numpy as np
+
+
+def _unchanged(old, new):
+    if old is new:
+        return True
+    try:
+        return type(old) == type(new) and bool(np.all(old == new))
+    except Exception:
+        return False
+
+
+class Graph(object):
+    """
+    g = Graph()
+    g.input('rate', 0.05)
+    g.node('interest', lambda v: v['rate'] * 1000, ['rate'])
+    g.get('interest')       # computes
+    g.set('rate', 0.06)     # drops 'interest' and whatever depends on it
+    g.get('interest')       # computes again
+
+    node functions get one argument, a dict of the values of their dependencies
+    """
+
+    def __init__(self):
+        self._functions = {}
+        self._dependencies = {}
+        self._dependents = {}
+        self._values = {}
+        self.evaluations = 0
+
+    def __contains__(self, name):
+        return name in self._functions
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __setitem__(self, name, value):
+        self.set(name, value)
+
+    def input(self, name, value=None):
+        """
+        add an input node
+        """
+        self._add(name, None, ())
+        self._values[name] = value
+
+    def node(self, name, function, dependencies):
+        """
+        add a computed node
+        :param name:
+        :param function: function of a dict, dependency name -> value
+        :param dependencies: names of the nodes the function reads, added before
+        """
+        missing = [d for d in dependencies if d not in self._functions]
+        if missing:
+            raise KeyError('Unknown dependencies of {0:s}: {1}'.format(name, missing))
+        self._add(name, function, tuple(dependencies))
+
+    def _add(self, name, function, dependencies):
+        if name in self._functions:
+            raise KeyError('Node {0:s} already defined'.format(name))
+        self._functions[name] = function
+        self._dependencies[name] = dependencies
+        self._dependents[name] = []
+        for d in dependencies:
+            self._dependents[d].append(name)
+
+    def is_input(self, name):
+        return name in self._functions and self._functions[name] is None
+
+    def inputs(self):
+        return [name for name in self._functions if self.is_input(name)]
+
+    def get(self, name):
+        """
+        value of a node, computed with its dependencies if not cached
+        """
+        if name in self._values:
+            return self._values[name]
+        if name not in self._functions:
+            raise KeyError(name)
+        values = {d: self.get(d) for d in self._dependencies[name]}
+        value = self._functions[name](values)
+        self.evaluations += 1
+        self._values[name] = value
+        return value
+
+    def set(self, name, value):
+        """
+        change an input; the nodes downstream of it are dropped when the value differs
+        """
+        if not self.is_input(name):
+            raise KeyError('{0:s} is not an input'.format(name))
+        if _unchanged(self._values.get(name), value):
+            return
+        self._values[name] = value
+        self.invalidate(name)
+
+    def update(self, values):
+        """
+        change several inputs
+        :param values: dict, input name -> value
+        """
+        for name, value in values.items():
+            self.set(name, value)
+
+    def downstream(self, name):
+        """
+        names of all nodes depending, directly or not, on a node
+        """
+        found = set()
+        stack = list(self._dependents[name])
+        while stack:
+            n = stack.pop()
+            if n not in found:
+                found.add(n)
+                stack.extend(self._dependents[n])
+        return found
+
+    def invalidate(self, name):
+        """
+        drop the cached values downstream of a node
+        """
+        for n in self.downstream(name):
+            self._values.pop(n, None)
+
+    def cached(self, name):
+        return name in self._values
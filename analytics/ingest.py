@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+streaming ingest of listing feeds:
+    CSV or JSON lines feeds read in chunks, columns mapped to the Deal and Scenario keys of parse
+    every listing projected under each scenario template
+    scenarios of a chunk validated at once, the invalid ones rejected before the projection
+    fixed size batches projected and written out as they come, memory stays flat
+
+usage:
+    python -m Realmly.analytics.ingest listings.csv -t template.xlsx -o results.csv -j 8
+
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.validation as validation
+from Realmly.analytics.batch import SUMMARY_KEYS, json_value
+
+ROW_KEY = 'Row'
+# numeric keys of the Deal sheet
+DEAL_NUMBER_KEYS = ('Number of Units', 'List Price', 'Land Value', 'Property Tax')
+
+
+def feed_format(path):
+    """
+    'csv' or 'jsonl' from the file name, compressed files included: listings.jsonl.gz is 'jsonl'
+    """
+    name = path.lower()
+    for ext in ('.gz', '.bz2', '.zip', '.xz'):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    return 'jsonl' if name.endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+
+
+def read_feed(path, chunk_size=10000, file_format=None, text_columns=('Zip Code',)):
+    """
+    read a feed in chunks
+    :param path: CSV or JSON lines file, may be compressed
+    :param chunk_size: rows per chunk
+    :param file_format: [optional] 'csv' or 'jsonl', default from the file name
+    :param text_columns: [optional] CSV columns read as strings, zip codes keep their leading zeros
+    :return: generator of pandas.DataFrame
+    """
+    file_format = file_format or feed_format(path)
+    if file_format == 'jsonl':
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False)
+    elif file_format == 'csv':
+        reader = pd.read_csv(path, chunksize=chunk_size, dtype={c: str for c in text_columns})
+    else:
+        raise ValueError('Unknown feed format {0}, expected csv or jsonl'.format(file_format))
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def map_columns(chunk, mapping=None):
+    """
+    rename feed columns to Deal and Scenario keys
+    :param chunk: pandas.DataFrame
+    :param mapping: [optional] dict, feed column -> key, e.g. {'zip': 'Zip Code', 'price': 'List Price'}
+    :return: pandas.DataFrame
+    """
+    if mapping:
+        chunk = chunk.rename(columns=mapping)
+    return chunk.loc[:, ~chunk.columns.duplicated()]
+
+
+def _coerce(chunk):
+    """
+    the conversions of parse of the deal keys, on whole columns: numbers and integers;
+    the scenario keys are normalized by validation
+    """
+    chunk = chunk.copy()
+    for key in DEAL_NUMBER_KEYS:
+        if key in chunk.columns:
+            values = pd.to_numeric(chunk[key], errors='coerce')
+            if key in fin.INT_KEYS:
+                values = values.round().astype('Int64')
+            chunk[key] = values
+    return chunk
+
+
+def _scenarios(chunk, template):
+    """
+    scenario keys of a template and a chunk of listings, one row per listing: the value of the
+    listing, the template value when the listing has none
+    """
+    frame = pd.DataFrame(index=chunk.index)
+    for key in fin.SCENARIO_KEYS:
+        if key in chunk.columns:
+            frame[key] = chunk[key].where(~validation.blank(chunk[key]), template.get(key))
+        elif key in template:
+            frame[key] = template[key]
+    if 'List Price' in chunk.columns:
+        price = frame['Purchase Price'] if 'Purchase Price' in frame.columns else pd.Series(None, index=chunk.index)
+        frame['Purchase Price'] = price.where(~validation.blank(price), chunk['List Price'])
+    return frame
+
+
+def _value(val):
+    if val is pd.NA or (isinstance(val, float) and np.isnan(val)):
+        return None
+    return json_value(val)
+
+
+def listings(chunk, templates, id_column=None, first_row=0):
+    """
+    deals and scenarios of a chunk of listings, one scenario per listing and template
+
+    deal keys come from the listing; a scenario is a template updated with the scenario
+    keys the listing has, with 'Purchase Price' the 'List Price' when neither has one.
+    The scenarios of each template are validated for the whole chunk at once
+    :param chunk: pandas.DataFrame, columns already mapped
+    :param templates: list of scenario dicts
+    :param id_column: [optional] feed column identifying listings, copied to the results
+    :param first_row: row number of the first listing of the chunk in the feed
+    :return: list of (ids, deal, scenario, error), ids a dict of 'Row' and the id column,
+             error None for a valid scenario, the validation errors otherwise
+    """
+    chunk = _coerce(chunk)
+    deal_keys = [k for k in dict.fromkeys(fin.DEAL_KEYS) if k in chunk.columns]
+    checked = [validation.validate(_scenarios(chunk, template)) for template in templates]
+    rows = chunk.to_dict('records')
+    items = []
+    for n, row in enumerate(rows):
+        ids = {ROW_KEY: first_row + n}
+        if id_column:
+            ids[id_column] = _value(row.get(id_column))
+        deal = {}
+        for key in deal_keys:
+            val = _value(row[key])
+            deal[key] = '' if val is None else val
+        for template, result in zip(templates, checked):
+            scenario = dict(template)
+            scenario.update(result['scenarios'][n])
+            items.append((ids, deal, scenario, result['messages'][n]))
+    return items
+
+
+def batches(path, templates, mapping=None, batch_size=1000, chunk_size=10000, id_column=None, file_format=None):
+    """
+    stream a feed as fixed size batches of (ids, deal, scenario, error), the last batch may be smaller
+    :return: generator of lists
+    """
+    batch = []
+    first_row = 0
+    text_columns = ['Zip Code'] + [c for c, key in (mapping or {}).items() if key == 'Zip Code']
+    for chunk in read_feed(path, chunk_size, file_format, text_columns):
+        items = listings(map_columns(chunk, mapping), templates, id_column, first_row)
+        first_row += len(chunk)
+        for item in items:
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def project_batch(batch, metrics=SUMMARY_KEYS):
+    """
+    project a batch, never raises; invalid scenarios are not projected
+    :param batch: list of (ids, deal, scenario, error)
+    :param metrics: disposal keys of the results
+    :return: list of dicts, one row per item: ids, 'Scenario Name', 'Status' 'ok', 'failed' or 'invalid',
+             'Error' and the metrics
+    """
+    rows = []
+    for ids, deal, scenario, error in batch:
+        row = dict(ids)
+        row.update({'Scenario Name': scenario.get('Scenario Name'), 'Status': 'ok', 'Error': None})
+        if error:
+            row.update({'Status': 'invalid', 'Error': error})
+            rows.append(row)
+            continue
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = fin.investment_scenario(deal, scenario)
+            row.update({k: json_value(result['disposal'][k]) for k in metrics})
+        except Exception as err:
+            row.update({'Status': 'failed', 'Error': '{0:s}: {1}'.format(type(err).__name__, err)})
+        rows.append(row)
+    return rows
+
+
+def load_templates(path):
+    """
+    scenario templates: the Scenario sheets of a workbook, or a JSON list of scenario dicts
+    """
+    if path.lower().endswith('.json'):
+        with open(path) as fh:
+            templates = json.load(fh)
+        return templates if isinstance(templates, list) else [templates]
+    with contextlib.redirect_stdout(io.StringIO()):
+        deal, templates = fin.parse(path)
+    return templates
+
+
+def _progress(counts, start):
+    done = counts['ok'] + counts['failed'] + counts['invalid']
+    elapsed = time.time() - start
+    sys.stderr.write('\r{0:d} projected  ok {1:d}  failed {2:d}  invalid {3:d}  elapsed {4:s}  {5:.0f}/s '.format(
+        done, counts['ok'], counts['failed'], counts['invalid'], time.strftime('%H:%M:%S', time.gmtime(elapsed)),
+        done / elapsed if elapsed else 0))
+    sys.stderr.flush()
+
+
+def run(path, templates, output=None, mapping=None, batch_size=1000, chunk_size=10000, processes=1,
+        id_column=None, metrics=SUMMARY_KEYS, file_format=None, progress=False):
+    """
+    project every listing of a feed under every template
+
+    batches are projected as they are read, at most 2 per worker process in flight, and
+    their results appended to the output file in feed order
+    :param path: CSV or JSON lines feed
+    :param templates: list of scenario dicts, see load_templates
+    :param output: [optional] CSV file of the results; None returns them, all in memory
+    :param mapping: [optional] dict, feed column -> Deal or Scenario key
+    :param batch_size: projections per batch
+    :param chunk_size: feed rows read at a time
+    :param processes: worker processes, 1 runs in this process, None all cores
+    :param id_column: [optional] feed column identifying listings
+    :param metrics: disposal keys of the results
+    :param file_format: [optional] 'csv' or 'jsonl', default from the file name
+    :param progress: show a progress line on stderr
+    :return: dict of counts 'ok', 'failed' and 'invalid', with 'results', a pandas.DataFrame, when output is None
+    """
+    if not templates:
+        raise ValueError('No scenario template')
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    counts = {'ok': 0, 'failed': 0, 'invalid': 0}
+    # the same columns in every batch, one without any projection included
+    columns = [ROW_KEY] + ([id_column] if id_column else []) + ['Scenario Name', 'Status', 'Error'] + list(metrics)
+    frames = []
+    header = True
+    start = time.time()
+
+    def write(rows):
+        nonlocal header
+        frame = pd.DataFrame(rows, columns=columns)
+        for status in counts:
+            counts[status] += int((frame['Status'] == status).sum())
+        if output:
+            frame.to_csv(output, mode='w' if header else 'a', header=header, index=False)
+            header = False
+        else:
+            frames.append(frame)
+        if progress:
+            _progress(counts, start)
+
+    stream = batches(path, templates, mapping, batch_size, chunk_size, id_column, file_format)
+    workers = processes or os.cpu_count()
+    if workers == 1:
+        for batch in stream:
+            write(project_batch(batch, metrics))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = collections.deque()
+            for batch in stream:
+                in_flight.append(pool.submit(project_batch, batch, metrics))
+                if len(in_flight) >= 2 * workers:
+                    write(in_flight.popleft().result())
+            while in_flight:
+                write(in_flight.popleft().result())
+    if progress:
+        sys.stderr.write('\n')
+    if output is None:
+        counts['results'] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Realmly.analytics.ingest',
+                                     description='Project the listings of a CSV or JSON lines feed.')
+    parser.add_argument('feed', help='CSV or JSON lines feed of listings')
+    parser.add_argument('-t', '--templates', required=True,
+                        help='workbook with Scenario sheets, or JSON list of scenarios')
+    parser.add_argument('-o', '--output', required=True, help='CSV file of the results')
+    parser.add_argument('-m', '--mapping', default=None, help='JSON file, feed column -> Deal or Scenario key')
+    parser.add_argument('--id', default=None, help='feed column identifying listings')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000, help='projections per batch')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='feed rows read at a time')
+    parser.add_argument('-j', '--processes', type=int, default=1, help='worker processes, 0 for all cores')
+    parser.add_argument('-q', '--quiet', action='store_true', help='no progress display')
+    args = parser.parse_args(argv)
+
+    mapping = None
+    if args.mapping:
+        with open(args.mapping) as fh:
+            mapping = json.load(fh)
+    counts = run(args.feed, load_templates(args.templates), args.output, mapping, args.batch_size,
+                 args.chunk_size, args.processes or None, args.id, progress=not args.quiet)
+    sys.stderr.write('Projected {0:d} scenarios, {1:d} failed, {2:d} invalid, results {3:s}\n'.format(
+        counts['ok'] + counts['failed'], counts['failed'], counts['invalid'], args.output))
+    return 1 if counts['failed'] or counts['invalid'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
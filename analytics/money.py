@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+money as integer cents:
+    int64 arrays, exact sums
+    explicit rounding modes, applied with vectorized array operations
+    amortization schedules in cents, vectorized across loans
+
+rounding modes:
+    'half_even' ties to even, the rounding of round() and np.round
+    'half_up'   ties away from zero
+    'half_down' ties toward zero
+    'floor', 'ceiling', 'truncate'
+
+"""
+
+import numpy as np
+
+ROUNDING_MODES = ('half_even', 'half_up', 'half_down', 'floor', 'ceiling', 'truncate')
+DEFAULT_ROUNDING = 'half_even'
+
+
+def round_to_int(x, mode=DEFAULT_ROUNDING):
+    """
+    round floats to integers
+    :param x: float or array
+    :param mode: rounding mode, see ROUNDING_MODES
+    :return: int64 array
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if mode == 'half_even':
+        r = np.rint(x)
+    elif mode in ('half_up', 'half_down'):
+        magnitude = np.abs(x)
+        whole = np.floor(magnitude)
+        fraction = magnitude - whole
+        up = fraction >= 0.5 if mode == 'half_up' else fraction > 0.5
+        r = np.copysign(whole + up, x)
+    elif mode == 'floor':
+        r = np.floor(x)
+    elif mode == 'ceiling':
+        r = np.ceil(x)
+    elif mode == 'truncate':
+        r = np.trunc(x)
+    else:
+        raise ValueError('Unknown rounding mode {0}, expected one of {1}'.format(mode, ROUNDING_MODES))
+    return r.astype(np.int64)
+
+
+def to_cents(dollars, mode=DEFAULT_ROUNDING):
+    """
+    dollars to integer cents
+
+    dollars*100 within 1e-6 of a whole cent is that cent, so 0.29 is 29 cents in every mode
+    :param dollars: float or array
+    :param mode: rounding mode of fractions of cents
+    :return: int64 array
+    """
+    cents = np.asarray(dollars, dtype=np.float64) * 100
+    whole = np.rint(cents)
+    cents = np.where(np.abs(cents - whole) < 1e-6, whole, cents)
+    return round_to_int(cents, mode)
+
+
+def to_dollars(cents):
+    """
+    integer cents to float dollars
+    """
+    return np.asarray(cents, dtype=np.int64) / 100
+
+
+def div_round(numerator, denominator, mode=DEFAULT_ROUNDING):
+    """
+    integer division rounded by mode, integer operations only
+    div_round(cents, 100) gives whole dollars
+    :param numerator: integer array
+    :param denominator: positive integer
+    :param mode: rounding mode
+    :return: int64 array
+    """
+    n = np.asarray(numerator, dtype=np.int64)
+    d = np.int64(denominator)
+    if d <= 0:
+        raise ValueError('Denominator should be a positive integer')
+    if mode == 'floor':
+        return n // d
+    if mode == 'ceiling':
+        return -((-n) // d)
+    if mode not in ROUNDING_MODES:
+        raise ValueError('Unknown rounding mode {0}, expected one of {1}'.format(mode, ROUNDING_MODES))
+
+    # round the magnitude, then restore the sign
+    q, r = np.divmod(np.abs(n), d)
+    if mode == 'half_even':
+        q = q + ((2 * r > d) | ((2 * r == d) & (q % 2 == 1)))
+    elif mode == 'half_up':
+        q = q + (2 * r >= d)
+    elif mode == 'half_down':
+        q = q + (2 * r > d)
+    return np.where(n < 0, -q, q)
+
+
+def level_payment(principal_cents, rate_per_period, number_of_payments, begin_or_end='end', mode=DEFAULT_ROUNDING):
+    """
+    fixed payment of an amortizing loan in cents, vectorized across loans
+    :param principal_cents: int64 array
+    :param rate_per_period: array of interest rates per payment period
+    :param number_of_payments: payments to repay the loan
+    :param begin_or_end: 'end' payments in arrears, 'begin' in advance
+    :param mode: rounding mode of the payment
+    :return: int64 array
+    """
+    principal = np.asarray(principal_cents, dtype=np.float64)
+    rate = np.asarray(rate_per_period, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = -np.expm1(-number_of_payments * np.log1p(rate)) / rate
+        if begin_or_end in ('begin', 1):
+            annuity = annuity * (1 + rate)
+    annuity = np.where(rate == 0, number_of_payments, annuity)
+    return round_to_int(principal / annuity, mode)
+
+
+def amortize_cents(principal_cents, rate_per_period, number_of_payments, payment_cents=None,
+                   prepayment_cents=None, begin_or_end='end', mode=DEFAULT_ROUNDING):
+    """
+    amortization schedules in integer cents, one row per loan
+
+    each period: interest = balance * rate rounded by mode,
+    principal = min(balance, payment - interest + prepayment); a few cents left by the rounding
+    of the payment stay in the last balance. The schedule is bit exact on every platform and
+    every backend, see backend.
+    :param principal_cents: int64 array of loan amounts
+    :param rate_per_period: array of interest rates per payment period, one per loan,
+                            or (loans, payments) for rates changing by period
+    :param number_of_payments:
+    :param payment_cents: [optional] payment per loan, default the level payment,
+                          or (loans, payments) for payments changing by period
+    :param prepayment_cents: [optional] additional principal, (loans, payments)
+    :param begin_or_end: default 'end'
+    :param mode: rounding mode
+    :return: int64 arrays (loans, payments): total payments, interests, principal payments, balances
+    """
+    balance = np.atleast_1d(np.asarray(principal_cents, dtype=np.int64)).copy()
+    loans = balance.size
+    rates = np.broadcast_to(np.asarray(rate_per_period, dtype=np.float64).reshape((-1, 1)) if
+                            np.ndim(rate_per_period) < 2 else np.asarray(rate_per_period, dtype=np.float64),
+                            (loans, number_of_payments))
+    if payment_cents is None:
+        payment_cents = level_payment(balance, rates[:, 0], number_of_payments, begin_or_end, mode)
+    payments = np.broadcast_to(np.asarray(payment_cents, dtype=np.int64).reshape((-1, 1)) if
+                               np.ndim(payment_cents) < 2 else np.asarray(payment_cents, dtype=np.int64),
+                               (loans, number_of_payments))
+    if prepayment_cents is None:
+        prepayments = np.zeros((loans, number_of_payments), dtype=np.int64)
+    else:
+        prepayments = np.broadcast_to(np.asarray(prepayment_cents, dtype=np.int64), (loans, number_of_payments))
+
+    # imported here, backend builds on this module
+    import Realmly.analytics.backend as backend
+    interests, principal_payments, balances = backend.kernel('amortize')(balance, rates, payments, prepayments, mode)
+    return interests + principal_payments, interests, principal_payments, balances
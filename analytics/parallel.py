@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+parallel sweeps of investment_scenario over a process pool:
+    input parameters and output metrics live in shared memory,
+    workers read their rows and write their metrics in place by index,
+    only row ranges travel through the pool's pipes
+
+"""
+
+import contextlib
+import io
+import itertools
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.financials as fin
+
+DEFAULT_METRICS = ('IRR Before Tax', 'IRR After Tax', 'Total Return After Tax', 'Minimum Debt Coverage Ratio')
+
+
+def minimum_dscr(result):
+    """
+    lowest debt coverage ratio over the projection years
+    """
+    dscr = result['ratios']['Debt Coverage Ratios'].values[1:]
+    dscr = dscr[np.isfinite(dscr)]
+    return dscr.min() if dscr.size else np.nan
+
+
+DERIVED_METRICS = {'Minimum Debt Coverage Ratio': minimum_dscr}
+
+
+def grid(**axes):
+    """
+    cartesian product of parameter values
+    grid(Rate=[0.04, 0.05], Vacancy=[0.05, 0.1]) gives 4 rows
+    :param axes: scenario key -> list of values, keys with spaces as grid(**{'Rent Inflation': [...]})
+    :return: pandas.DataFrame, one row per combination
+    """
+    keys = list(axes)
+    return pd.DataFrame(list(itertools.product(*(axes[k] for k in keys))), columns=keys)
+
+
+def metric_value(result, metric):
+    """
+    value of a metric of a projection: a key of 'disposal', a derived metric name, or a function of the result
+    """
+    if callable(metric):
+        return metric(result)
+    if metric in DERIVED_METRICS:
+        return DERIVED_METRICS[metric](result)
+    return result['disposal'][metric]
+
+
+def metric_name(metric):
+    return metric if isinstance(metric, str) else metric.__name__
+
+
+def _caster(value):
+    if isinstance(value, (bool, np.bool_)):
+        return lambda x: bool(x)
+    if isinstance(value, (int, np.integer)):
+        return lambda x: int(round(x))
+    return float
+
+
+def evaluate_rows(deal, scenario, keys, inputs, outputs, metrics, rows):
+    """
+    project rows of a parameter table, writing the metrics of row i to outputs[i]
+    a failing row leaves NaN in its outputs, and its error in the failures
+    :param deal: dict
+    :param scenario: base scenario, dict
+    :param keys: scenario keys, one per input column
+    :param inputs: array (number of rows, number of keys)
+    :param outputs: array (number of rows, number of metrics)
+    :param metrics: list of metrics, see metric_value
+    :param rows: iterable of row numbers
+    :return: dict, row number -> error of the failing rows
+    """
+    casters = [_caster(scenario.get(k, 0.0)) for k in keys]
+    failures = {}
+    for i in rows:
+        s = dict(scenario)
+        s.update({k: cast(x) for k, cast, x in zip(keys, casters, inputs[i])})
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = fin.investment_scenario(deal, s)
+            outputs[i] = [metric_value(result, m) for m in metrics]
+        except Exception as err:
+            outputs[i] = np.nan
+            failures[i] = '{0:s}: {1}'.format(type(err).__name__, err)
+    return failures
+
+
+# per worker process state, set once by _attach
+_worker = {}
+
+
+def _attach(input_name, output_name, shape, deal, scenario, keys, metrics):
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    _worker.update({
+        'shm': (input_shm, output_shm),
+        'inputs': np.ndarray((shape[0], len(keys)), dtype=np.float64, buffer=input_shm.buf),
+        'outputs': np.ndarray((shape[0], len(metrics)), dtype=np.float64, buffer=output_shm.buf),
+        'deal': deal, 'scenario': scenario, 'keys': keys, 'metrics': metrics})
+
+
+def _run_chunk(bounds):
+    w = _worker
+    return evaluate_rows(w['deal'], w['scenario'], w['keys'], w['inputs'], w['outputs'], w['metrics'],
+                         range(*bounds))
+
+
+def sweep(deal, scenario, parameters, metrics=DEFAULT_METRICS, processes=None, chunk_size=None):
+    """
+    project a scenario for every row of a parameter table on a process pool
+
+    :param deal: dict
+    :param scenario: base scenario, dict; each row overrides some of its keys
+    :param parameters: pandas.DataFrame, or dict of equal length arrays, columns are scenario keys
+    :param metrics: list of metrics, disposal keys, names of DERIVED_METRICS or functions of a projection
+    :param processes: [optional] worker processes, default os.cpu_count(); 1 runs in this process
+    :param chunk_size: [optional] rows per task
+    :return: pandas.DataFrame, the parameters followed by one column per metric, and 'Error',
+             None for the rows projected, the error of the rows whose projection raised
+    """
+    parameters = pd.DataFrame(parameters)
+    keys = list(parameters.columns)
+    metrics = list(metrics)
+    n = len(parameters)
+    processes = processes or os.cpu_count()
+    if not chunk_size:
+        chunk_size = max(1, -(-n // (processes * 8)))
+    shape = (n, len(metrics))
+
+    if processes == 1 or n <= chunk_size:
+        outputs = np.full(shape, np.nan)
+        failures = evaluate_rows(deal, scenario, keys, parameters.values.astype(np.float64), outputs, metrics,
+                                 range(n))
+    else:
+        input_shm = shared_memory.SharedMemory(create=True, size=max(1, n * len(keys) * 8))
+        output_shm = shared_memory.SharedMemory(create=True, size=max(1, n * len(metrics) * 8))
+        try:
+            inputs = np.ndarray((n, len(keys)), dtype=np.float64, buffer=input_shm.buf)
+            inputs[:] = parameters.values
+            shared_outputs = np.ndarray(shape, dtype=np.float64, buffer=output_shm.buf)
+            shared_outputs[:] = np.nan
+            chunks = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+            with mp.Pool(processes, initializer=_attach,
+                         initargs=(input_shm.name, output_shm.name, shape, deal, scenario, keys, metrics)) as pool:
+                failures = {}
+                for chunk_failures in pool.imap_unordered(_run_chunk, chunks):
+                    failures.update(chunk_failures)
+            outputs = shared_outputs.copy()
+            del inputs, shared_outputs
+        finally:
+            input_shm.close()
+            input_shm.unlink()
+            output_shm.close()
+            output_shm.unlink()
+
+    result = parameters.copy()
+    for j, metric in enumerate(metrics):
+        result[metric_name(metric)] = outputs[:, j]
+    errors = np.full(n, None, dtype=object)
+    errors[list(failures)] = list(failures.values())
+    result['Error'] = pd.Series(errors, index=result.index, dtype=object)
+    return result
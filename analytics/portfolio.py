@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+portfolio of properties:
+    consolidated income statement, balance sheet and cash flow
+    portfolio IRR and cash on cash returns
+
+each property is a result of financials.investment_scenario, acquired at its
+own acquisition year and sold at the end of its projection years
+
+"""
+
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.financials as fin
+
+
+def _timeline(projections, acquisition_years):
+    """
+    map the rows of all projections onto one calendar
+    :return: first calendar year, number of calendar rows, starting row and number of rows of each projection
+    """
+    lengths = np.array([len(p['is']) for p in projections])
+    if acquisition_years is None:
+        acquisition_years = np.zeros(len(projections), dtype=int)
+    acquisition_years = np.asarray(acquisition_years, dtype=int)
+    if acquisition_years.shape != lengths.shape:
+        raise ValueError('One acquisition year per projection expected')
+    first_year = acquisition_years.min()
+    starts = acquisition_years - first_year
+    horizon = int((starts + lengths).max())
+    return first_year, horizon, starts, lengths
+
+
+def _rows(starts, lengths):
+    """
+    calendar row of every row of the stacked projections
+    """
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def _consolidate(blocks, rows, horizon):
+    """
+    add up stacked rows by calendar row, column by column
+    """
+    values = np.concatenate(blocks)
+    if values.ndim == 1:
+        return np.bincount(rows, weights=values, minlength=horizon)
+    total = np.zeros((horizon, values.shape[1]))
+    for j in range(values.shape[1]):
+        total[:, j] = np.bincount(rows, weights=values[:, j], minlength=horizon)
+    return total
+
+
+def consolidate(projections, acquisition_years=None):
+    """
+    consolidate many property projections into portfolio statements
+
+    :param projections: list of results of investment_scenario
+    :param acquisition_years: [optional] acquisition year of each property, calendar year or offset,
+                              default all acquired in year 0
+    :return: dict with consolidated 'bs', 'is', 'cf', 'ratios', 'disposal',
+             'cash flows before tax' and 'cash flows after tax'
+    """
+    if not projections:
+        raise ValueError('No projections to consolidate')
+    first_year, horizon, starts, lengths = _timeline(projections, acquisition_years)
+    rows = _rows(starts, lengths)
+    index = pd.Index(first_year + np.arange(horizon), name='Year')
+
+    s = {}
+    for key in ('is', 'bs', 'cf'):
+        columns = projections[0][key].columns
+        total = _consolidate([p[key].values for p in projections], rows, horizon)
+        s[key] = pd.DataFrame(total, index=index, columns=columns)
+
+    # portfolio cash flow vectors: equity in at acquisition, sale proceeds at each sale year
+    before_tax = _consolidate([p['cash flows before tax'] for p in projections], rows, horizon)
+    after_tax = _consolidate([p['cash flows after tax'] for p in projections], rows, horizon)
+    s['cash flows before tax'] = before_tax
+    s['cash flows after tax'] = after_tax
+
+    # equity invested in the properties held during each year
+    initial_equities = np.array([p['bs']['Equity'].values[0] for p in projections])
+    invested = np.bincount(starts + 1, weights=initial_equities, minlength=horizon + 1)
+    invested -= np.bincount(starts + lengths, weights=initial_equities, minlength=horizon + 1)
+    invested = np.cumsum(invested)[:horizon]
+
+    inc = s['is']
+    bs = s['bs']
+    cf = s['cf']
+    ratios = pd.DataFrame(index=index)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios['Cash On Cash Returns'] = np.where(invested > 0, cf['Net Cash Flows'].values / invested, 0)
+        ratios['Debt Coverage Ratios'] = inc['Net Operating Incomes'] / inc['Debt Service']
+        ratios['Loan To Value Ratios'] = bs['Total Debt'] / bs['Total Assets']
+        ratios['Operating Ratios'] = inc['Operating Expenses'] / inc['Total Revenues']
+        ratios['Leverage'] = bs['Total Assets'] / bs['Equity']
+    s['ratios'] = ratios
+
+    total_equity = initial_equities.sum()
+    disposal = {}
+    disposal.update({'Number Of Properties': len(projections)})
+    disposal.update({'Number Of Years': horizon - 1})
+    disposal.update({'Total Equity Invested': round(total_equity, 0)})
+    disposal.update({'Net Cash Gain Before Tax': round(before_tax.sum(), 0)})
+    disposal.update({'Net Cash Gain After Tax': round(after_tax.sum(), 0)})
+    disposal.update({'Equity Multiple Before Tax': round(1 + before_tax.sum() / total_equity, 3)})
+    disposal.update({'Equity Multiple After Tax': round(1 + after_tax.sum() / total_equity, 3)})
+    rates = fin.irr(np.vstack((before_tax, after_tax)))
+    disposal.update({'IRR Before Tax': round(float(rates[0]), 3)})
+    disposal.update({'IRR After Tax': round(float(rates[1]), 3)})
+    held = invested[1:] > 0
+    disposal.update({'Average Cash On Cash Return': round(ratios['Cash On Cash Returns'].values[1:][held].mean(), 3)
+                     if held.any() else 0})
+    s['disposal'] = disposal
+    return s
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+rent roll of multi-unit properties:
+    per unit rent, market rent, lease expiry, renewal probability, downtime and turnover cost
+    expected rents and turnover costs, vectorized over units x months, summed by year
+
+each lease rolls over at its expiry, then every 'Lease Term' months; at a rollover the tenant
+renews with the renewal probability, otherwise the unit stays vacant for the downtime and
+turns over at the turnover cost. From its first rollover a unit rents at its market rent,
+grown by the rent inflation of the scenario; until then at its in-place rent.
+
+rent roll columns, one row per unit:
+    'Unit'                      [optional] unit name
+    'Rent'                      in-place monthly rent
+    'Market Rent'               [optional] monthly market rent today, default the in-place rent
+    'Months To Expiry'          months from acquisition to the lease expiry, 0 for a lease ending at acquisition,
+                                or 'Lease Expiry' dates with the 'Acquisition Date' of the scenario
+    'Renewal Probability', 'Downtime' (months), 'Turnover Cost'
+                                [optional] per unit, default the scenario keys of the same name
+
+"""
+
+import numpy as np
+import pandas as pd
+
+# scenario keys of the rent roll, with their defaults
+RENT_ROLL_KEYS = ('Lease Term', 'Renewal Probability', 'Downtime', 'Turnover Cost', 'Acquisition Date')
+DEFAULTS = {'Lease Term': 12, 'Renewal Probability': 0.6, 'Downtime': 1, 'Turnover Cost': 0}
+
+
+def _column(rent_roll, name, default):
+    if name in rent_roll.columns:
+        values = pd.to_numeric(rent_roll[name], errors='coerce').values.astype(float)
+        return np.where(np.isnan(values), default, values)
+    return np.full(len(rent_roll), float(default))
+
+
+def units(rent_roll, lease_term=None, renewal_probability=None, downtime=None, turnover_cost=None,
+          acquisition_date=None):
+    """
+    per unit arrays of a rent roll, the defaults filling what the rent roll leaves out
+    :param rent_roll: pandas.DataFrame, or list of dicts, one per unit
+    :return: dict of arrays: 'Rent', 'Market Rent', 'Months To Expiry', 'Renewal Probability',
+             'Downtime', 'Turnover Cost', and 'Lease Term', an integer
+    """
+    rent_roll = pd.DataFrame(rent_roll)
+    if 'Rent' not in rent_roll.columns:
+        raise ValueError('Rent roll without Rent column')
+    lease_term = int(lease_term or DEFAULTS['Lease Term'])
+    if lease_term <= 0:
+        raise ValueError('Lease Term should be a positive number of months')
+    u = {'Lease Term': lease_term}
+    u['Rent'] = _column(rent_roll, 'Rent', 0)
+    u['Market Rent'] = np.where(np.isnan(_column(rent_roll, 'Market Rent', np.nan)), u['Rent'],
+                                _column(rent_roll, 'Market Rent', np.nan))
+    if 'Months To Expiry' in rent_roll.columns:
+        u['Months To Expiry'] = _column(rent_roll, 'Months To Expiry', 0)
+    elif 'Lease Expiry' in rent_roll.columns:
+        if acquisition_date is None:
+            raise ValueError('Lease Expiry dates need the Acquisition Date of the scenario')
+        expiry = pd.to_datetime(rent_roll['Lease Expiry'])
+        months = (expiry - pd.Timestamp(acquisition_date)).dt.days.values / (365.25 / 12)
+        u['Months To Expiry'] = np.where(np.isnan(months), 0, months)
+    else:
+        u['Months To Expiry'] = np.zeros(len(rent_roll))
+    u['Months To Expiry'] = np.maximum(0, np.round(u['Months To Expiry'])).astype(int)
+    u['Renewal Probability'] = np.clip(_column(rent_roll, 'Renewal Probability',
+                                               DEFAULTS['Renewal Probability'] if renewal_probability is None
+                                               else renewal_probability), 0, 1)
+    u['Downtime'] = np.clip(_column(rent_roll, 'Downtime', DEFAULTS['Downtime'] if downtime is None else downtime),
+                            0, lease_term)
+    u['Turnover Cost'] = _column(rent_roll, 'Turnover Cost',
+                                 DEFAULTS['Turnover Cost'] if turnover_cost is None else turnover_cost)
+    return u
+
+
+def project_rent_roll(rent_roll, years, rent_inflation=0.0, lease_term=None, renewal_probability=None,
+                      downtime=None, turnover_cost=None, acquisition_date=None):
+    """
+    expected rents and turnover costs of a rent roll, by year
+
+    :param rent_roll: pandas.DataFrame, or list of dicts, one per unit, see the module
+    :param years: projection years
+    :param rent_inflation: annual growth of market rents in decimal
+    :param lease_term: [optional] months, default 12
+    :param renewal_probability: [optional] default of the units, 0.6
+    :param downtime: [optional] months vacant at a turnover, default of the units, 1
+    :param turnover_cost: [optional] cost of a turnover, default of the units, 0
+    :param acquisition_date: [optional] date, needed with 'Lease Expiry' dates
+    :return: dict of annual arrays: 'Rents', 'Turnover Costs', 'Turnovers' (expected number),
+             'Occupancy' (expected occupied share of the unit months); and 'Unit Rents', (units, years)
+    """
+    u = units(rent_roll, lease_term, renewal_probability, downtime, turnover_cost, acquisition_date)
+    term = u['Lease Term']
+    months = np.arange(12 * years)
+    expiry = u['Months To Expiry'][:, np.newaxis]
+
+    # months since the last rollover, negative before the first
+    since = months - expiry
+    rolled = since >= 0
+    phase = np.where(rolled, since % term, -1)
+    turnover = (1 - u['Renewal Probability'])[:, np.newaxis]
+    vacant = np.where(rolled, turnover * np.clip(u['Downtime'][:, np.newaxis] - phase, 0, 1), 0)
+    rollovers = rolled & (phase == 0)
+
+    # in-place rent until the first rollover, market rent grown by year after it
+    growth = (1 + rent_inflation) ** (months // 12)
+    rents = np.where(rolled, u['Market Rent'][:, np.newaxis] * growth, u['Rent'][:, np.newaxis]) * (1 - vacant)
+    costs = np.where(rollovers, turnover * u['Turnover Cost'][:, np.newaxis], 0)
+
+    shape = (len(u['Rent']), years, 12)
+    unit_rents = rents.reshape(shape).sum(2)
+    occupied = (1 - vacant).reshape(shape).sum(2)
+    return {'Rents': unit_rents.sum(0),
+            'Turnover Costs': costs.reshape(shape).sum(2).sum(0),
+            'Turnovers': np.where(rollovers, turnover, 0).reshape(shape).sum(2).sum(0),
+            'Occupancy': occupied.sum(0) / (12 * max(1, len(u['Rent']))),
+            'Unit Rents': unit_rents}
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+first order sensitivities of the disposal and ratios of a projection
+to the numeric scenario keys:
+    the projection lines are evaluated once, without the dollar rounding, on a batch
+    with one row per scenario key; each row carries a complex step on its key,
+    so the imaginary parts are the derivatives to machine precision
+    IRR derivatives come from the implicit function theorem on NPV(IRR) = 0
+
+the rents and turnover costs of a deal with a rent roll are held fixed; the depreciation
+schedule follows the tax keys of the scenario, the losses carried forward and the recapture
+of cost segregation buckets are left out
+
+sensitivities are per unit of the key: 'Rate' 0.0025 * d IRR / d Rate is the IRR
+change for 25bp of rate, or pass bumps={'Rate': 0.0025}
+
+"""
+
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.rentroll as rentroll
+import Realmly.analytics.tax as tax
+
+# keys counting years or payments, and flags, have no derivative
+DISCRETE_KEYS = ('Years', 'Amortization Period', 'Payments Per Year', 'Rent Payments Per Year', 'IO Period',
+                 'Interests Only', 'Refinance Year', 'Refinance Amortization Period', 'Refinance IO Period')
+
+DISPOSAL_METRICS = ('Net Sales Before Tax', 'Capital Gain', 'Total Taxes', 'Net Sales After Tax',
+                    'Total Gain Before Tax', 'Total Gain After Tax',
+                    'Total Return Before Tax', 'Total Return After Tax',
+                    'IRR Before Tax', 'IRR After Tax',
+                    'Income Before Tax', 'Capital Appreciation Before Tax',
+                    'Income After Tax', 'Capital Appreciation After Tax')
+
+RATIO_METRICS = ('Capitalization Rates', 'Debt Coverage Ratios', 'Loan To Value Ratios', 'Leverage',
+                 'Cash On Cash Returns', 'Operating Ratios', 'Total Expense Ratios')
+
+STEP = 1e-20
+
+
+def numeric_keys(scenario):
+    """
+    scenario keys with a derivative: numbers, not flags, not counts of years or payments,
+    not the rent roll and tax engine keys
+    """
+    keys = []
+    for key, val in scenario.items():
+        val = fin.scenario_value(val)
+        if key in DISCRETE_KEYS or key in rentroll.RENT_ROLL_KEYS or key in tax.TAX_KEYS:
+            continue
+        if val is None or isinstance(val, (bool, np.bool_)):
+            continue
+        if isinstance(val, (int, float, np.integer, np.floating)):
+            keys.append(key)
+    return keys
+
+
+def _inputs(scenario, keys):
+    """
+    scenario values as complex columns, row 0 the scenario, row j+1 a step on keys[j]
+    """
+    v = {}
+    for key, val in scenario.items():
+        val = fin.scenario_value(val)
+        if isinstance(val, (int, float, np.integer, np.floating)) and not isinstance(val, (bool, np.bool_)):
+            v[key] = np.full((len(keys) + 1, 1), float(val), dtype=complex)
+        else:
+            v[key] = val
+    for j, key in enumerate(keys):
+        v[key][j + 1] += STEP * 1j
+    return v
+
+
+def _growth(rate, horizon):
+    return np.exp(np.log1p(rate) * np.arange(horizon))
+
+
+def _accumulation(i, m):
+    """
+    ((1 + i)^m - 1) / i, by its series near i = 0 so the complex steps survive a zero rate
+    """
+    with np.errstate(all='ignore'):
+        exact = np.expm1(m * np.log1p(i)) / i
+    series = m + m * (m - 1) / 2 * i + m * (m - 1) * (m - 2) / 6 * i ** 2
+    return np.where(np.abs(i) < 1e-9, series, exact)
+
+
+def _annual_loan(loan_amount, rate, amortizing_years, payments_per_year, io_years):
+    """
+    annual payments, interests, principal payments and year end balances of a loan,
+    unrounded, one row per batch row, see financials.annual_loan
+    """
+    number_of_payments = amortizing_years * payments_per_year
+    io = int(io_years * payments_per_year)
+    i = rate / payments_per_year
+    m = np.arange(1, number_of_payments - io + 1)
+    growth = np.exp(np.log1p(i) * m)
+    payment = loan_amount * growth[:, -1:] / _accumulation(i, m[-1])
+    balances = loan_amount * growth - payment * _accumulation(i, m)
+    previous = np.hstack((loan_amount, balances[:, :-1]))
+    principal_payments = previous - balances
+    interests = previous * i
+    if io:
+        io_interests = loan_amount * i * np.ones(io)
+        interests = np.hstack((io_interests, interests))
+        principal_payments = np.hstack((np.zeros(io_interests.shape), principal_payments))
+        balances = np.hstack((loan_amount * np.ones(io), balances))
+    shape = (len(rate), amortizing_years, payments_per_year)
+    interests = interests.reshape(shape).sum(2)
+    principal_payments = principal_payments.reshape(shape).sum(2)
+    return interests + principal_payments, interests, principal_payments, balances.reshape(shape)[:, :, -1]
+
+
+def _loan_schedule(v, years, asset_values):
+    """
+    annual loan lines with the refinance segments, see financials.loan_schedule
+    """
+    loan_amount = v['Loan'] * v['Purchase Price']
+    rate = v['Rate']
+    amortizing_years = int(v['Amortization Period'].real[0, 0])
+    payments_per_year = int(v['Payments Per Year'].real[0, 0])
+    io_years = v['IO Period'].real[0, 0] if v.get('Interests Only') else 0
+    refinances = fin.refinance_events({k: (val.real[0, 0] if isinstance(val, np.ndarray) else val)
+                                       for k, val in v.items()})
+    horizon = max([years, amortizing_years] +
+                  [e['Year'] + int(e.get('Amortization Period') or amortizing_years) for e in refinances])
+    rows = len(rate)
+    schedule = {key: np.zeros((rows, horizon), dtype=complex)
+                for key in ('Debt Service', 'Interests', 'Principal Repayments', 'Total Debt', 'Refinance Proceeds')}
+    single = not v.get('Refinances')
+    start = 0
+    for k in range(len(refinances) + 1):
+        end = refinances[k]['Year'] if k < len(refinances) else horizon
+        segment = _annual_loan(loan_amount, rate, amortizing_years, payments_per_year, io_years)
+        n = min(end - start, amortizing_years)
+        for key, values in zip(('Debt Service', 'Interests', 'Principal Repayments', 'Total Debt'), segment):
+            schedule[key][:, start:start + n] = values[:, :n]
+        if k == len(refinances):
+            break
+
+        # single refinance keys of a scenario sheet carry their steps
+        refinance = refinances[k]
+        if single:
+            refinance = dict(refinance, **{name: v['Refinance ' + name] for name in ('Rate', 'LTV', 'Closing Costs')
+                                           if isinstance(v.get('Refinance ' + name), np.ndarray)})
+        balance = schedule['Total Debt'][:, end - 1:end].copy()
+        if refinance.get('LTV') is not None:
+            loan_amount = refinance['LTV'] * asset_values[:, end:end + 1]
+        else:
+            loan_amount = balance
+        schedule['Total Debt'][:, end - 1:end] = loan_amount
+        closing_costs = refinance.get('Closing Costs')
+        schedule['Refinance Proceeds'][:, end - 1:end] = loan_amount - balance - \
+            (closing_costs if closing_costs is not None else 0)
+        if refinance.get('Rate') is not None:
+            rate = refinance['Rate'] * np.ones((rows, 1))
+        amortizing_years = int(refinance.get('Amortization Period') or amortizing_years)
+        io_years = refinance.get('IO Period') or 0
+        start = end
+    return {key: values[:, :years] for key, values in schedule.items()}
+
+
+def _projection(deal, v, years):
+    """
+    the lines of investment_scenario without rounding, on the batch rows of v
+    :return: dict of lines (rows, years), of year 0 values (rows, 1) and of IRR cash flows (rows, years + 1)
+    """
+    t = np.arange(years)
+    asset_values = v['Purchase Price'] * _growth(v['Price Appreciation'], years + 1)
+
+    # operating lines
+    rents = v['Rent'] * v['Rent Payments Per Year'].real * (1 - v['Vacancy']) * _growth(v['Rent Inflation'], years)
+    turnover = v['Tenant Turnover Costs'] * np.ones(years)
+    if deal.get('Rent Roll') is not None and len(deal['Rent Roll']):
+        # the rents and turnovers of a rent roll are held at the scenario values
+        base = {k: (val.real[0, 0] if isinstance(val, np.ndarray) else val) for k, val in v.items()}
+        base.update({'deal': deal, 'years': years})
+        base.update({k: base.get(k) for k in rentroll.RENT_ROLL_KEYS})
+        projected = fin.deal_rent_roll(base)
+        rents = projected['Rents'] * np.ones((len(v['Rent']), 1), dtype=complex)
+        turnover = projected['Turnover Costs'] * np.ones((len(v['Rent']), 1), dtype=complex)
+    management_fees = v['Property Management Fee'] * rents
+    realm_fees = v['Realmly Fee'] * rents
+    insurances = v['Insurance'] * _growth(v['Insurance Inflation'], years)
+    utilities = v['Utilities'] * _growth(v['Utility Inflation'], years)
+    maintenance = v['Maintenance'] * _growth(v['Maintenance Inflation'], years)
+    property_taxes = v['Property Tax'] * _growth(v['Property Tax Inflation'], years)
+    operating_incomes = rents - management_fees - turnover - insurances - maintenance - utilities - property_taxes
+    operating_expenses = insurances + maintenance + realm_fees + management_fees + turnover + utilities + \
+        v['Advertising'] + v['Administrative']
+    net_operating_incomes = rents - operating_expenses - property_taxes
+
+    loan = _loan_schedule(v, years, asset_values)
+    initial_loan = v['Loan'] * v['Purchase Price']
+
+    # depreciation, net income and cash flows
+    # depreciations are linear in the basis: the schedule of a basis of 1
+    options = tax.scenario_options({k: (v[k].real[0, 0] if isinstance(v.get(k), np.ndarray) else v.get(k))
+                                    for k in tax.TAX_KEYS}, deal['Class'])
+    options.pop('carryforward')
+    unit = tax.depreciation_schedule(1.0, years, rounded=False, **options)['Depreciations']
+    depreciations = (v['Purchase Price'] + v['Purchase Costs'] - deal['Land Value']) * unit
+    cumulative_depreciations = np.cumsum(depreciations, 1)
+    tax_basis = v['Purchase Price'] + v['Purchase Costs'] - cumulative_depreciations
+    taxes = (operating_incomes - loan['Interests'] - depreciations) * v['Income Tax']
+    net_incomes = net_operating_incomes - loan['Interests'] - depreciations
+    before_tax = operating_incomes - loan['Debt Service'] + loan['Refinance Proceeds']
+    after_tax = before_tax - taxes
+
+    # sale at the end of the projection
+    total_assets = asset_values[:, :1] + v['Purchase Costs']
+    equity = total_assets - initial_loan
+    initial_equity = v['Purchase Price'] + v['Purchase Costs'] - initial_loan
+    net_sales = asset_values[:, -1:] * (1 - v['Selling Commissions'])
+    pnl = net_sales - tax_basis[:, -1:]
+    gain = pnl.real > 0
+    long_term_gain = np.where(gain & ((net_sales - total_assets).real > 0), net_sales - total_assets, 0)
+    recapture = np.where(gain, np.where(pnl.real < cumulative_depreciations[:, -1:].real,
+                                        pnl, cumulative_depreciations[:, -1:]), 0)
+    short_term_gain = np.where(gain, 0, pnl)
+    tax_upon_sales = long_term_gain * v['Capital Gain Tax'] + short_term_gain * v['Income Tax'] + \
+        recapture * v['Depreciation Recapture Tax']
+    sale = net_sales - loan['Total Debt'][:, -1:]
+
+    d = {}
+    d['Net Sales Before Tax'] = net_sales
+    d['Capital Gain'] = pnl
+    d['Total Taxes'] = tax_upon_sales
+    d['Net Sales After Tax'] = net_sales - tax_upon_sales
+    d['Total Gain Before Tax'] = net_incomes.sum(1, keepdims=True) + pnl
+    d['Total Gain After Tax'] = net_incomes.sum(1, keepdims=True) - taxes.sum(1, keepdims=True) + pnl - tax_upon_sales
+    d['Total Return Before Tax'] = d['Total Gain Before Tax'] / equity
+    d['Total Return After Tax'] = d['Total Gain After Tax'] / equity
+
+    def vector(flows, terminal):
+        return np.hstack((-initial_equity, flows + np.where(t == years - 1, 1, 0) * terminal))
+
+    principal = loan['Principal Repayments']
+    cash_flows = {'IRR After Tax': vector(after_tax, sale - tax_upon_sales),
+                  'IRR Before Tax': vector(before_tax, sale),
+                  'Income Before Tax': vector(before_tax + principal, initial_equity),
+                  'Capital Appreciation Before Tax': vector(-principal, sale),
+                  'Income After Tax': vector(after_tax + principal, initial_equity),
+                  'Capital Appreciation After Tax': vector(-principal, sale - tax_upon_sales)}
+
+    # ratios, year 1 .. years
+    total_debt = loan['Total Debt']
+    r = {}
+    with np.errstate(all='ignore'):
+        r['Capitalization Rates'] = net_operating_incomes / asset_values[:, :-1]
+        r['Capitalization Rates'][:, :1] = net_operating_incomes[:, :1] / total_assets
+        r['Debt Coverage Ratios'] = net_operating_incomes / loan['Debt Service']
+        r['Loan To Value Ratios'] = total_debt / asset_values[:, 1:]
+        r['Leverage'] = asset_values[:, 1:] / (asset_values[:, 1:] - total_debt)
+        r['Cash On Cash Returns'] = before_tax / equity
+        r['Operating Ratios'] = operating_expenses / rents
+        r['Total Expense Ratios'] = (rents - operating_incomes + loan['Interests']) / rents
+    return d, cash_flows, r
+
+
+def _irr_derivatives(flows):
+    """
+    IRR of row 0 and its derivatives along the complex steps of the other rows:
+    dIRR = - sum(dCF_t v^t) / sum(CF_t d v^t/dr), v = 1/(1 + IRR)
+    """
+    base = flows[0].real
+    rate = fin.irr(base)
+    t = np.arange(len(base))
+    with np.errstate(all='ignore'):
+        discount = np.exp(-np.log1p(rate) * t)
+        slope = -np.sum(base * t * discount) / (1 + rate)
+        derivatives = -(flows[1:].imag / STEP) @ discount / slope
+    return rate, derivatives
+
+
+def sensitivities(deal, scenario, keys=None, bumps=None):
+    """
+    first order sensitivities of the disposal metrics and ratios of investment_scenario
+
+    costs one batched evaluation of the projection lines, one row per key, in place of
+    two projections per key; the dollar rounding of the statements is left out, so the
+    derivatives are those of the unrounded lines
+    :param deal: dict
+    :param scenario: dict
+    :param keys: [optional] scenario keys, default numeric_keys(scenario)
+    :param bumps: [optional] dict, key -> bump size, the sensitivities of those keys are
+                  multiplied by their bump, e.g. {'Rate': 0.0025, 'Vacancy': 0.01}
+    :return: dict, 'disposal': pandas.DataFrame, one row per disposal metric, one column per key;
+             'ratios': dict of pandas.DataFrame, one per ratio, one row per year 1 .. years, one column per key;
+             'values': dict, the unrounded disposal metrics the derivatives are taken at
+    """
+    keys = numeric_keys(scenario) if keys is None else list(keys)
+    unknown = [k for k in keys if k not in numeric_keys(scenario)]
+    if unknown:
+        raise ValueError('No sensitivity to non numeric or discrete scenario keys {0}'.format(unknown))
+    years = int(scenario['Years'])
+    v = _inputs(scenario, keys)
+    d, cash_flows, r = _projection(deal, v, years)
+
+    scale = np.array([(bumps or {}).get(k, 1) for k in keys], dtype=float)
+    values = {}
+    disposal = pd.DataFrame(index=pd.Index(DISPOSAL_METRICS, name='Metric'), columns=keys, dtype=float)
+    for metric, lines in d.items():
+        values[metric] = lines[0, 0].real
+        disposal.loc[metric] = lines[1:, 0].imag / STEP * scale
+    for metric, flows in cash_flows.items():
+        values[metric], derivatives = _irr_derivatives(flows)
+        disposal.loc[metric] = derivatives * scale
+
+    ratios = {}
+    index = pd.Index(np.arange(1, years + 1), name='Year')
+    for metric in RATIO_METRICS:
+        lines = r[metric]
+        derivatives = (lines[1:].imag / STEP).T * scale
+        derivatives[~np.isfinite(lines[0].real)] = np.nan
+        ratios[metric] = pd.DataFrame(derivatives, index=index, columns=keys)
+    return {'disposal': disposal, 'ratios': ratios, 'values': values}
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+sharded batch projections through a work queue on a shared filesystem:
+    a coordinator splits the deal workbooks into shards
+    workers, on any number of nodes, claim shards with lease files and keep them alive
+    with heartbeats; the shards of dead workers are claimed again once their lease expires
+    each finished workbook is appended to the partial results of its shard, a shard
+    claimed again only projects what is missing
+    a merge step combines the results of all shards
+
+queue directory:
+    manifest.json               shard count and settings
+    shards/shard-00000.json     workbooks of a shard
+    leases/shard-00000.lease    worker holding the shard, mtime is its last heartbeat
+    partial/shard-00000.jsonl   journal records of the workbooks done so far
+    results/shard-00000.jsonl   all records of a finished shard, written atomically
+
+usage:
+    python -m Realmly.analytics.sharding create queue_dir workbooks_dir --shard-size 50
+    python -m Realmly.analytics.sharding work queue_dir -o output      # on every node
+    python -m Realmly.analytics.sharding merge queue_dir --summary summary.csv
+
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+import Realmly.analytics.batch as batch
+
+MANIFEST_NAME = 'manifest.json'
+LEASE_TIMEOUT = 120
+HEARTBEAT = 15
+
+
+def _paths(queue_dir, shard):
+    name = 'shard-{0:05d}'.format(shard)
+    return {'shard': os.path.join(queue_dir, 'shards', name + '.json'),
+            'lease': os.path.join(queue_dir, 'leases', name + '.lease'),
+            'partial': os.path.join(queue_dir, 'partial', name + '.jsonl'),
+            'result': os.path.join(queue_dir, 'results', name + '.jsonl')}
+
+
+def _write_atomic(path, text):
+    tmp = '{0:s}.{1:s}.tmp'.format(path, uuid.uuid4().hex)
+    with open(tmp, 'w') as fh:
+        fh.write(text)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def read_manifest(queue_dir):
+    with open(os.path.join(queue_dir, MANIFEST_NAME)) as fh:
+        return json.load(fh)
+
+
+def create_queue(queue_dir, files, shard_size=50, overwrite=False):
+    """
+    split workbooks into shards of a new work queue
+    :param queue_dir: queue directory, on a filesystem shared by the worker nodes
+    :param files: list of deal workbooks, paths seen the same way by all nodes
+    :param shard_size: workbooks per shard
+    :param overwrite: replace an existing queue
+    :return: number of shards
+    """
+    if os.path.exists(os.path.join(queue_dir, MANIFEST_NAME)) and not overwrite:
+        raise FileExistsError('Work queue already in {0:s}'.format(queue_dir))
+    if shard_size <= 0:
+        raise ValueError('Shard size should be a positive number')
+    for sub in ('shards', 'leases', 'partial', 'results'):
+        os.makedirs(os.path.join(queue_dir, sub), exist_ok=True)
+        if overwrite:
+            for name in os.listdir(os.path.join(queue_dir, sub)):
+                os.remove(os.path.join(queue_dir, sub, name))
+    files = [os.path.abspath(f) for f in files]
+    shards = [files[i:i + shard_size] for i in range(0, len(files), shard_size)]
+    for shard, shard_files in enumerate(shards):
+        _write_atomic(_paths(queue_dir, shard)['shard'], json.dumps(shard_files))
+    _write_atomic(os.path.join(queue_dir, MANIFEST_NAME),
+                  json.dumps({'shards': len(shards), 'files': len(files), 'shard size': shard_size,
+                              'created': time.strftime('%Y-%m-%d %H:%M:%S')}))
+    return len(shards)
+
+
+def _read_lease(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        # gone, or being written by its creator
+        return None
+
+
+def claim(queue_dir, shard, worker, lease_timeout=LEASE_TIMEOUT):
+    """
+    try to take the lease of a shard: create the lease file, or take over a lease
+    whose heartbeat is older than lease_timeout seconds
+    :return: True if the worker holds the lease
+    """
+    paths = _paths(queue_dir, shard)
+    if os.path.exists(paths['result']):
+        return False
+    lease = paths['lease']
+    observed = _read_lease(lease)
+    try:
+        age = time.time() - os.stat(lease).st_mtime
+    except FileNotFoundError:
+        age = None
+    if age is not None:
+        if age < lease_timeout:
+            return False
+        # expired: move it aside, only one of the workers racing for it succeeds
+        expired = '{0:s}.expired.{1:s}'.format(lease, uuid.uuid4().hex)
+        try:
+            os.rename(lease, expired)
+        except FileNotFoundError:
+            return False
+        if _read_lease(expired) != observed or time.time() - os.stat(expired).st_mtime < lease_timeout:
+            # another worker took the shard over in between, give its lease back
+            try:
+                os.link(expired, lease)
+            except FileExistsError:
+                pass
+            os.remove(expired)
+            return False
+        os.remove(expired)
+    try:
+        fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as fh:
+        fh.write(json.dumps({'worker': worker, 'host': socket.gethostname(), 'pid': os.getpid(),
+                             'claimed': time.time()}))
+        fh.flush()
+        os.fsync(fh.fileno())
+    return True
+
+
+def holds(queue_dir, shard, worker):
+    lease = _read_lease(_paths(queue_dir, shard)['lease'])
+    return lease is not None and lease.get('worker') == worker
+
+
+def release(queue_dir, shard, worker):
+    if holds(queue_dir, shard, worker):
+        try:
+            os.remove(_paths(queue_dir, shard)['lease'])
+        except FileNotFoundError:
+            pass
+
+
+class _Heartbeat(threading.Thread):
+    """
+    touch a lease file every interval seconds until stopped
+    """
+
+    def __init__(self, lease, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.lease = lease
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.lease)
+            except FileNotFoundError:
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def project_shard(queue_dir, shard, worker, output_location=None, print_flag=False, verbose=False,
+                  heartbeat=HEARTBEAT):
+    """
+    project the workbooks of a claimed shard which are not in its partial results yet,
+    then publish all its records as the shard result
+    :return: True if the shard result was written, False if the lease was lost
+    """
+    paths = _paths(queue_dir, shard)
+    with open(paths['shard']) as fh:
+        files = json.load(fh)
+    beat = _Heartbeat(paths['lease'], heartbeat)
+    beat.start()
+    try:
+        records = batch.read_journal(paths['partial'])
+        with open(paths['partial'], 'a+') as fh:
+            # a line cut short by a dead worker ends before the next record
+            if fh.tell() > 0:
+                fh.seek(fh.tell() - 1)
+                if fh.read(1) != '\n':
+                    fh.write('\n')
+            for f in files:
+                if f in records:
+                    continue
+                record = batch.project_file(f, output_location, print_flag, verbose)
+                record.update({'worker': worker, 'shard': shard})
+                if not holds(queue_dir, shard, worker):
+                    return False
+                batch.append_journal(fh, record)
+                records[f] = record
+        if not holds(queue_dir, shard, worker):
+            return False
+        _write_atomic(paths['result'], ''.join(json.dumps(records[f]) + '\n' for f in files))
+        return True
+    finally:
+        beat.stop()
+        release(queue_dir, shard, worker)
+
+
+def work(queue_dir, worker=None, output_location=None, print_flag=False, verbose=False,
+         lease_timeout=LEASE_TIMEOUT, heartbeat=HEARTBEAT, poll=None, wait=True):
+    """
+    worker loop: claim and project shards until every shard has a result
+
+    :param queue_dir: queue directory
+    :param worker: [optional] worker name, default host-pid
+    :param output_location: folder for the projection workbooks, None for the folder of each deal workbook
+    :param print_flag: write the projection workbooks
+    :param verbose: let the projections print to stdout
+    :param lease_timeout: seconds without heartbeat after which a lease is taken over
+    :param heartbeat: seconds between heartbeats, well below lease_timeout
+    :param poll: [optional] seconds between scans while other workers hold the last shards
+    :param wait: keep waiting for shards held by other workers, to take them over if their worker dies
+    :return: number of shards projected by this worker
+    """
+    if heartbeat >= lease_timeout:
+        raise ValueError('Heartbeat should be shorter than the lease timeout')
+    worker = worker or '{0:s}-{1:d}'.format(socket.gethostname(), os.getpid())
+    poll = poll or heartbeat
+    shards = read_manifest(queue_dir)['shards']
+    if output_location:
+        os.makedirs(output_location, exist_ok=True)
+    done = 0
+    while True:
+        pending = [s for s in range(shards) if not os.path.exists(_paths(queue_dir, s)['result'])]
+        if not pending:
+            return done
+        claimed = False
+        for shard in pending:
+            if claim(queue_dir, shard, worker, lease_timeout):
+                claimed = True
+                if project_shard(queue_dir, shard, worker, output_location, print_flag, verbose, heartbeat):
+                    done += 1
+        if not claimed:
+            if not wait:
+                return done
+            time.sleep(poll)
+
+
+def status(queue_dir, lease_timeout=LEASE_TIMEOUT):
+    """
+    :return: dict of shard counts, 'shards', 'done', 'leased', 'expired', 'waiting', and 'workers', the
+             live lease holders
+    """
+    shards = read_manifest(queue_dir)['shards']
+    counts = {'shards': shards, 'done': 0, 'leased': 0, 'expired': 0, 'waiting': 0, 'workers': set()}
+    now = time.time()
+    for shard in range(shards):
+        paths = _paths(queue_dir, shard)
+        if os.path.exists(paths['result']):
+            counts['done'] += 1
+            continue
+        try:
+            age = now - os.stat(paths['lease']).st_mtime
+        except FileNotFoundError:
+            counts['waiting'] += 1
+            continue
+        if age < lease_timeout:
+            counts['leased'] += 1
+            lease = _read_lease(paths['lease'])
+            if lease:
+                counts['workers'].add(lease['worker'])
+        else:
+            counts['expired'] += 1
+    counts['workers'] = sorted(counts['workers'])
+    return counts
+
+
+def merge(queue_dir, partial=False):
+    """
+    combine the shard results into one result set
+    :param queue_dir: queue directory
+    :param partial: [optional] also take the partial results of unfinished shards
+    :return: dict, file -> journal record, see batch.summarize_journal
+    """
+    records = {}
+    for shard in range(read_manifest(queue_dir)['shards']):
+        paths = _paths(queue_dir, shard)
+        if os.path.exists(paths['result']):
+            records.update(batch.read_journal(paths['result']))
+        elif partial:
+            records.update(batch.read_journal(paths['partial']))
+    return records
+
+
+def run_local(queue_dir, workers=None, output_location=None, print_flag=False,
+              lease_timeout=LEASE_TIMEOUT, heartbeat=HEARTBEAT, name=None):
+    """
+    project a queue with local worker processes standing in for nodes, then merge
+    :param workers: number of worker processes, default os.cpu_count()
+    :param name: [optional] prefix of the worker names, name-0, name-1 ..., default the host name
+    :return: dict, file -> journal record
+    """
+    name = name or socket.gethostname()
+    processes = []
+    for i in range(workers or os.cpu_count()):
+        p = mp.Process(target=work, args=(queue_dir, '{0:s}-{1:d}'.format(name, i), output_location, print_flag),
+                       kwargs={'lease_timeout': lease_timeout, 'heartbeat': heartbeat})
+        p.start()
+        processes.append(p)
+    for p in processes:
+        p.join()
+    return merge(queue_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Realmly.analytics.sharding',
+                                     description='Sharded batch projections through a shared work queue.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='split workbooks into the shards of a new queue')
+    create.add_argument('queue', help='queue directory, on a shared filesystem')
+    create.add_argument('paths', nargs='+', help='deal workbooks, or directories searched for workbooks')
+    create.add_argument('--shard-size', type=int, default=50, help='workbooks per shard')
+    create.add_argument('--pattern', default='*.xlsx', help='workbook pattern inside directories')
+    create.add_argument('--overwrite', action='store_true', help='replace an existing queue')
+    worker = commands.add_parser('work', help='claim and project shards until the queue is done')
+    worker.add_argument('queue', help='queue directory')
+    worker.add_argument('-o', '--output', default=None, help='folder for projection workbooks')
+    worker.add_argument('--excel', action='store_true', help='write projection workbooks')
+    worker.add_argument('--name', default=None,
+                        help='worker name, default host-pid; prefix of the names with -j, default host')
+    worker.add_argument('-j', '--processes', type=int, default=1, help='local worker processes')
+    worker.add_argument('--lease-timeout', type=float, default=LEASE_TIMEOUT, help='seconds')
+    worker.add_argument('--heartbeat', type=float, default=HEARTBEAT, help='seconds')
+    state = commands.add_parser('status', help='shard counts')
+    state.add_argument('queue', help='queue directory')
+    combine = commands.add_parser('merge', help='combine the shard results')
+    combine.add_argument('queue', help='queue directory')
+    combine.add_argument('--summary', default=None, help='write one row per scenario to this csv file')
+    combine.add_argument('--partial', action='store_true', help='include unfinished shards')
+    args = parser.parse_args(argv)
+
+    if args.command == 'create':
+        files = batch.find_workbooks(args.paths, args.pattern)
+        shards = create_queue(args.queue, files, args.shard_size, args.overwrite)
+        print('{0:d} workbooks in {1:d} shards'.format(len(files), shards))
+    elif args.command == 'work':
+        if args.processes > 1:
+            records = run_local(args.queue, args.processes, args.output, args.excel,
+                                args.lease_timeout, args.heartbeat, args.name)
+            print('{0:d} workbooks projected'.format(len(records)))
+        else:
+            done = work(args.queue, args.name, args.output, args.excel,
+                        lease_timeout=args.lease_timeout, heartbeat=args.heartbeat)
+            print('{0:d} shards projected'.format(done))
+    elif args.command == 'status':
+        print(json.dumps(status(args.queue), indent=1))
+    else:
+        records = merge(args.queue, args.partial)
+        if args.summary:
+            batch.summarize_journal(records).to_csv(args.summary, index=False)
+        failed = sum(1 for r in records.values() if r['status'] != 'ok')
+        print('{0:d} workbooks, {1:d} failed'.format(len(records), failed))
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
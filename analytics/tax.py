@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+depreciation and taxes:
+    depreciation methods: straight line over a period, 27.5 years residential, 39 years commercial,
+    MACRS tables of 5, 7 and 15 year property, new methods with register_method
+    cost segregation: shares of the basis moved to 5, 7 and 15 year MACRS buckets, with bonus depreciation
+    income taxes, with losses carried forward instead of credited
+    taxes upon sale: long term gain, recapture of the MACRS buckets at the income tax rate,
+    of the building at the depreciation recapture rate, and release of the losses carried forward
+
+every function works on arrays of any shape, scalars included: one entry per deal, per
+exit year, or both, so a batch of deals is taxed with the same array operations as one
+
+"""
+
+import numpy as np
+
+# scenario keys of the tax engine, all optional
+TAX_KEYS = ('Depreciation Method', 'Depreciation Period', 'Cost Segregation 5 Year', 'Cost Segregation 7 Year',
+            'Cost Segregation 15 Year', 'Bonus Depreciation', 'Loss Carryforward')
+
+# MACRS half year convention tables, share of the basis by year
+MACRS = {5: (0.2, 0.32, 0.192, 0.1152, 0.1152, 0.0576),
+         7: (0.1429, 0.2449, 0.1749, 0.1249, 0.0893, 0.0892, 0.0893, 0.0446),
+         15: (0.05, 0.095, 0.0855, 0.077, 0.0693, 0.0623, 0.059, 0.059, 0.0591, 0.059,
+              0.0591, 0.059, 0.0591, 0.059, 0.0591, 0.0295)}
+
+
+def straight_line(basis, years, period):
+    """
+    basis / period a year, the last year what is left of the basis
+    :param basis: array
+    :return: array, shape of basis + (years,)
+    """
+    basis = np.asarray(basis, dtype=float)[..., np.newaxis]
+    t = np.arange(years)
+    depreciations = basis / period * np.ones(years)
+    return np.where(t + 1 <= period, depreciations, np.maximum(0, basis - basis / period * t))
+
+
+def macrs(life):
+    """
+    depreciation method of a MACRS table
+    """
+    table = np.array(MACRS[life])
+
+    def method(basis, years, period=None):
+        shares = np.zeros(years)
+        shares[:min(years, len(table))] = table[:years]
+        return np.asarray(basis, dtype=float)[..., np.newaxis] * shares
+    return method
+
+
+DEPRECIATION_METHODS = {'Straight Line': straight_line, 'MACRS 5': macrs(5), 'MACRS 7': macrs(7),
+                        'MACRS 15': macrs(15)}
+
+
+def register_method(name, method):
+    """
+    add a depreciation method
+    :param name: value of the 'Depreciation Method' scenario key
+    :param method: function of (basis, years, period), returning the depreciations, shape of basis + (years,)
+    """
+    DEPRECIATION_METHODS[name] = method
+
+
+def default_period(property_class):
+    """
+    straight line period of a deal Class: 27.5 years Residential, 39 years otherwise
+    """
+    return 27.5 if property_class == 'Residential' else 39
+
+
+def depreciation_schedule(basis, years, method=None, period=27.5, cost_segregation=None, bonus=0, rounded=True):
+    """
+    annual depreciations, rounded to dollars
+
+    :param basis: depreciable basis, purchase price and costs less the land value, array or scalar
+    :param years: number of years
+    :param method: [optional] depreciation method of the building, see DEPRECIATION_METHODS, default 'Straight Line'
+    :param period: straight line period in years
+    :param cost_segregation: [optional] dict, MACRS life 5, 7 or 15 -> share of the basis, depreciated on its
+                             MACRS table instead of the building method
+    :param bonus: [optional] share of the cost segregation buckets depreciated in the first year
+    :param rounded: round the depreciations to dollars
+    :return: dict of arrays, shape of basis + (years,): 'Depreciations', 'Personal Property Depreciations'
+             the part of the MACRS buckets, 'Cumulative Depreciations' and
+             'Cumulative Personal Property Depreciations'
+    """
+    method = method or 'Straight Line'
+    if method not in DEPRECIATION_METHODS:
+        raise ValueError('Unknown depreciation method {0}, expected one of {1}'.format(
+            method, tuple(DEPRECIATION_METHODS)))
+    basis = np.asarray(basis, dtype=float)
+    shares = {life: share for life, share in (cost_segregation or {}).items() if share}
+    if sum(shares.values()) > 1 or min(shares.values(), default=0) < 0:
+        raise ValueError('Cost segregation shares should be positive and add up to at most 1')
+    for life in shares:
+        if life not in MACRS:
+            raise ValueError('No MACRS table for {0} year property, expected one of {1}'.format(life, tuple(MACRS)))
+
+    building_basis = basis * (1 - sum(shares.values())) if shares else basis
+    building = DEPRECIATION_METHODS[method](building_basis, years, period)
+    personal = np.zeros(building.shape)
+    for life, share in shares.items():
+        bucket = basis * share
+        personal = personal + macrs(life)(bucket * (1 - bonus), years)
+        personal[..., 0] += bucket * bonus
+    depreciations = building + personal if shares else building
+    if rounded:
+        depreciations = np.round(depreciations, 0)
+        personal = np.round(personal, 0)
+    return {'Depreciations': depreciations,
+            'Personal Property Depreciations': personal,
+            'Cumulative Depreciations': np.cumsum(depreciations, -1),
+            'Cumulative Personal Property Depreciations': np.cumsum(personal, -1)}
+
+
+def income_taxes(net_incomes, rate, carryforward=False):
+    """
+    income taxes of annual net incomes
+
+    without carryforward a loss is a tax credit, a negative tax; with carryforward a loss
+    offsets the net incomes of the next years, and the taxes are never negative
+    :param net_incomes: array, years on the last axis
+    :param rate: income tax rate
+    :param carryforward: carry the losses forward
+    :return: taxes and the losses carried forward at the end of each year, shape of net_incomes
+    """
+    net_incomes = np.asarray(net_incomes, dtype=float)
+    if not carryforward:
+        return net_incomes * rate, np.zeros(net_incomes.shape)
+    taxes = np.zeros(net_incomes.shape)
+    suspended = np.zeros(net_incomes.shape)
+    carried = np.zeros(net_incomes.shape[:-1])
+    for t in range(net_incomes.shape[-1]):
+        taxable = net_incomes[..., t] - carried
+        taxes[..., t] = np.maximum(taxable, 0) * rate
+        carried = np.maximum(-taxable, 0)
+        suspended[..., t] = carried
+    return taxes, suspended
+
+
+def sale_taxes(net_sales, tax_basis, total_assets, cumulative_depreciations, capital_gain_tax, income_tax,
+               recapture_tax, personal_property_depreciations=0, suspended_losses=0):
+    """
+    taxes upon sale, rounded to dollars as the disposal table
+
+    a gain is long term above the acquisition cost, depreciation recapture below it: the MACRS
+    buckets first, at the income tax rate, then the building at the recapture rate; a loss is
+    short term, taxed at the income tax rate. Losses carried forward are released at the sale.
+    :param net_sales: sale price less the selling commissions
+    :param tax_basis: tax basis at the sale
+    :param total_assets: acquisition cost, price and purchase costs
+    :param cumulative_depreciations: depreciations up to the sale
+    :param personal_property_depreciations: [optional] the part of them of the MACRS buckets
+    :param suspended_losses: [optional] losses carried forward to the sale
+    :return: dict of arrays: 'Capital Gain', 'Long Term Gain', 'Long Term Gain Tax', 'Short Term Gain',
+             'Short Term Gain Tax', 'Depreciation Recapture', 'Depreciation Recapture Tax',
+             'Personal Property Recapture', 'Personal Property Recapture Tax', 'Released Losses Tax Benefit'
+             and 'Total Taxes'
+    """
+    pnl = net_sales - tax_basis
+    gain = pnl > 0
+    personal_recapture = np.where(gain, np.round(np.minimum(pnl, personal_property_depreciations), 0), 0)
+    long_term_gain = np.where(gain, np.round(np.maximum(0, net_sales - total_assets), 0), 0)
+    if np.any(personal_property_depreciations):
+        depreciation_recapture = np.where(gain, np.round(np.minimum(pnl - personal_recapture, cumulative_depreciations -
+                                                                    personal_property_depreciations), 0), 0)
+    else:
+        depreciation_recapture = np.where(gain, np.round(np.minimum(pnl, cumulative_depreciations), 0), 0)
+    short_term_gain = np.where(gain, 0, pnl)
+    long_term_gain_tax = np.round(long_term_gain * capital_gain_tax, 0)
+    short_term_gain_tax = np.round(short_term_gain * income_tax, 0)
+    recapture = np.round(depreciation_recapture * recapture_tax, 0)
+    personal_recapture_tax = np.round(personal_recapture * income_tax, 0)
+    released = np.round(suspended_losses * np.asarray(income_tax), 0)
+    total = recapture + long_term_gain_tax + short_term_gain_tax
+    if np.any(personal_recapture_tax) or np.any(released):
+        total = total + personal_recapture_tax - released
+    return {'Capital Gain': pnl,
+            'Long Term Gain': long_term_gain,
+            'Long Term Gain Tax': long_term_gain_tax,
+            'Short Term Gain': short_term_gain,
+            'Short Term Gain Tax': short_term_gain_tax,
+            'Depreciation Recapture': depreciation_recapture,
+            'Depreciation Recapture Tax': recapture,
+            'Personal Property Recapture': personal_recapture,
+            'Personal Property Recapture Tax': personal_recapture_tax,
+            'Released Losses Tax Benefit': released,
+            'Total Taxes': np.round(total, 0)}
+
+
+def scenario_options(scenario, property_class):
+    """
+    depreciation and tax options of a scenario, defaults for the missing keys
+    :return: dict of the keyword arguments of depreciation_schedule, and 'carryforward'
+    """
+    def value(key, default=None):
+        val = scenario.get(key)
+        if isinstance(val, np.ndarray):
+            val = val.item() if val.size == 1 else None
+        if val is None or (isinstance(val, str) and not val.strip()) or (isinstance(val, float) and np.isnan(val)):
+            return default
+        return val
+
+    return {'method': value('Depreciation Method', 'Straight Line'),
+            'period': float(value('Depreciation Period', default_period(property_class))),
+            'cost_segregation': {life: float(value('Cost Segregation {0:d} Year'.format(life), 0)) for life in MACRS},
+            'bonus': float(value('Bonus Depreciation', 0)),
+            'carryforward': bool(value('Loss Carryforward', False))}
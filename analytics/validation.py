@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+scenario validation:
+    schema of the scenario keys: kind, range, and whether the projection needs the key
+    batches of scenarios checked and normalized at once, one array operation per key, not a value at a time
+    cross-field rules: IO period within the loan term, refinance within the projection, cost segregation ...
+    per row error report, the rows with errors are rejected before the projection
+
+kinds:
+    'number'    float
+    'int'       integer, a value within 1e-9 of an integer is rounded to it
+    'flag'      bool: numbers above 0, True / False, yes / no; a missing flag is False
+    'text'      string
+    'date'      anything pandas.to_datetime reads, kept as given
+
+normalized values are python floats, ints and bools, None for a missing key; invalid values
+are kept as given. Keys outside of the schema, e.g. 'Scenario Name' or 'Refinances', are kept as they are.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.tax as tax
+
+INF = np.inf
+
+# key -> (kind, minimum, maximum, required by the projection)
+FIELDS = {'Purchase Price': ('number', 0, INF, True),
+          'Purchase Costs': ('number', 0, INF, True),
+          'Loan': ('number', 0, 1, True),
+          'Rate': ('number', 0, 1, True),
+          'Amortization Period': ('int', 1, 100, True),
+          'Payments Per Year': ('int', 1, 365, True),
+          'Interests Only': ('flag', None, None, False),
+          'IO Period': ('int', 0, 100, False),
+          'Rent': ('number', 0, INF, True),
+          'Rent Inflation': ('number', -1, INF, True),
+          'Rent Payments Per Year': ('int', 1, 365, True),
+          'Vacancy': ('number', 0, 1, True),
+          'Other Income': ('number', 0, INF, False),
+          'Property Tax': ('number', 0, INF, True),
+          'Property Tax Inflation': ('number', -1, INF, True),
+          'Insurance': ('number', 0, INF, True),
+          'Insurance Inflation': ('number', -1, INF, True),
+          'Utilities': ('number', 0, INF, True),
+          'Utility Inflation': ('number', -1, INF, True),
+          'Maintenance': ('number', 0, INF, True),
+          'Maintenance Inflation': ('number', -1, INF, True),
+          'Tenant Turnover Costs': ('number', 0, INF, True),
+          'Advertising': ('number', 0, INF, True),
+          'Administrative': ('number', 0, INF, True),
+          'Realmly Fee': ('number', 0, 1, True),
+          'Property Management Fee': ('number', 0, 1, True),
+          'Years': ('int', 1, 100, True),
+          'Selling Commissions': ('number', 0, 1, True),
+          'Other Selling Costs': ('number', 0, INF, False),
+          'Price Appreciation': ('number', -1, INF, True),
+          'Capital Gain Tax': ('number', 0, 1, True),
+          'Income Tax': ('number', 0, 1, True),
+          'Depreciation Recapture Tax': ('number', 0, 1, True),
+          'Refinance Year': ('int', 1, 100, False),
+          'Refinance Rate': ('number', 0, 1, False),
+          'Refinance Amortization Period': ('int', 1, 100, False),
+          'Refinance LTV': ('number', 0, 1, False),
+          'Refinance Closing Costs': ('number', 0, INF, False),
+          'Refinance IO Period': ('int', 0, 100, False),
+          'Lease Term': ('number', 1, INF, False),
+          'Renewal Probability': ('number', 0, 1, False),
+          'Downtime': ('number', 0, INF, False),
+          'Turnover Cost': ('number', 0, INF, False),
+          'Acquisition Date': ('date', None, None, False),
+          'Depreciation Method': ('text', None, None, False),
+          'Depreciation Period': ('number', 1, INF, False),
+          'Cost Segregation 5 Year': ('number', 0, 1, False),
+          'Cost Segregation 7 Year': ('number', 0, 1, False),
+          'Cost Segregation 15 Year': ('number', 0, 1, False),
+          'Bonus Depreciation': ('number', 0, 1, False),
+          'Loss Carryforward': ('flag', None, None, False)}
+
+KINDS = ('number', 'int', 'flag', 'text', 'date')
+
+_WORDS = {'true': 1.0, 'yes': 1.0, 'y': 1.0, 'false': 0.0, 'no': 0.0, 'n': 0.0}
+
+
+# cross-field rules, (keys, error, function of dict key -> column, True for the rows in error);
+# numbers are float arrays, NaN when missing or invalid, so a rule ignores the rows missing a key
+def _io_period(v):
+    return v['Interests Only'] & ~(v['IO Period'] < v['Amortization Period'])
+
+
+def _refinance_io_period(v):
+    return v['Refinance IO Period'] >= v['Refinance Amortization Period']
+
+
+def _refinance_year(v):
+    return v['Refinance Year'] >= v['Years']
+
+
+def _cost_segregation(v):
+    shares = np.vstack([v['Cost Segregation {0:d} Year'.format(life)] for life in tax.MACRS])
+    return np.nansum(shares, 0) > 1
+
+
+def _depreciation_method(v):
+    methods = pd.Series(v['Depreciation Method'])
+    return (methods.notna() & ~methods.isin(list(tax.DEPRECIATION_METHODS))).values
+
+
+def _purchase_price(v):
+    return v['Purchase Price'] <= 0
+
+
+RULES = [(('Purchase Price',), 'Purchase Price should be above 0', _purchase_price),
+         (('Interests Only', 'IO Period', 'Amortization Period'),
+          'IO Period should be given and shorter than the Amortization Period with Interests Only', _io_period),
+         (('Refinance IO Period', 'Refinance Amortization Period'),
+          'Refinance IO Period should be shorter than the Refinance Amortization Period', _refinance_io_period),
+         (('Refinance Year', 'Years'), 'Refinance Year should be before the last projection year', _refinance_year),
+         (('Cost Segregation 5 Year', 'Cost Segregation 7 Year', 'Cost Segregation 15 Year'),
+          'Cost segregation shares should add up to at most 1', _cost_segregation),
+         (('Depreciation Method',), 'Unknown Depreciation Method', _depreciation_method)]
+
+
+def _text(raw):
+    """
+    whether a column can hold strings, object or the pandas string dtype
+    """
+    return pd.api.types.is_object_dtype(raw) or pd.api.types.is_string_dtype(raw)
+
+
+def blank(raw):
+    """
+    missing values of a column: None, NaN and blank strings
+    """
+    empty = raw.isna().to_numpy(dtype=bool, copy=True)
+    if _text(raw):
+        empty |= raw.astype(str).str.strip().eq('').to_numpy(dtype=bool)
+    return empty
+
+
+def _numbers(raw):
+    if raw.dtype == bool:
+        return raw.values.astype(float)
+    return pd.to_numeric(raw, errors='coerce').values.astype(float)
+
+
+def _bounds(key, minimum, maximum):
+    if maximum == INF:
+        return '{0:s} should be at least {1:g}'.format(key, minimum)
+    return '{0:s} should be between {1:g} and {2:g}'.format(key, minimum, maximum)
+
+
+class Schema(object):
+    """
+    compiled schema: the keys grouped by kind, the bounds of the numeric keys as arrays
+    """
+
+    def __init__(self, fields=None, rules=None):
+        """
+        :param fields: [optional] dict, key -> (kind, minimum, maximum, required), default FIELDS
+        :param rules: [optional] list of (keys, error, function), default RULES
+        """
+        self.fields = dict(FIELDS if fields is None else fields)
+        self.rules = list(RULES if rules is None else rules)
+        for key, (kind, minimum, maximum, required) in self.fields.items():
+            if kind not in KINDS:
+                raise ValueError('Unknown kind {0} of {1}, expected one of {2}'.format(kind, key, KINDS))
+        self.numeric = [k for k, f in self.fields.items() if f[0] in ('number', 'int')]
+        self.integers = np.array([self.fields[k][0] == 'int' for k in self.numeric], dtype=bool)
+        self.minimum = np.array([self.fields[k][1] for k in self.numeric], dtype=float)
+        self.maximum = np.array([self.fields[k][2] for k in self.numeric], dtype=float)
+        self.flags = [k for k, f in self.fields.items() if f[0] == 'flag']
+        self.texts = [k for k, f in self.fields.items() if f[0] in ('text', 'date')]
+        self.required = [k for k, f in self.fields.items() if f[3]]
+
+    def validate(self, scenarios):
+        """
+        check and normalize a batch of scenarios
+
+        :param scenarios: list of scenario dicts, or pandas.DataFrame, one scenario per row
+        :return: dict: 'scenarios', list of the normalized scenario dicts; 'valid', boolean array, one per row;
+                 'errors', pandas.DataFrame of the errors, 'Row', 'Key', 'Value' and 'Error', one row per error;
+                 'messages', list of the errors of each row joined, None for a valid row
+        """
+        records = None
+        if isinstance(scenarios, pd.DataFrame):
+            frame = scenarios.reset_index(drop=True)
+        else:
+            records = list(scenarios)
+            frame = pd.DataFrame(records, columns=list(dict.fromkeys(k for s in records for k in s)))
+        rows = len(frame)
+        errors = []
+
+        def report(mask, key, error):
+            r = np.flatnonzero(mask)
+            if r.size:
+                raw = frame[key].values[r] if key in frame.columns else np.full(r.size, None)
+                errors.append(pd.DataFrame({'Row': r, 'Key': key, 'Value': raw, 'Error': error}))
+
+        # numbers and integers, a matrix of rows x keys
+        values = np.full((rows, len(self.numeric)), np.nan)
+        missing = np.ones(values.shape, dtype=bool)
+        for j, key in enumerate(self.numeric):
+            if key in frame.columns:
+                missing[:, j] = blank(frame[key])
+                values[:, j] = _numbers(frame[key])
+        invalid = ~missing & ~np.isfinite(values)
+        rounded = np.round(values)
+        not_integer = self.integers & np.isfinite(values) & (np.abs(values - rounded) > 1e-9)
+        values = np.where(self.integers, rounded, values)
+        with np.errstate(invalid='ignore'):
+            out_of_range = ~invalid & ~not_integer & ((values < self.minimum) | (values > self.maximum))
+        invalid |= not_integer
+        values[invalid] = np.nan
+        for j, key in enumerate(self.numeric):
+            kind, minimum, maximum, required = self.fields[key]
+            if required:
+                report(missing[:, j], key, '{0:s} is missing'.format(key))
+            report(invalid[:, j], key, '{0:s} should be {1:s}'.format(key, 'an integer' if kind == 'int'
+                                                                      else 'a number'))
+            report(out_of_range[:, j], key, _bounds(key, minimum, maximum))
+
+        columns = {}
+        arrays = {}
+        for j, key in enumerate(self.numeric):
+            arrays[key] = values[:, j]
+            if key not in frame.columns:
+                continue
+            if self.integers[j]:
+                column = np.where(np.isnan(values[:, j]), 0, values[:, j]).astype(np.int64).astype(object)
+            else:
+                column = values[:, j].astype(object)
+            column[missing[:, j]] = None
+            column[invalid[:, j]] = frame[key].values[invalid[:, j]]
+            columns[key] = column
+
+        # flags
+        for key in self.flags:
+            if key not in frame.columns:
+                arrays[key] = np.zeros(rows, dtype=bool)
+                continue
+            raw = frame[key]
+            empty = blank(raw)
+            flags = _numbers(raw)
+            if _text(raw):
+                words = raw.astype(str).str.strip().str.lower().map(_WORDS).values.astype(float)
+                flags = np.where(np.isfinite(flags), flags, words)
+            known = np.isfinite(flags)
+            flag = known & (flags > 0)
+            wrong = ~empty & ~known
+            report(wrong, key, '{0:s} should be True or False'.format(key))
+            arrays[key] = flag
+            column = flag.astype(object)
+            column[wrong] = raw.to_numpy(dtype=object)[wrong]
+            columns[key] = column
+
+        # texts and dates, kept as given
+        for key in self.texts:
+            if key not in frame.columns:
+                arrays[key] = np.full(rows, None, dtype=object)
+                continue
+            raw = frame[key]
+            empty = blank(raw)
+            column = raw.to_numpy(dtype=object, copy=True)
+            column[empty] = None
+            if self.fields[key][0] == 'date':
+                dates = pd.to_datetime(raw.where(~empty), errors='coerce').values
+                report(~empty & pd.isna(dates), key, '{0:s} should be a date'.format(key))
+            arrays[key] = column
+            columns[key] = column
+
+        for key in self.required:
+            if self.fields[key][0] not in ('number', 'int'):
+                report(blank(frame[key]) if key in frame.columns else np.ones(rows, dtype=bool), key,
+                       '{0:s} is missing'.format(key))
+
+        for keys, error, rule in self.rules:
+            report(np.asarray(rule(arrays), dtype=bool), keys[0], error)
+
+        if errors:
+            errors = pd.concat(errors, ignore_index=True).sort_values('Row', kind='mergesort').reset_index(drop=True)
+        else:
+            errors = pd.DataFrame(columns=['Row', 'Key', 'Value', 'Error'])
+        valid = np.ones(rows, dtype=bool)
+        valid[errors['Row'].values.astype(int)] = False
+        messages = [None] * rows
+        for row, error in errors.groupby('Row', sort=False)['Error'].agg('; '.join).items():
+            messages[int(row)] = error
+
+        # rows of python values, zipped column by column
+        if records is not None:
+            keys = list(columns)
+            values = zip(*[columns[k].tolist() for k in keys]) if keys else [()] * rows
+            normalized = [dict(s, **{k: v for k, v in zip(keys, row) if k in s}) for s, row in zip(records, values)]
+        else:
+            keys = list(frame.columns)
+            values = zip(*[(columns[k] if k in columns else frame[k].values).tolist() for k in keys]) if keys else \
+                [()] * rows
+            normalized = [dict(zip(keys, row)) for row in values]
+        return {'scenarios': normalized, 'valid': valid, 'errors': errors, 'messages': messages}
+
+
+SCHEMA = Schema()
+
+
+def validate(scenarios, schema=None):
+    """
+    check and normalize a batch of scenarios, see Schema.validate
+    :param scenarios: list of scenario dicts, or pandas.DataFrame
+    :param schema: [optional] Schema, default SCHEMA
+    """
+    return (schema or SCHEMA).validate(scenarios)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+equity waterfall between limited partners (LP) and the general partner (GP):
+    return of capital and preferred return, pro rata to the contributions
+    GP catch-up to its carried interest
+    IRR hurdle tiers, each with its own GP split
+    distributions by tier and cash flows, IRR and multiple of each class
+
+every row of a cash flow matrix is a path, a deal or a sweep point: the waterfall runs
+period by period on all rows at once. Negative cash flows are contributions, called pro
+rata to 'LP Share'; positive cash flows are distributed down the tiers. Hurdles are
+tracked as LP accounts compounding at the hurdle rate, the LP IRR reaches a hurdle when
+its account is paid down, so rates are per period of the cash flows, annual for the
+results of investment_scenario.
+
+structure, a dict:
+    'LP Share'              share of the contributions from the LPs, the GP co-invests the rest
+    'Preferred Return'      LP IRR returned pro rata before any promote
+    'Catch Up'              [optional] GP share of the catch-up tier, 0 for no catch-up
+    'Carry'                 GP share of the distributions above the preferred return, and of the
+                            profits once caught up
+    'Hurdles'               [optional] list of (LP IRR, GP split), the GP split of the distributions
+                            once the LP IRR reaches the hurdle
+
+"""
+
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.financials as fin
+
+CLASSES = ('LP', 'GP')
+
+
+def tiers(structure):
+    """
+    tiers of a structure, in order
+    :return: list of (name, hurdle, GP split), hurdle None for the catch-up and the last tier
+    """
+    lp_share = float(structure['LP Share'])
+    carry = float(structure.get('Carry', 0))
+    catch_up = float(structure.get('Catch Up') or 0)
+    if not 0 < lp_share <= 1:
+        raise ValueError('LP Share should be in (0, 1], got {0}'.format(lp_share))
+    if catch_up and not carry < catch_up <= 1:
+        raise ValueError('Catch Up should be above the Carry and at most 1, got {0}'.format(catch_up))
+
+    result = [('Preferred Return', float(structure['Preferred Return']), 1 - lp_share)]
+    if catch_up:
+        result.append(('Catch Up', None, catch_up))
+    split = carry
+    for hurdle, gp_split in sorted(structure.get('Hurdles') or [], key=lambda h: h[0]):
+        if hurdle <= result[0][1]:
+            raise ValueError('Hurdle {0} should be above the Preferred Return'.format(hurdle))
+        result.append(('Hurdle {0:g}'.format(hurdle), float(hurdle), split))
+        split = float(gp_split)
+    result.append(('Residual', None, split))
+    for name, hurdle, gp_split in result:
+        if not 0 <= gp_split < 1 and not (name == 'Catch Up' and gp_split == 1):
+            raise ValueError('GP split of {0} should be in [0, 1), got {1}'.format(name, gp_split))
+    return result
+
+
+def distribute(cash_flows, structure):
+    """
+    run the waterfall on cash flow vectors
+
+    :param cash_flows: cash flow vector, or array of vectors, one per row: deals, paths, or both,
+                       e.g. (deals, paths, periods); trailing zeros pad vectors of different lengths
+    :param structure: dict, see the module
+    :return: dict: 'LP Cash Flows' and 'GP Cash Flows', contributions negative, same shape as the cash flows;
+             'Tier Distributions', dict tier -> distributions, same shape;
+             'LP IRR', 'GP IRR', 'LP Multiple', 'GP Multiple' and 'GP Promote', one per row
+    """
+    values = np.asarray(cash_flows, dtype=float)
+    flows = values.reshape(-1, values.shape[-1])
+    rows, periods = flows.shape
+    tier_list = tiers(structure)
+    lp_share = float(structure['LP Share'])
+    carry = float(structure.get('Carry', 0))
+    catch_up = float(structure.get('Catch Up') or 0)
+
+    # LP accounts, one per hurdle: what the LPs need to reach the hurdle IRR
+    hurdles = np.array([hurdle for name, hurdle, split in tier_list if hurdle is not None])
+    accounts = np.zeros((len(hurdles), rows))
+    lp = np.zeros((rows, periods))
+    gp = np.zeros((rows, periods))
+    by_tier = np.zeros((len(tier_list), rows, periods))
+    net = {'LP': np.zeros(rows), 'GP': np.zeros(rows)}
+
+    for t in range(periods):
+        accounts *= 1 + hurdles[:, np.newaxis]
+        calls = np.minimum(flows[:, t], 0)
+        available = np.maximum(flows[:, t], 0)
+        lp[:, t] = lp_share * calls
+        gp[:, t] = calls - lp[:, t]
+        accounts -= lp[:, t]
+        net['LP'] += lp[:, t]
+        net['GP'] += gp[:, t]
+
+        account = 0
+        for k, (name, hurdle, split) in enumerate(tier_list):
+            if not available.any():
+                break
+            if hurdle is not None:
+                need = np.maximum(accounts[account], 0) / (1 - split)
+                account += 1
+            elif name == 'Catch Up':
+                # until the GP profits are the carry of all the profits
+                need = np.maximum(carry * (net['LP'] + net['GP']) - net['GP'], 0) / (catch_up - carry)
+            else:
+                need = available
+            amount = np.minimum(available, need)
+            available = available - amount
+            lp_amount = (1 - split) * amount
+            lp[:, t] += lp_amount
+            gp[:, t] += amount - lp_amount
+            accounts -= lp_amount
+            net['LP'] += lp_amount
+            net['GP'] += amount - lp_amount
+            by_tier[k, :, t] = amount
+
+    shape = values.shape[:-1]
+    result = {'LP Cash Flows': lp.reshape(values.shape), 'GP Cash Flows': gp.reshape(values.shape),
+              'Tier Distributions': {name: by_tier[k].reshape(values.shape)
+                                     for k, (name, hurdle, split) in enumerate(tier_list)}}
+    for name, cf in (('LP', lp), ('GP', gp)):
+        contributions = -np.minimum(cf, 0).sum(1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            multiple = np.where(contributions > 0, np.maximum(cf, 0).sum(1) / contributions, np.nan)
+        result[name + ' IRR'] = fin.irr(cf).reshape(shape)
+        result[name + ' Multiple'] = multiple.reshape(shape)
+    # GP distributions above its pro rata share of all distributions
+    distributions = np.maximum(flows, 0).sum(1)
+    result['GP Promote'] = (np.maximum(gp, 0).sum(1) - (1 - lp_share) * distributions).reshape(shape)
+    return result
+
+
+def stack(results, after_tax=False):
+    """
+    cash flow matrix of results of investment_scenario, one row each, padded with zeros
+    :param results: list of results of investment_scenario
+    :param after_tax: the after tax cash flows, default before tax
+    :return: numpy array (results, periods)
+    """
+    key = 'cash flows after tax' if after_tax else 'cash flows before tax'
+    vectors = [np.asarray(r[key], dtype=float) for r in results]
+    flows = np.zeros((len(vectors), max(len(v) for v in vectors)))
+    for i, v in enumerate(vectors):
+        flows[i, :len(v)] = v
+    return flows
+
+
+def waterfall(result, structure, after_tax=False):
+    """
+    waterfall of one result of investment_scenario, by year
+    :param result: result of investment_scenario
+    :param structure: dict, see the module
+    :param after_tax: the after tax cash flows, default before tax
+    :return: dict: 'distributions', pandas.DataFrame by year of the cash flows, the tiers and the classes;
+             'summary', dict of the IRR and multiple of each class and the GP promote
+    """
+    key = 'cash flows after tax' if after_tax else 'cash flows before tax'
+    flows = np.asarray(result[key], dtype=float)
+    w = distribute(flows, structure)
+    table = pd.DataFrame({'Cash Flows': flows}, index=pd.Index(np.arange(len(flows)), name='Year'))
+    for name, values in w['Tier Distributions'].items():
+        table[name] = values
+    for name in CLASSES:
+        table[name] = w[name + ' Cash Flows']
+    summary = {key: float(w[key]) for key in ('LP IRR', 'GP IRR', 'LP Multiple', 'GP Multiple', 'GP Promote')}
+    return {'distributions': table, 'summary': summary}
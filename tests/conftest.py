@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+shared fixtures: a single family deal and its base scenario
+
+the modules import each other as Realmly.analytics..., so the checkout is mapped to
+the Realmly package when it is not installed under that name
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import Realmly  # noqa: F401
+except ImportError:
+    package = types.ModuleType('Realmly')
+    package.__path__ = [ROOT]
+    sys.modules['Realmly'] = package
+
+DEAL = {'Class': 'Residential', 'Land Value': 50000., 'Street Number': 1, 'Street Prefix': 'N',
+        'Street Name': 'Main', 'Street Suffix': 'St', 'City': 'Austin', 'State': 'TX',
+        'List Price': 310000., 'Zip Code': '78701', 'Type': 'SFR', 'Number of Units': 1}
+
+SCENARIO = {'Purchase Price': 300000., 'Purchase Costs': 9000., 'Loan': 0.75, 'Rate': 0.045,
+            'Amortization Period': 30, 'Payments Per Year': 12, 'Interests Only': False, 'IO Period': 0,
+            'Rent': 2200., 'Rent Inflation': 0.03, 'Rent Payments Per Year': 12, 'Vacancy': 0.05,
+            'Other Income': 0., 'Property Tax': 6000., 'Property Tax Inflation': 0.02,
+            'Insurance': 1200., 'Insurance Inflation': 0.03, 'Utilities': 600., 'Utility Inflation': 0.02,
+            'Maintenance': 1500., 'Maintenance Inflation': 0.03, 'Tenant Turnover Costs': 500.,
+            'Advertising': 100., 'Administrative': 200., 'Realmly Fee': 0.02, 'Property Management Fee': 0.08,
+            'Years': 10, 'Selling Commissions': 0.06, 'Other Selling Costs': 0., 'Price Appreciation': 0.03,
+            'Capital Gain Tax': 0.15, 'Income Tax': 0.3, 'Depreciation Recapture Tax': 0.25,
+            'Scenario Name': 'Base'}
+
+
+@pytest.fixture
+def deal():
+    return dict(DEAL)
+
+
+@pytest.fixture
+def scenario():
+    return dict(SCENARIO)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.adaptive as adaptive
+import Realmly.analytics.financials as fin
+
+
+def irr(deal, scenario, rent):
+    return fin.investment_scenario(deal, dict(scenario, Rent=rent))['disposal']['IRR After Tax']
+
+
+def test_one_key_boundary(deal, scenario):
+    result = adaptive.adaptive_sweep(deal, scenario, {'Rent': (1500., 3000.)}, {'IRR After Tax': 0.1},
+                                     coarse=4, max_depth=4, processes=1)
+    assert result['dense evaluations'] == 3 * 16 + 1
+    assert result['evaluations'] < result['dense evaluations']
+    cells = result['cells']
+    assert len(cells) == 1 and cells['Depth'].tolist() == [4]
+    low, high = cells.loc[0, 'Rent Low'], cells.loc[0, 'Rent High']
+    assert high - low == pytest.approx(1500. / 48)
+    assert irr(deal, scenario, low) < 0.1 <= irr(deal, scenario, high)
+    rent = result['boundary']['Rent'].tolist()
+    assert len(rent) == 1 and low <= rent[0] <= high
+    points = result['points'].sort_values('Rent')
+    assert points['Pass'].tolist() == sorted(points['Pass'].tolist())
+
+
+def test_two_keys_within_budget(deal, scenario):
+    result = adaptive.adaptive_sweep(deal, scenario, {'Rent': (1500., 3000.), 'Rate': (0.03, 0.08)},
+                                     {'IRR After Tax': 0.1, 'Minimum Debt Coverage Ratio': 1.0}, coarse=3,
+                                     max_depth=3, budget=40, metrics=['IRR Before Tax'], processes=1)
+    points = result['points']
+    assert result['evaluations'] == len(points) <= 40
+    assert points.columns.tolist() == ['Rent', 'Rate', 'IRR After Tax', 'Minimum Debt Coverage Ratio',
+                                       'IRR Before Tax', 'Pass']
+    assert points['Pass'].any() and not points['Pass'].all()
+    assert len(result['cells']) > 0 and len(result['boundary']) > 0
+    with pytest.raises(ValueError):
+        adaptive.adaptive_sweep(deal, scenario, {'Rent': (1500., 3000.), 'Rate': (0.03, 0.08)},
+                                {'IRR After Tax': 0.1}, coarse=3, budget=5, processes=1)
+
+
+def test_crashed_points_raise(deal, scenario):
+    with pytest.raises(ValueError, match='failed to project'):
+        adaptive.adaptive_sweep(deal, scenario, {'Amortization Period': (0, 30)}, {'IRR After Tax': 0.1}, coarse=3,
+                                processes=1)
+
+
+def test_unsolvable_metrics_fail_the_hurdle():
+    margins = adaptive._margins(np.array([[0.12, 1.3], [np.nan, 2.0], [0.08, 1.3]]),
+                                {'IRR After Tax': 0.1, 'Minimum Debt Coverage Ratio': 1.25})
+    assert margins[0] == pytest.approx(0.05 / 1.25) and margins[1] == -np.inf and margins[2] < 0
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.backend as backend
+import Realmly.analytics.financials as fin
+import Realmly.analytics.money as money
+
+
+@pytest.fixture
+def restore_backend():
+    name = backend.get_backend()
+    yield
+    backend.set_backend(name)
+
+
+def test_set_backend(restore_backend):
+    assert 'numpy' in backend.BACKENDS
+    backend.set_backend('numpy')
+    assert backend.get_backend() == 'numpy'
+    assert backend.kernel('irr') is backend._numpy_irr
+    with pytest.raises(ValueError):
+        backend.set_backend('fortran')
+
+
+def test_numpy_irr_kernel():
+    flows = np.array([[-100., 110., 0.], [-100., 0., 121.]])
+    rates = np.full(2, 0.5)
+    unconverged = backend.kernel('irr')(flows, rates, 1e-12, 100)
+    assert not unconverged.any()
+    np.testing.assert_allclose(rates, [0.1, 0.1])
+    rates = np.full(1, 0.1)
+    assert backend.kernel('irr')(np.array([[100., 10.]]), rates, 1e-12, 100).all()
+
+
+def test_verify_numpy_backend():
+    result = backend.verify_backend('numpy', loans=20, payments=36, rows=200)
+    assert result['Backend'] == 'numpy'
+    assert result['Schedule Mismatches'] == 0
+    assert result['IRR Max Difference'] == 0 and result['IRR Unconverged Mismatches'] == 0
+
+
+def test_numba_loops_in_python(monkeypatch):
+    # the loops of the numba backend run as plain python, with or without numba installed
+    for name in ('_round', '_amortize_loop', '_irr_loop'):
+        function = getattr(backend, name)
+        monkeypatch.setattr(backend, name, getattr(function, 'py_func', function))
+    monkeypatch.setitem(backend._KERNELS, 'numba', {'amortize': backend._numba_amortize, 'irr': backend._numba_irr})
+    result = backend.verify_backend('numba', loans=5, payments=36, rows=50)
+    assert result['Schedule Mismatches'] == 0 and result['IRR Unconverged Mismatches'] == 0
+    assert result['IRR Max Difference'] < 1e-10
+    for mode in money.ROUNDING_MODES:
+        halves = np.array([-2.5, -1.5, -0.5, 0.5, 1.5, 2.5, 2.4, -2.6])
+        code = money.ROUNDING_MODES.index(mode)
+        assert [backend._round(x, code) for x in halves] == money.round_to_int(halves, mode).tolist()
+    # no root, no convergence
+    assert backend._numba_irr(np.array([[100., 10.]]), np.full(1, 0.1), 1e-12, 100).all()
+
+
+def test_numba_parity(restore_backend, deal, scenario):
+    pytest.importorskip('numba')
+    result = backend.verify_backend('numba', loans=50, payments=120, rows=500)
+    assert result['Schedule Mismatches'] == 0 and result['IRR Unconverged Mismatches'] == 0
+    assert result['IRR Max Difference'] < 1e-10
+    reference = fin.investment_scenario(deal, scenario)
+    backend.set_backend('numba')
+    compiled = fin.investment_scenario(deal, scenario)
+    assert compiled['disposal'] == reference['disposal']
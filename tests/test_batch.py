@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import numpy as np
+
+import Realmly.analytics.batch as batch
+
+
+def test_find_workbooks(tmp_path):
+    (tmp_path / 'deals').mkdir()
+    for name in ('a.xlsx', 'deals/b.xlsx', 'deals/~$b.xlsx', 'deals/PROJECTION_b.xlsx', 'notes.txt'):
+        (tmp_path / name).write_text('')
+    files = batch.find_workbooks([str(tmp_path), str(tmp_path / 'a.xlsx')])
+    assert files == [str(tmp_path / 'a.xlsx'), str(tmp_path / 'deals' / 'b.xlsx')]
+
+
+def test_read_journal_skips_cut_records(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    journal.write_text(json.dumps({'file': 'a', 'status': 'failed'}) + '\n' +
+                       json.dumps({'file': 'a', 'status': 'ok', 'scenarios': []}) + '\n\n{"file": "b", "sta')
+    assert batch.read_journal(str(journal)) == {'a': {'file': 'a', 'status': 'ok', 'scenarios': []}}
+    assert batch.read_journal(str(tmp_path / 'missing.jsonl')) == {}
+
+
+def test_summarize_journal():
+    records = {'a': {'file': 'a', 'status': 'ok',
+                     'scenarios': [{'Scenario Name': 'Base', 'IRR After Tax': 0.09},
+                                   {'Scenario Name': 'Low', 'IRR After Tax': 0.05}]},
+               'b': {'file': 'b', 'status': 'failed', 'error': 'ValueError: bad'}}
+    summary = batch.summarize_journal(records)
+    assert summary['File'].tolist() == ['a', 'a', 'b']
+    assert summary['Scenario Name'].tolist()[:2] == ['Base', 'Low']
+    assert summary['Error'].tolist()[2] == 'ValueError: bad'
+
+
+def test_json_value():
+    assert type(batch.json_value(np.float64(0.5))) is float
+    assert type(batch.json_value(np.int64(3))) is int
+    assert batch.json_value('Base') == 'Base'
+
+
+def test_run_records_failures_and_resumes(tmp_path):
+    files = [str(tmp_path / 'missing_{0:d}.xlsx'.format(i)) for i in range(2)]
+    journal = str(tmp_path / 'out' / 'journal.jsonl')
+    records = batch.run(files, journal=journal, processes=1, print_flag=False, progress=False)
+    assert sorted(records) == files
+    assert all(r['status'] == 'failed' and r['error'].startswith('FileNotFoundError') for r in records.values())
+    assert len(open(journal).readlines()) == 2
+
+    # failed files are done unless retried
+    batch.run(files, journal=journal, processes=1, print_flag=False, progress=False)
+    assert len(open(journal).readlines()) == 2
+    batch.run(files, journal=journal, processes=1, print_flag=False, progress=False, retry_failed=True)
+    assert len(open(journal).readlines()) == 4
+    assert os.path.isdir(str(tmp_path / 'out'))
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.capital as capital
+import Realmly.analytics.financials as fin
+
+
+def test_candidates_skip_io_periods_past_the_term():
+    table = capital.candidates([0.5, 0.7], io_periods=(0, 5, 30), amortization_periods=(25, 30))
+    # a 30 year interest only period leaves nothing to amortize
+    assert len(table) == 2 * 2 * 2
+    assert (table['IO Period'] < table['Amortization Period']).all()
+
+
+def test_evaluate_matches_investment_scenario(deal, scenario):
+    table = capital.candidates([0.6, 0.75], io_periods=(0, 3), amortization_periods=(30,))
+    result = capital.evaluate(deal, scenario, table)
+    for _, row in result.iterrows():
+        io_period = int(row['IO Period'])
+        s = dict(scenario, **{'Loan': row['Loan'], 'Interests Only': io_period > 0, 'IO Period': io_period})
+        disposal = fin.investment_scenario(deal, s)['disposal']
+        assert row['IRR After Tax'] == disposal['IRR After Tax']
+        assert row['IRR Before Tax'] == disposal['IRR Before Tax']
+
+
+def test_thin_margin_interest_only_candidates(deal, scenario):
+    # cash flows change sign when the IO period ends, IRRs off the Newton path
+    thin = dict(scenario, Rent=2000., Rate=0.07)
+    result = capital.optimize(deal, thin)
+    table = result['candidates']
+    assert len(table) == 170
+    assert table.loc[table['IO Period'] > 0, 'IRR After Tax'].notna().all()
+    assert result['best'] is not None and result['best']['Feasible']
+
+
+def test_unsolvable_candidates_are_infeasible(deal, scenario):
+    losing = dict(scenario, Rent=300., Rate=0.07, **{'Price Appreciation': -0.05})
+    result = capital.optimize(deal, losing, min_dscr=None, max_ltv=None, ltvs=[0, 0.5, 0.8])
+    table = result['candidates']
+    unsolved = table['IRR After Tax'].isna()
+    assert unsolved.any()
+    assert not table.loc[unsolved, 'Feasible'].any()
+    assert np.isfinite(result['best']['IRR After Tax'])
+
+
+def test_optimize_rejects_unknown_objective(deal, scenario):
+    with pytest.raises(ValueError):
+        capital.optimize(deal, scenario, objective='Cash')
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import Realmly.analytics.comps as comps
+
+
+@pytest.fixture
+def store():
+    dates = pd.date_range('2015-01-01', periods=11, freq='YS')
+    rows = []
+    for i, date in enumerate(dates):
+        rows.append({'Zip Code': '78701', 'Type': 'SFR', 'Date': date, 'Rent': 2000. + 50 * i, 'Vacancy': 0.05,
+                     'Price': 300000. * 1.04 ** i})
+        rows.append({'Zip Code': '78701', 'Type': 'Condo', 'Date': date, 'Rent': 1500. + 20 * i, 'Vacancy': 0.07,
+                     'Price': np.nan})
+    # shuffled rows, the store sorts them
+    return comps.CompsStore(pd.DataFrame(rows).sample(frac=1, random_state=0))
+
+
+def test_normalize():
+    assert comps.normalize_zip_codes([78701, 78701.0, '78701-1234', ' 2134']).tolist() == \
+        ['78701', '78701', '78701', '02134']
+    assert comps.normalize_types([' sfr', None]).tolist() == ['SFR', '']
+
+
+def test_query(store):
+    rows = store.query(78701, 'sfr', start='2020-01-01', end='2022-12-31')
+    assert rows['Date'].dt.year.tolist() == [2020, 2021, 2022]
+    assert rows['Rent'].tolist() == [2250., 2300., 2350.]
+    assert len(store.query('78701')) == 22
+    assert store.query('10001').empty
+
+
+def test_latest(store):
+    rent = store.latest('Rent', ['78701', '78701', '78701', '10001'], ['SFR', 'Condo', 'Duplex', 'SFR'],
+                        as_of='2018-06-30')
+    # a type without comps gets the average of the zip code
+    np.testing.assert_allclose(rent[:3], [2150., 1560., (2150. + 1560.) / 2])
+    assert np.isnan(rent[3])
+    assert store.latest('Rent', ['78701'], ['SFR'])[0] == 2500.
+
+
+def test_appreciation(store):
+    rates = store.appreciation(['78701', '78701'], ['SFR', 'Condo'], years=5)
+    assert rates[0] == pytest.approx(0.04, abs=2e-4)
+    # the condo has no price of its own, its zip code has
+    assert rates[1] == pytest.approx(rates[0])
+
+
+def test_fill_scenarios(store, deal, scenario):
+    duplex = dict(deal, Type='Duplex', **{'Number of Units': 2})
+    scenarios = [dict(scenario, Rent=None), dict(scenario, Rent=None), dict(scenario, Rent=None)]
+    filled = comps.fill_scenarios(store, [deal, duplex, dict(deal, **{'Zip Code': '10001'})], scenarios)
+    assert filled[0]['Rent'] == 2500. and filled[0]['Vacancy'] == scenario['Vacancy']
+    assert filled[1]['Rent'] == round(2 * (2500. + 1700.) / 2)
+    assert filled[2]['Rent'] is None
+    assert scenarios[0]['Rent'] is None
+    overwritten = comps.fill_scenarios(store, [deal], [scenario], overwrite=True)[0]
+    assert overwritten['Vacancy'] == 0.05 and overwritten['Price Appreciation'] == pytest.approx(0.04, abs=2e-4)
+    with pytest.raises(ValueError):
+        comps.fill_scenarios(store, [deal], [])
+
+
+def test_load_comps(tmp_path, store):
+    path = str(tmp_path / 'comps.csv')
+    store.query('78701').to_csv(path, index=False)
+    loaded = comps.load_comps(path)
+    assert len(loaded) == len(store)
+    assert loaded.latest('Rent', ['78701'], ['SFR'])[0] == 2500.
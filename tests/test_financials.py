@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import Realmly.analytics.financials as fin
+
+
+def test_investment_scenario(deal, scenario, capsys):
+    s = fin.investment_scenario(deal, scenario)
+    assert s['disposal']['IRR After Tax'] == pytest.approx(0.09, abs=0.005)
+    assert len(s['cf']) == scenario['Years'] + 1
+    assert capsys.readouterr().out == ''
+
+
+@pytest.mark.parametrize('years', [None, 'ten', 0])
+def test_investment_scenario_needs_years(deal, scenario, years):
+    with pytest.raises(ValueError, match='Years should be a positive number of years'):
+        fin.investment_scenario(deal, dict(scenario, Years=years))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import Realmly.analytics.financials as fin
+from Realmly.analytics.graph import Graph
+
+
+def test_graph_caches_until_an_input_changes():
+    g = Graph()
+    g.input('rate', 0.05)
+    g.input('amount', 1000.)
+    g.node('interest', lambda v: v['rate'] * v['amount'], ['rate', 'amount'])
+    g.node('tax', lambda v: v['interest'] * 0.3, ['interest'])
+    assert g['tax'] == pytest.approx(15.)
+    assert g.evaluations == 2
+    g['amount'] = 1000.
+    assert g.cached('tax')
+    g['rate'] = 0.06
+    assert not g.cached('interest') and not g.cached('tax')
+    assert g['tax'] == pytest.approx(18.)
+    assert g.evaluations == 4
+    assert g.downstream('rate') == {'interest', 'tax'}
+    assert g.inputs() == ['rate', 'amount']
+
+
+def test_graph_errors():
+    g = Graph()
+    g.input('rate')
+    with pytest.raises(KeyError):
+        g.node('interest', lambda v: v['amount'], ['amount'])
+    with pytest.raises(KeyError):
+        g.input('rate')
+    g.node('double', lambda v: 2 * v['rate'], ['rate'])
+    with pytest.raises(KeyError):
+        g.set('double', 1)
+    with pytest.raises(KeyError):
+        g.get('missing')
+
+
+def test_projection_graph_edits(deal, scenario):
+    g = fin.projection_graph(deal, scenario)
+    g.get('result')
+    g.update({'Insurance Inflation': 0.04, 'Vacancy': 0.08})
+    assert g.cached('loan') and g.cached('asset values')
+    assert not g.cached('operating lines')
+    edited = g.get('result')
+    fresh = fin.investment_scenario(deal, dict(scenario, **{'Insurance Inflation': 0.04, 'Vacancy': 0.08}))
+    for key in ('is', 'bs', 'cf', 'ratios'):
+        pd.testing.assert_frame_equal(edited[key], fresh[key])
+    assert edited['disposal'] == fresh['disposal']
+
+
+def test_gross_rent_multiplier(deal, scenario):
+    ratios = fin.investment_scenario(deal, scenario)['ratios']
+    multiplier = ratios['Gross Rent Multiplier'].values
+    assert multiplier[0] == 0
+    assert np.all(np.isfinite(multiplier)) and np.all(multiplier[1:] > 0)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.financials as fin
+
+
+def test_growth_factors():
+    growth = fin.growth_factors([0.03, 0.0, 0.03], 5)
+    assert growth.shape == (3, 5)
+    np.testing.assert_allclose(growth[0], 1.03 ** np.arange(5))
+    np.testing.assert_array_equal(growth[1], np.ones(5))
+    np.testing.assert_array_equal(growth[0], growth[2])
+    assert fin.growth_factors([], 5).shape == (0, 5)
+
+
+def test_growth_curves_are_cached_read_only():
+    fin.growth_factors([0.0425], 7)
+    curve = fin._growth_curves[(0.0425, 7)]
+    assert not curve.flags.writeable
+    fin.growth_factors([0.0425, 0.01], 7)
+    assert fin._growth_curves[(0.0425, 7)] is curve
+
+
+def test_inflate_batch():
+    amounts = np.array([[100., 200.], [300., 400.]])
+    rates = np.array([[0.02, 0.03], [0.03, 0.02]])
+    inflated = fin.inflate(amounts, rates, 4)
+    assert inflated.shape == (2, 2, 4)
+    np.testing.assert_allclose(inflated[1, 0], 300. * 1.03 ** np.arange(4))
+    np.testing.assert_allclose(inflated[0, 1], 200. * 1.03 ** np.arange(4))
+
+
+def _projection_settings():
+    purchase = {'price': 300000., 'buying costs': 9000.}
+    loan = {'loan': 225000., 'rate': 0.045, 'amortization period': 30, 'payments per year': 12}
+    income = {'rent': 2200., 'rent inflation': 0.03, 'payments per year': 12, 'vacancy': 0.05,
+              'Utilities': 600., 'Utility Inflation': 0.02}
+    operation = {'insurance': 0.004, 'insurance inflation': 0.03, 'maintenance': 0.005,
+                 'maintenance inflation': 0.03, 'property management fee': 0.08, 'realm fee': 0.02,
+                 'tenant turnover cost': 500.}
+    sale = {'appreciation': 0.03, 'broker commissions': 0.06}
+    tax = {'capital gain tax': 0.15, 'depreciation recapture tax': 0.25, 'income tax': 0.3, 'land value': 50000.,
+           'property tax': 6000., 'property tax inflation': 0.02}
+    return purchase, loan, income, operation, sale, tax
+
+
+def test_investment_projection():
+    purchase, loan, income, operation, sale, tax = _projection_settings()
+    s = fin.investment_projection(10, purchase, loan, income, operation, sale, tax)
+    assert s['disposal']['Gross Sales'] == round(300000. * 1.03 ** 10)
+    assert len(s['is']) == 11
+    np.testing.assert_allclose(s['is']['Property Taxes'].values[1:], 6000. * 1.02 ** np.arange(10), atol=1.)
+    assert np.isfinite(s['disposal']['IRR After Tax'])
+    with pytest.raises(ValueError):
+        fin.investment_projection(0, purchase, loan, income, operation, sale, tax)
+
+
+def test_investment_projection_depreciation_settings():
+    purchase, loan, income, operation, sale, tax = _projection_settings()
+    base = fin.investment_projection(10, purchase, loan, income, operation, sale, tax)
+    np.testing.assert_array_equal(base['is']['Depreciations'].values[1:], np.round(250000. / 27.5 * np.ones(10)))
+    tax.update({'depreciation method': 'MACRS 7', 'cost segregation 5 year': 0.2, 'bonus depreciation': 1.})
+    accelerated = fin.investment_projection(10, purchase, loan, income, operation, sale, tax)
+    assert accelerated['is']['Depreciations'].values[1] > base['is']['Depreciations'].values[1]
+    # taxes only: the after tax cash flows move, the before tax ones do not
+    assert accelerated['disposal']['IRR After Tax'] != base['disposal']['IRR After Tax']
+    assert accelerated['disposal']['IRR Before Tax'] == base['disposal']['IRR Before Tax']
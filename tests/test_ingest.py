@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pandas as pd
+import pytest
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.ingest as ingest
+
+
+@pytest.fixture
+def template(scenario):
+    # the purchase price of each listing is its list price
+    template = dict(scenario)
+    del template['Purchase Price']
+    return template
+
+
+@pytest.fixture
+def feed(tmp_path):
+    path = str(tmp_path / 'listings.csv')
+    pd.DataFrame({'id': ['a', 'b', 'c', 'd'],
+                  'Class': 'Residential', 'Land Value': 50000.,
+                  'zip': ['02134', '78701', '78702', '78703'],
+                  'price': [300000., 250000., 280000., 320000.],
+                  'Rent': ['', '1900', 'abc', '2400'],
+                  'Vacancy': [None, 2.0, 0.05, 0.05],
+                  'Number of Units': [1, 1, 1, 2]}).to_csv(path, index=False)
+    return path
+
+
+MAPPING = {'zip': 'Zip Code', 'price': 'List Price'}
+
+
+def test_feed_format():
+    assert ingest.feed_format('listings.jsonl.gz') == 'jsonl'
+    assert ingest.feed_format('LISTINGS.CSV') == 'csv'
+    assert ingest.feed_format('listings.txt.bz2') == 'csv'
+
+
+def test_listings(feed, template):
+    chunk = ingest.map_columns(next(ingest.read_feed(feed, text_columns=['zip'])), MAPPING)
+    items = ingest.listings(chunk, [template], id_column='id', first_row=10)
+    assert [ids for ids, deal, scenario, error in items][:2] == [{'Row': 10, 'id': 'a'}, {'Row': 11, 'id': 'b'}]
+    ids, deal, scenario, error = items[0]
+    assert deal['Zip Code'] == '02134' and deal['Number of Units'] == 1
+    assert scenario['Purchase Price'] == 300000. and scenario['Rent'] == template['Rent']
+    assert error is None
+    assert items[1][2]['Rent'] == 1900.
+    assert items[1][3] == 'Vacancy should be between 0 and 1'
+    assert items[2][3] == 'Rent should be a number'
+    # the mapped zip code column is read as text too
+    assert next(ingest.batches(feed, [template], MAPPING))[0][1]['Zip Code'] == '02134'
+
+
+def test_run_matches_the_projections(feed, template, deal):
+    counts = ingest.run(feed, [template], mapping=MAPPING, id_column='id', batch_size=3)
+    assert (counts['ok'], counts['failed'], counts['invalid']) == (2, 0, 2)
+    results = counts['results']
+    assert results['Status'].tolist() == ['ok', 'invalid', 'invalid', 'ok']
+    expected = fin.investment_scenario(dict(deal, **{'Number of Units': 2}),
+                                       dict(template, **{'Purchase Price': 320000., 'Rent': 2400.}))['disposal']
+    assert results.loc[3, 'IRR After Tax'] == expected['IRR After Tax']
+
+
+def test_output_columns_of_every_batch(tmp_path, feed, template):
+    # the first batch has no projection, its columns are those of the others
+    output = str(tmp_path / 'out' / 'results.csv')
+    failing = dict(template, **{'Scenario Name': 'No Term', 'Amortization Period': 0})
+    counts = ingest.run(feed, [failing, template], output=output, mapping=MAPPING, id_column='id', batch_size=1)
+    assert (counts['ok'], counts['failed'], counts['invalid']) == (2, 0, 6)
+    results = pd.read_csv(output)
+    assert results.columns.tolist() == ['Row', 'id', 'Scenario Name', 'Status', 'Error'] + list(ingest.SUMMARY_KEYS)
+    assert len(results) == 8
+    assert results['Row'].tolist() == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert results['Status'].tolist()[:2] == ['invalid', 'ok']
+
+
+def test_json_lines_on_a_pool(tmp_path, feed, template):
+    path = str(tmp_path / 'listings.jsonl')
+    with open(path, 'w') as fh:
+        for row in pd.read_csv(feed, dtype={'zip': str}).to_dict('records'):
+            fh.write(json.dumps(row) + '\n')
+    serial = ingest.run(feed, [template], mapping=MAPPING, batch_size=1)['results']
+    pooled = ingest.run(path, [template], mapping=MAPPING, batch_size=1, processes=2)['results']
+    pd.testing.assert_frame_equal(serial.drop(columns='Error'), pooled.drop(columns='Error'), check_dtype=False)
+
+
+def test_run_needs_templates(feed):
+    with pytest.raises(ValueError):
+        ingest.run(feed, [])
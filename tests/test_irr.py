@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.financials as fin
+
+
+def npv(rate, flows):
+    return np.sum(np.asarray(flows) / (1 + rate) ** np.arange(len(flows)))
+
+
+def test_irr_of_a_vector():
+    assert fin.irr([-100., 110.]) == pytest.approx(0.1)
+    flows = [-1000., 100., 120., 150., 1100.]
+    assert npv(fin.irr(flows), flows) == pytest.approx(0., abs=1e-8)
+
+
+def test_irr_of_padded_rows():
+    rates = fin.irr([[-100., 110., 0., 0.], [-100., 10., 10., 110.], [-100., 50., 50., 0.]])
+    np.testing.assert_allclose(rates, [0.1, 0.1, 0.], atol=1e-12)
+
+
+def test_irr_without_newton():
+    # two sign changes, roots 0.1 and 0.2: the one closest to 0
+    assert fin.irr([-100., 230., -132.]) == pytest.approx(0.1)
+    # no sign change, no rate
+    assert np.isnan(fin.irr([100., 10., 10.]))
+    assert np.isnan(fin.irr([0., 0., 0.]))
+    # Newton from the guess diverges
+    flows = [-100., 0., 0., 0., 0., 0., 0., 0., 0., 0., 1.e6]
+    assert npv(fin.irr(flows, guess=-0.99), flows) == pytest.approx(0., abs=1e-6)
+
+
+def test_exit_years(deal, scenario):
+    table = fin.exit_year_analysis(deal, scenario)
+    assert table.index.tolist() == list(range(1, 11))
+    for years in (3, 10):
+        disposal = fin.investment_scenario(deal, dict(scenario, Years=years))['disposal']
+        for key in ('Net Sales After Tax', 'Total Taxes', 'IRR After Tax', 'IRR Before Tax'):
+            assert table.loc[years, key] == disposal[key]
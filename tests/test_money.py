@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.money as money
+
+
+@pytest.mark.parametrize('mode, expected', [('half_even', [2, 2, -2, 3]), ('half_up', [3, 2, -3, 3]),
+                                            ('half_down', [2, 2, -2, 3]), ('floor', [2, 2, -3, 2]),
+                                            ('ceiling', [3, 3, -2, 3]), ('truncate', [2, 2, -2, 2])])
+def test_round_to_int(mode, expected):
+    assert money.round_to_int([2.5, 2.4, -2.5, 2.6], mode).tolist() == expected
+
+
+@pytest.mark.parametrize('mode', money.ROUNDING_MODES)
+def test_div_round_matches_round_to_int(mode):
+    n = np.arange(-1000, 1001)
+    np.testing.assert_array_equal(money.div_round(n, 8, mode), money.round_to_int(n / 8, mode))
+
+
+def test_cents():
+    assert money.to_cents([0.29, 1.005, -0.015], 'floor').tolist() == [29, 100, -2]
+    assert money.to_dollars(np.array([12345])).tolist() == [123.45]
+    with pytest.raises(ValueError):
+        money.round_to_int(1.5, 'nearest')
+    with pytest.raises(ValueError):
+        money.div_round(10, 0)
+
+
+def test_amortize_cents():
+    principal = money.to_cents([225000., 100000.])
+    payments, interests, principals, balances = money.amortize_cents(principal, np.array([0.045, 0.]) / 12, 360)
+    assert payments.dtype == np.int64 and payments.shape == (2, 360)
+    np.testing.assert_array_equal(principals.sum(1) + balances[:, -1], principal)
+    assert abs(balances[0, -1]) < 360
+    assert payments[1, 0] == money.div_round(principal[1], 360)
+    # interest of each period is the balance before it times the rate
+    before = np.concatenate(([principal[0]], balances[0, :-1]))
+    np.testing.assert_array_equal(interests[0], money.round_to_int(before * 0.045 / 12))
+
+
+def test_schedule_in_cents():
+    payments, interests, principals, balances = fin.amortize(225000., 0.045, 360, 12)
+    assert payments[0] == pytest.approx(1140.04, abs=0.005)
+    assert np.sum(np.round(principals, 2)) + balances[-1] == pytest.approx(225000., abs=1e-6)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.parallel as parallel
+
+
+def equity(result):
+    return result['bs']['Equity'].values[0]
+
+
+def test_grid():
+    table = parallel.grid(Rate=[0.04, 0.05], **{'Rent Inflation': [0.02, 0.03, 0.04]})
+    assert table.shape == (6, 2)
+    assert table.columns.tolist() == ['Rate', 'Rent Inflation']
+    assert table.iloc[1].tolist() == [0.04, 0.03]
+
+
+def test_sweep_matches_the_projections(deal, scenario):
+    table = parallel.grid(Rate=[0.04, 0.06], Years=[5, 10])
+    result = parallel.sweep(deal, scenario, table, metrics=('IRR After Tax', 'Minimum Debt Coverage Ratio', equity),
+                            processes=1)
+    assert result.columns.tolist() == ['Rate', 'Years', 'IRR After Tax', 'Minimum Debt Coverage Ratio', 'equity',
+                                       'Error']
+    for _, row in result.iterrows():
+        s = fin.investment_scenario(deal, dict(scenario, Rate=row['Rate'], Years=int(row['Years'])))
+        assert row['IRR After Tax'] == s['disposal']['IRR After Tax']
+        assert row['Minimum Debt Coverage Ratio'] == parallel.minimum_dscr(s)
+        assert row['Error'] is None
+
+
+def test_sweep_reports_failing_rows(deal, scenario):
+    result = parallel.sweep(deal, scenario, {'Amortization Period': [30, 0]}, processes=1)
+    assert np.isfinite(result.loc[0, 'IRR After Tax'])
+    assert np.isnan(result.loc[1, 'IRR After Tax'])
+    assert result['Error'].tolist()[0] is None
+    assert 'Number of Payments should be a positive number' in result['Error'].tolist()[1]
+
+
+def test_sweep_on_a_pool(deal, scenario):
+    table = parallel.grid(Rate=[0.04, 0.05, 0.06], Vacancy=[0.05, 0.1], **{'Amortization Period': [30, 0]})
+    serial = parallel.sweep(deal, scenario, table, processes=1)
+    pooled = parallel.sweep(deal, scenario, table, processes=2, chunk_size=3)
+    pd.testing.assert_frame_equal(serial, pooled)
+    assert pooled['Error'].notna().sum() == 6
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.portfolio as portfolio
+
+
+def test_single_property(deal, scenario):
+    projection = fin.investment_scenario(deal, scenario)
+    s = portfolio.consolidate([projection])
+    pd.testing.assert_frame_equal(s['is'], projection['is'], check_dtype=False, check_names=False)
+    assert s['disposal']['IRR After Tax'] == projection['disposal']['IRR After Tax']
+    assert s['disposal']['IRR Before Tax'] == projection['disposal']['IRR Before Tax']
+    assert s['disposal']['Number Of Years'] == scenario['Years']
+
+
+def test_staggered_acquisitions(deal, scenario):
+    first = fin.investment_scenario(deal, scenario)
+    second = fin.investment_scenario(deal, dict(scenario, Years=5))
+    s = portfolio.consolidate([first, second], acquisition_years=[2020, 2023])
+    assert s['is'].index.tolist() == list(range(2020, 2031))
+    # the second property is bought in 2023 and sold in 2028
+    np.testing.assert_allclose(s['cash flows after tax'][3], first['cash flows after tax'][3] +
+                               second['cash flows after tax'][0])
+    np.testing.assert_allclose(s['cash flows after tax'].sum(), first['cash flows after tax'].sum() +
+                               second['cash flows after tax'].sum())
+    assert s['disposal']['Number Of Properties'] == 2
+    assert s['disposal']['Total Equity Invested'] == round(2 * first['bs']['Equity'].values[0], 0)
+    assert np.isfinite(s['disposal']['IRR After Tax'])
+
+
+def test_acquisition_years_per_projection(deal, scenario):
+    projection = fin.investment_scenario(deal, scenario)
+    with pytest.raises(ValueError):
+        portfolio.consolidate([projection, projection], acquisition_years=[0])
+    with pytest.raises(ValueError):
+        portfolio.consolidate([])
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.financials as fin
+
+
+def test_refinance_events_from_sheet_keys():
+    events = fin.refinance_events({'Refinance Year': 5.0, 'Refinance Rate': 0.04, 'Refinance LTV': 0.7,
+                                   'Refinance Amortization Period': None})
+    assert events == [{'Year': 5, 'Rate': 0.04, 'Amortization Period': None, 'LTV': 0.7,
+                       'Closing Costs': None, 'IO Period': None}]
+    assert fin.refinance_events({'Refinance Year': None}) == []
+    events = fin.refinance_events({'Refinances': [{'Year': 7}, {'Year': 3}]})
+    assert [e['Year'] for e in events] == [3, 7]
+
+
+def test_schedule_without_refinance():
+    schedule = fin.loan_schedule(225000., 0.045, 30, years=10)
+    payments, interests, principals, balances = fin.annual_loan(225000., 0.045, 30)
+    np.testing.assert_array_equal(schedule['Debt Service'], payments)
+    np.testing.assert_array_equal(schedule['Total Debt'], balances)
+    assert not schedule['Refinance Proceeds'].any()
+
+
+def test_cash_out_refinance():
+    asset_values = 300000. * 1.03 ** np.arange(11)
+    refinance = {'Year': 5, 'LTV': 0.75, 'Rate': 0.04, 'Closing Costs': 3000.}
+    schedule = fin.loan_schedule(225000., 0.045, 30, years=10, refinances=[refinance], asset_values=asset_values)
+    balance = fin.annual_loan(225000., 0.045, 30)[3][4]
+    new_loan = round(0.75 * asset_values[5], 0)
+    assert schedule['Total Debt'][4] == new_loan
+    assert schedule['Refinance Proceeds'][4] == new_loan - balance - 3000.
+    assert schedule['Refinance Costs'][4] == 3000.
+    # the new loan amortizes over a new 30 year term at the new rate
+    np.testing.assert_array_equal(schedule['Debt Service'][5:10], fin.annual_loan(new_loan, 0.04, 30)[0][:5])
+
+
+def test_refinance_within_the_projection():
+    with pytest.raises(ValueError, match='before the sale year'):
+        fin.loan_schedule(225000., 0.045, 30, years=10, refinances=[{'Year': 10}])
+    with pytest.raises(ValueError, match='increasing'):
+        fin.loan_schedule(225000., 0.045, 30, years=10, refinances=[{'Year': 0}])
+    with pytest.raises(ValueError, match='Asset value'):
+        fin.loan_schedule(225000., 0.045, 30, years=10, refinances=[{'Year': 5, 'LTV': 0.7}])
+
+
+def test_refinance_proceeds_in_the_projection(deal, scenario):
+    base = fin.investment_scenario(deal, scenario)
+    refinanced = fin.investment_scenario(deal, dict(scenario, Refinances=[{'Year': 5, 'LTV': 0.75, 'Rate': 0.04,
+                                                                          'Closing Costs': 3000.}]))
+    proceeds = refinanced['bs']['Total Debt'].values[5] - base['bs']['Total Debt'].values[5] - 3000.
+    cash = refinanced['cash flows before tax'][5] - base['cash flows before tax'][5]
+    # the refinance closes at the end of year 5, which keeps the old debt service and gains the net proceeds
+    assert cash == pytest.approx(proceeds, abs=1.)
+    assert refinanced['disposal']['IRR After Tax'] > base['disposal']['IRR After Tax']
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.rentroll as rentroll
+
+
+def test_units_defaults():
+    u = rentroll.units([{'Rent': 1000., 'Months To Expiry': 4.4}, {'Rent': 1100., 'Market Rent': 1250.,
+                                                                   'Downtime': 20}])
+    assert u['Lease Term'] == 12
+    assert u['Market Rent'].tolist() == [1000., 1250.]
+    assert u['Months To Expiry'].tolist() == [4, 0]
+    assert u['Renewal Probability'].tolist() == [0.6, 0.6]
+    assert u['Downtime'].tolist() == [1., 12.]
+    with pytest.raises(ValueError):
+        rentroll.units([{'Market Rent': 1000.}])
+    with pytest.raises(ValueError):
+        rentroll.units([{'Rent': 1000., 'Lease Expiry': '2021-06-30'}])
+
+
+def test_lease_expiry_dates():
+    u = rentroll.units([{'Rent': 1000., 'Lease Expiry': '2021-06-30'}, {'Rent': 1000., 'Lease Expiry': '2019-01-01'}],
+                       acquisition_date='2020-12-31')
+    assert u['Months To Expiry'].tolist() == [6, 0]
+
+
+def test_renewed_lease_at_market_rent():
+    r = rentroll.project_rent_roll([{'Rent': 1000., 'Market Rent': 1200., 'Months To Expiry': 6}], 3,
+                                   rent_inflation=0.03, renewal_probability=1.)
+    np.testing.assert_allclose(r['Rents'], [6 * 1000. + 6 * 1200., 12 * 1200. * 1.03, 12 * 1200. * 1.03 ** 2])
+    np.testing.assert_array_equal(r['Turnovers'], [0, 0, 0])
+    np.testing.assert_array_equal(r['Occupancy'], [1, 1, 1])
+
+
+def test_turnovers():
+    r = rentroll.project_rent_roll(pd.DataFrame({'Rent': [1000., 2000.], 'Months To Expiry': [0, 24]}), 2,
+                                   renewal_probability=0.5, downtime=2, turnover_cost=400.)
+    # the first unit turns over at acquisition and a year later, half the time, vacant for two months
+    np.testing.assert_allclose(r['Unit Rents'][0], [11 * 1000., 11 * 1000.])
+    np.testing.assert_allclose(r['Unit Rents'][1], [24000., 24000.])
+    np.testing.assert_allclose(r['Turnovers'], [0.5, 0.5])
+    np.testing.assert_allclose(r['Turnover Costs'], [200., 200.])
+    np.testing.assert_allclose(r['Occupancy'], [1 - 1 / 24., 1 - 1 / 24.])
+
+
+def test_rent_roll_in_the_projection(deal, scenario):
+    rent_roll = pd.DataFrame({'Unit': ['A', 'B'], 'Rent': [1100., 1150.], 'Market Rent': [1200., 1200.],
+                              'Months To Expiry': [3, 9], 'Turnover Cost': [600., 600.]})
+    multi = dict(deal, **{'Number of Units': 2, 'Rent Roll': rent_roll})
+    s = fin.investment_scenario(multi, scenario)
+    expected = rentroll.project_rent_roll(rent_roll, scenario['Years'], scenario['Rent Inflation'])
+    np.testing.assert_array_equal(s['is']['Rents'].values[1:], np.round(expected['Rents']))
+    np.testing.assert_allclose(s['is']['Turnover Costs'].values[1:], expected['Turnover Costs'])
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.sensitivity as sensitivity
+
+BUMPS = {'Rent': 50., 'Rate': 0.0025, 'Price Appreciation': 0.0025, 'Rent Inflation': 0.0025, 'Vacancy': 0.01,
+         'Purchase Price': 5000., 'Purchase Costs': 1000., 'Loan': 0.01, 'Insurance': 100., 'Maintenance': 100.,
+         'Property Tax': 200., 'Income Tax': 0.02, 'Capital Gain Tax': 0.02, 'Selling Commissions': 0.005}
+
+
+def test_numeric_keys(scenario):
+    keys = sensitivity.numeric_keys(scenario)
+    assert 'Rate' in keys and 'Rent' in keys
+    assert 'Years' not in keys and 'Interests Only' not in keys and 'Scenario Name' not in keys
+
+
+def test_values_match_the_projection(deal, scenario):
+    s = sensitivity.sensitivities(deal, scenario, keys=['Rent'])
+    disposal = fin.investment_scenario(deal, scenario)['disposal']
+    assert round(s['values']['IRR After Tax'], 3) == disposal['IRR After Tax']
+    assert s['values']['Net Sales After Tax'] == pytest.approx(disposal['Net Sales After Tax'], abs=2.)
+
+
+@pytest.mark.parametrize('key, step', [('Rent', 1.), ('Rate', 1e-5), ('Price Appreciation', 1e-5), ('Vacancy', 1e-5)])
+def test_derivatives_match_central_differences(deal, scenario, key, step):
+    s = sensitivity.sensitivities(deal, scenario, keys=[key])
+    up = sensitivity.sensitivities(deal, dict(scenario, **{key: scenario[key] + step}), keys=[key])['values']
+    down = sensitivity.sensitivities(deal, dict(scenario, **{key: scenario[key] - step}), keys=[key])['values']
+    for metric in ('IRR After Tax', 'IRR Before Tax', 'Net Sales After Tax', 'Total Gain After Tax'):
+        difference = (up[metric] - down[metric]) / (2 * step)
+        assert s['disposal'].loc[metric, key] == pytest.approx(difference, rel=1e-4, abs=1e-9)
+
+
+def _irrs_unrounded(result):
+    disposal = dict(result['disposal'])
+    disposal['IRR After Tax'] = fin.irr(result['cash flows after tax'])
+    disposal['IRR Before Tax'] = fin.irr(result['cash flows before tax'])
+    return disposal
+
+
+@pytest.mark.parametrize('key', sorted(BUMPS))
+def test_sensitivities_match_bumped_projections(deal, scenario, key):
+    # the sensitivity lines are a separate, unrounded copy of the projection: check them against full runs
+    bump = BUMPS[key]
+    s = sensitivity.sensitivities(deal, scenario, keys=[key], bumps={key: bump})
+    up = fin.investment_scenario(deal, dict(scenario, **{key: scenario[key] + bump}))
+    down = fin.investment_scenario(deal, dict(scenario, **{key: scenario[key] - bump}))
+    up_disposal, down_disposal = _irrs_unrounded(up), _irrs_unrounded(down)
+    for metric in ('IRR After Tax', 'IRR Before Tax', 'Net Sales After Tax', 'Capital Gain', 'Total Taxes',
+                   'Total Gain Before Tax', 'Total Gain After Tax'):
+        change = (up_disposal[metric] - down_disposal[metric]) / 2
+        tolerance = 1e-5 if metric.startswith('IRR') else 2.
+        assert s['disposal'].loc[metric, key] == pytest.approx(change, rel=0.01, abs=tolerance), metric
+    for metric in sensitivity.RATIO_METRICS:
+        change = (up['ratios'][metric].values[1:] - down['ratios'][metric].values[1:]) / 2
+        np.testing.assert_allclose(s['ratios'][metric][key].values, change, rtol=0.01, atol=1e-4, err_msg=metric)
+
+
+def test_bumps_and_ratios(deal, scenario):
+    s = sensitivity.sensitivities(deal, scenario, keys=['Rate', 'Rent'], bumps={'Rate': 0.0025})
+    unit = sensitivity.sensitivities(deal, scenario, keys=['Rate'])
+    assert s['disposal'].loc['IRR After Tax', 'Rate'] == pytest.approx(
+        0.0025 * unit['disposal'].loc['IRR After Tax', 'Rate'])
+    coverage = s['ratios']['Debt Coverage Ratios']
+    assert coverage.index.tolist() == list(range(1, 11))
+    assert (coverage['Rate'] < 0).all() and (coverage['Rent'] > 0).all()
+
+
+def test_discrete_keys_have_no_sensitivity(deal, scenario):
+    with pytest.raises(ValueError):
+        sensitivity.sensitivities(deal, scenario, keys=['Years'])
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+
+import pytest
+
+import Realmly.analytics.sharding as sharding
+
+
+@pytest.fixture
+def queue(tmp_path):
+    # missing workbooks fail fast, their records still go through the queue
+    files = [str(tmp_path / 'deal_{0:02d}.xlsx'.format(i)) for i in range(5)]
+    queue_dir = str(tmp_path / 'queue')
+    sharding.create_queue(queue_dir, files, shard_size=2)
+    return queue_dir, files
+
+
+def test_create_queue(queue):
+    queue_dir, files = queue
+    assert sharding.read_manifest(queue_dir)['shards'] == 3
+    with open(os.path.join(queue_dir, 'shards', 'shard-00002.json')) as fh:
+        assert json.load(fh) == files[4:]
+    with pytest.raises(FileExistsError):
+        sharding.create_queue(queue_dir, files)
+    assert sharding.create_queue(queue_dir, files, shard_size=5, overwrite=True) == 1
+
+
+def test_leases(queue):
+    queue_dir, files = queue
+    assert sharding.claim(queue_dir, 0, 'a')
+    assert not sharding.claim(queue_dir, 0, 'b')
+    assert sharding.holds(queue_dir, 0, 'a') and not sharding.holds(queue_dir, 0, 'b')
+    assert sharding.status(queue_dir)['workers'] == ['a']
+
+    # a lease without heartbeat expires
+    lease = os.path.join(queue_dir, 'leases', 'shard-00000.lease')
+    os.utime(lease, (time.time() - 300, time.time() - 300))
+    assert sharding.status(queue_dir)['expired'] == 1
+    assert sharding.claim(queue_dir, 0, 'b')
+    assert sharding.holds(queue_dir, 0, 'b')
+    sharding.release(queue_dir, 0, 'a')
+    assert sharding.holds(queue_dir, 0, 'b')
+    sharding.release(queue_dir, 0, 'b')
+    assert sharding.status(queue_dir)['waiting'] == 3
+
+
+def test_work_and_merge(queue):
+    queue_dir, files = queue
+    assert sharding.work(queue_dir, 'a', wait=False) == 3
+    assert sharding.status(queue_dir)['done'] == 3
+    assert not sharding.claim(queue_dir, 0, 'b')
+    records = sharding.merge(queue_dir)
+    assert sorted(records) == files
+    assert all(r['status'] == 'failed' and r['worker'] == 'a' for r in records.values())
+
+
+def test_claimed_again_projects_what_is_missing(queue):
+    queue_dir, files = queue
+    partial = os.path.join(queue_dir, 'partial', 'shard-00000.jsonl')
+    with open(partial, 'w') as fh:
+        fh.write(json.dumps({'file': files[0], 'status': 'ok', 'scenarios': [], 'worker': 'dead'}) + '\n')
+        fh.write('{"file": "' + files[1])
+    assert sharding.merge(queue_dir, partial=True)[files[0]]['worker'] == 'dead'
+    assert sharding.claim(queue_dir, 0, 'b')
+    assert sharding.project_shard(queue_dir, 0, 'b')
+    records = sharding.merge(queue_dir)
+    assert records[files[0]]['worker'] == 'dead'
+    assert records[files[1]]['worker'] == 'b'
+    assert not os.path.exists(os.path.join(queue_dir, 'leases', 'shard-00000.lease'))
+
+
+def test_run_local_names_the_workers(queue):
+    queue_dir, files = queue
+    records = sharding.run_local(queue_dir, workers=2, heartbeat=0.1, name='node')
+    assert sorted(records) == files
+    assert set(r['worker'] for r in records.values()) <= {'node-0', 'node-1'}
+
+
+def test_heartbeat_below_the_lease_timeout(queue):
+    with pytest.raises(ValueError):
+        sharding.work(queue[0], heartbeat=10, lease_timeout=5)
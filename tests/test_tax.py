@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.tax as tax
+
+
+@pytest.mark.parametrize('life', sorted(tax.MACRS))
+def test_macrs_tables(life):
+    assert sum(tax.MACRS[life]) == pytest.approx(1., abs=1e-4)
+    schedule = tax.depreciation_schedule(100000., 20, method='MACRS {0:d}'.format(life), rounded=False)
+    assert schedule['Depreciations'][:life + 1].sum() == pytest.approx(100000. * sum(tax.MACRS[life]))
+    assert not schedule['Depreciations'][life + 1:].any()
+
+
+def test_straight_line():
+    schedule = tax.depreciation_schedule([275000., 55000.], 30, period=27.5)
+    depreciations = schedule['Depreciations']
+    assert depreciations.shape == (2, 30)
+    assert depreciations[0, 0] == 10000. and depreciations[1, 26] == 2000.
+    assert depreciations[0, 27] == 5000. and not depreciations[:, 28:].any()
+    np.testing.assert_allclose(schedule['Cumulative Depreciations'][:, -1], [275000., 55000.])
+    assert tax.default_period('Residential') == 27.5 and tax.default_period('Commercial') == 39
+    with pytest.raises(ValueError):
+        tax.depreciation_schedule(1000., 5, method='Declining Balance')
+
+
+def test_cost_segregation_with_bonus():
+    schedule = tax.depreciation_schedule(275000., 10, cost_segregation={5: 0.2, 15: 0.1}, bonus=0.6, rounded=False)
+    personal = schedule['Personal Property Depreciations']
+    first = 0.6 * 82500. + 0.4 * (55000. * 0.2 + 27500. * 0.05)
+    assert personal[0] == pytest.approx(first)
+    assert schedule['Depreciations'][0] == pytest.approx(first + 275000. * 0.7 / 27.5)
+    assert schedule['Cumulative Personal Property Depreciations'][5] == pytest.approx(
+        55000. + 0.6 * 27500. + 0.4 * 27500. * sum(tax.MACRS[15][:6]))
+    with pytest.raises(ValueError):
+        tax.depreciation_schedule(1000., 5, cost_segregation={5: 0.7, 7: 0.4})
+    with pytest.raises(ValueError):
+        tax.depreciation_schedule(1000., 5, cost_segregation={10: 0.2})
+
+
+def test_register_method():
+    tax.register_method('Expensed', lambda basis, years, period: np.asarray(basis, dtype=float)[..., np.newaxis] *
+                        (np.arange(years) == 0))
+    try:
+        assert tax.depreciation_schedule(5000., 3, method='Expensed')['Depreciations'].tolist() == [5000., 0., 0.]
+    finally:
+        del tax.DEPRECIATION_METHODS['Expensed']
+
+
+def test_loss_carryforward():
+    incomes = np.array([[-1000., 400., 800., -200., 500.], [100., 100., 100., 100., 100.]])
+    taxes, suspended = tax.income_taxes(incomes, 0.3, carryforward=True)
+    np.testing.assert_allclose(taxes[0], [0., 0., 60., 0., 90.])
+    np.testing.assert_allclose(suspended[0], [1000., 600., 0., 200., 0.])
+    np.testing.assert_allclose(taxes[1], 30.)
+    credits, none = tax.income_taxes(incomes, 0.3)
+    assert credits[0, 0] == -300. and not none.any()
+
+
+def test_sale_taxes_recapture():
+    # the MACRS buckets are recaptured first at the income tax rate, then the building
+    t = tax.sale_taxes(np.array([330000., 270000., 150000.]), 200000., 300000., 100000., 0.15, 0.35, 0.25,
+                       personal_property_depreciations=40000., suspended_losses=np.array([0., 0., 10000.]))
+    assert t['Long Term Gain'].tolist() == [30000., 0., 0.]
+    assert t['Personal Property Recapture'].tolist() == [40000., 40000., 0.]
+    assert t['Depreciation Recapture'].tolist() == [60000., 30000., 0.]
+    assert t['Short Term Gain'].tolist() == [0., 0., -50000.]
+    assert t['Total Taxes'].tolist() == [4500. + 14000. + 15000., 14000. + 7500., -17500. - 3500.]
+
+
+def test_scenario_options():
+    options = tax.scenario_options({'Depreciation Method': ' ', 'Cost Segregation 5 Year': 0.2,
+                                    'Loss Carryforward': 1, 'Bonus Depreciation': np.nan}, 'Commercial')
+    assert options['method'] == 'Straight Line' and options['period'] == 39.
+    assert options['cost_segregation'] == {5: 0.2, 7: 0., 15: 0.}
+    assert options['bonus'] == 0. and options['carryforward'] is True
+
+
+def test_projection_taxes(deal, scenario):
+    base = fin.investment_scenario(deal, scenario)
+    segregated = dict(scenario, **{'Cost Segregation 5 Year': 0.2, 'Bonus Depreciation': 1.0})
+    s = fin.investment_scenario(deal, segregated)
+    assert s['is']['Depreciations'].values[1] > base['is']['Depreciations'].values[1]
+    assert s['disposal']['Personal Property Recapture'] > 0
+    assert s['disposal']['Total Taxes'] > base['disposal']['Total Taxes']
+
+    # the early losses are carried forward, not credited, and offset the incomes of the later years
+    carried = fin.investment_scenario(deal, dict(segregated, **{'Loss Carryforward': True}))
+    assert carried['disposal']['IRR After Tax'] < s['disposal']['IRR After Tax']
+    assert carried['cash flows after tax'][1] < s['cash flows after tax'][1]
+    assert carried['cash flows after tax'][9] > s['cash flows after tax'][9]
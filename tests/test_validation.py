@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+import Realmly.analytics.validation as validation
+
+
+def _frame(scenario, rows):
+    return pd.DataFrame([dict(scenario, **row) for row in rows])
+
+
+def test_valid_scenario_is_normalized(scenario):
+    result = validation.validate([dict(scenario, Years=10.0)])
+    assert result['valid'].tolist() == [True]
+    assert result['messages'] == [None]
+    assert result['scenarios'][0]['Years'] == 10 and isinstance(result['scenarios'][0]['Years'], int)
+    assert result['scenarios'][0]['Scenario Name'] == 'Base'
+
+
+def test_errors_per_row(scenario):
+    result = validation.validate([scenario, dict(scenario, Loan=1.5, Years=2.5), dict(scenario, Rent=None)])
+    assert result['valid'].tolist() == [True, False, False]
+    errors = result['errors']
+    assert errors.loc[errors['Row'] == 1, 'Key'].tolist() == ['Loan', 'Years']
+    assert result['messages'][1] == 'Loan should be between 0 and 1; Years should be an integer'
+    assert result['messages'][2] == 'Rent is missing'
+    # invalid values are kept as given
+    assert result['scenarios'][1]['Years'] == 2.5
+
+
+def test_string_dtype_frame(scenario):
+    # pandas 3 reads strings as the str dtype, not object
+    frame = _frame(scenario, [{'Interests Only': 'yes', 'IO Period': 3, 'Years': '12'},
+                              {'Interests Only': 'no', 'Years': ' '},
+                              {'Interests Only': 'maybe', 'Years': 'ten'}])
+    frame['Interests Only'] = frame['Interests Only'].astype('string')
+    frame['Years'] = frame['Years'].astype('string')
+    result = validation.validate(frame)
+    scenarios = result['scenarios']
+    assert scenarios[0]['Interests Only'] is True and scenarios[0]['Years'] == 12
+    assert scenarios[1]['Interests Only'] is False and scenarios[1]['Years'] is None
+    assert result['valid'].tolist() == [True, False, False]
+    assert result['messages'][1] == 'Years is missing'
+    assert result['messages'][2] == 'Years should be an integer; Interests Only should be True or False'
+    assert scenarios[2]['Interests Only'] == 'maybe'
+
+
+def test_string_dtype_blank_text(scenario):
+    frame = _frame(scenario, [{'Depreciation Method': ''}, {'Depreciation Method': 'Straight Line'},
+                              {'Depreciation Method': 'Sideways'}])
+    frame['Depreciation Method'] = frame['Depreciation Method'].astype('string')
+    result = validation.validate(frame)
+    assert [s['Depreciation Method'] for s in result['scenarios']] == [None, 'Straight Line', 'Sideways']
+    assert result['valid'].tolist() == [True, True, False]
+    assert result['messages'][2] == 'Unknown Depreciation Method'
+
+
+def test_cross_field_rules(scenario):
+    result = validation.validate([dict(scenario, **{'Interests Only': True, 'IO Period': 30}),
+                                  dict(scenario, **{'Cost Segregation 5 Year': 0.6, 'Cost Segregation 7 Year': 0.6})])
+    assert not result['valid'].any()
+    assert result['errors']['Key'].tolist() == ['Interests Only', 'Cost Segregation 5 Year']
+
+
+def test_missing_flag_is_false(scenario):
+    del scenario['Interests Only']
+    result = validation.validate(pd.DataFrame([scenario]))
+    assert result['valid'].tolist() == [True]
+    assert result['errors'].empty
+    assert result['scenarios'][0]['Rate'] == scenario['Rate']
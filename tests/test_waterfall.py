@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import Realmly.analytics.financials as fin
+import Realmly.analytics.waterfall as waterfall
+
+STRUCTURE = {'LP Share': 0.9, 'Preferred Return': 0.08, 'Catch Up': 1.0, 'Carry': 0.2}
+
+
+def test_tiers():
+    structure = dict(STRUCTURE, Hurdles=[(0.15, 0.4), (0.12, 0.3)])
+    assert waterfall.tiers(structure) == [('Preferred Return', 0.08, pytest.approx(0.1)), ('Catch Up', None, 1.0),
+                                          ('Hurdle 0.12', 0.12, 0.2), ('Hurdle 0.15', 0.15, 0.3),
+                                          ('Residual', None, 0.4)]
+    with pytest.raises(ValueError):
+        waterfall.tiers(dict(STRUCTURE, **{'LP Share': 0}))
+    with pytest.raises(ValueError):
+        waterfall.tiers(dict(STRUCTURE, Hurdles=[(0.05, 0.3)]))
+    with pytest.raises(ValueError):
+        waterfall.tiers(dict(STRUCTURE, **{'Catch Up': 0.1}))
+
+
+def test_below_the_preferred_return_is_pro_rata():
+    w = waterfall.distribute([-100., 3., 105.], STRUCTURE)
+    np.testing.assert_allclose(w['LP Cash Flows'], [-90., 2.7, 94.5])
+    assert w['GP Promote'] == pytest.approx(0.)
+    assert w['LP IRR'] == pytest.approx(w['GP IRR'])
+
+
+def test_full_catch_up():
+    flows = np.array([-100., 0., 0., 150.])
+    w = waterfall.distribute(flows, STRUCTURE)
+    np.testing.assert_allclose(w['LP Cash Flows'] + w['GP Cash Flows'], flows)
+    preferred = 90. * 1.08 ** 3 / 0.9
+    tiers = w['Tier Distributions']
+    assert tiers['Preferred Return'][3] == pytest.approx(preferred)
+    assert w['LP IRR'] == pytest.approx(fin.irr(w['LP Cash Flows']))
+    # caught up, the GP profits, its co-investment included, are the carry of all the profits
+    profits = flows.sum()
+    assert w['GP Cash Flows'].sum() == pytest.approx(0.2 * profits)
+    assert w['GP Promote'] == pytest.approx(10. + 0.2 * profits - 0.1 * 150.)
+    assert w['LP IRR'] > 0.08 and w['GP IRR'] > w['LP IRR']
+
+
+def test_rows_of_any_shape():
+    flows = np.zeros((2, 3, 4))
+    flows[..., 0] = -100.
+    flows[..., 3] = np.linspace(100., 200., 6).reshape(2, 3)
+    w = waterfall.distribute(flows, dict(STRUCTURE, Hurdles=[(0.12, 0.3)]))
+    assert w['LP IRR'].shape == (2, 3) and w['LP Cash Flows'].shape == flows.shape
+    single = waterfall.distribute(flows[1, 2], dict(STRUCTURE, Hurdles=[(0.12, 0.3)]))
+    assert w['LP IRR'][1, 2] == pytest.approx(single['LP IRR'])
+    assert np.isnan(w['LP IRR'][0, 0]) or w['LP IRR'][0, 0] == pytest.approx(0.)
+    assert np.all(np.diff(w['GP Promote'].ravel()) >= 0)
+
+
+def test_waterfall_of_a_projection(deal, scenario):
+    results = [fin.investment_scenario(deal, scenario), fin.investment_scenario(deal, dict(scenario, Years=5))]
+    w = waterfall.waterfall(results[0], STRUCTURE, after_tax=True)
+    table = w['distributions']
+    np.testing.assert_allclose(table['LP'] + table['GP'], table['Cash Flows'])
+    assert w['summary']['LP IRR'] < results[0]['disposal']['IRR After Tax'] + 0.0005
+    flows = waterfall.stack(results)
+    assert flows.shape == (2, 11) and not flows[1, 6:].any()
+    assert waterfall.distribute(flows, STRUCTURE)['LP IRR'].shape == (2,)
@@ -3,7 +3,14 @@ import pandas as pd
 
 
 def get_output_directory():
-    return '{0:s}/Data/Realmly'.format(os.environ['HOME'])
+    """
+    default location for projection outputs and project workbooks
+    :return: $REALMLY_OUTPUT_DIRECTORY if set, otherwise $HOME/Data/Realmly
+    """
+    output_directory = os.environ.get('REALMLY_OUTPUT_DIRECTORY')
+    if output_directory:
+        return output_directory
+    return os.path.join(os.path.expanduser('~'), 'Data', 'Realmly')
 
 
 def get_value_by_key(df,key=None, key_col=None, val_col=None):